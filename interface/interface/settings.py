@@ -60,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'mapping.propagation.PropagationMiddleware',
 ]
 
 ROOT_URLCONF = 'interface.urls'
@@ -156,3 +157,84 @@ MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "media/"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Publication import
+# the number of DOIs that are fetched from CrossRef concurrently, 1 fetches them one by one
+DOI_RESOLUTION_WORKERS = 8
+
+# responses of dx.doi.org are kept on disk, so a DOI is downloaded only once
+# https://docs.djangoproject.com/en/4.2/topics/cache/#filesystem-caching
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'crossref': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'crossref',
+        'TIMEOUT': 60 * 60 * 24 * 90,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+# not found or unresolved DOIs are asked again after this many seconds
+CROSSREF_NEGATIVE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# when True, only the cached responses are used (e.g. for offline test runs)
+CROSSREF_OFFLINE = False
+# the json record of a DOI is fetched only if the xml record lacks one of these fields ("abstract", "keywords"),
+# unixsd records carry no subjects, so adding "keywords" fetches the json record of every DOI
+CROSSREF_JSON_FIELDS = ["abstract"]
+
+# outbound HTTP requests (CrossRef, query platforms and full texts) share one pooled client
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 30
+# 5xx answers and failed connections are retried, waiting HTTP_BACKOFF_FACTOR * 2 ^ (retry - 1) seconds in between,
+# refused requests (429) are retried as often by the rate limiter only, after the Retry-After of the host or the
+# same backoff (at most HTTP_RATE_LIMIT_MAX_WAIT seconds), see HTTP_RATE_LIMIT
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+# kept-alive connections per host, should not be lower than DOI_RESOLUTION_WORKERS
+HTTP_POOL_SIZE = 10
+# requests per second to a host which announces no limit, the rate announced by X-Rate-Limit-* headers is followed
+# and it is halved after each 429 answer
+HTTP_RATE_LIMIT = 10
+# the highest rates of single hosts, e.g. {"dx.doi.org": 50}, the query platforms have their own rate_limit
+HTTP_RATE_LIMITS = {}
+# the rate limits are shared by all processes (the server and the import workers) through the files of this folder
+HTTP_RATE_LIMIT_DIR = BASE_DIR / 'cache' / 'rate_limits'
+# a request fails (RateLimitExceeded) instead of waiting longer than this many seconds, e.g. for a spent quota
+HTTP_RATE_LIMIT_MAX_WAIT = 60
+
+# imports are queued and processed by `python manage.py run_import_jobs`,
+# when False they are processed within the request (e.g. for development without a worker)
+IMPORT_JOBS_IN_BACKGROUND = True
+# DOIs which are resolved and added to the list together, the progress is saved after each chunk
+IMPORT_JOB_CHUNK_SIZE = 50
+# running jobs without progress for this many seconds are put back to the queue
+IMPORT_JOB_STALE_TIMEOUT = 60 * 15
+# BibTeX entries which are imported by one job, an upload is read and queued batch by batch
+BIBTEX_IMPORT_BATCH_SIZE = 1000
+# "entries": publications are built from the BibTeX fields, "doi": the DOIs of the entries are resolved at CrossRef
+BIBTEX_IMPORT_MODE = "entries"
+# CrossRef is asked only for entries with a DOI which lack one of these fields ("abstract", "authors", "keywords", ...)
+BIBTEX_CROSSREF_FIELDS = []
+
+# the results of a search on a query platform are kept and reused for this many seconds
+WEB_SEARCH_CACHE_TIMEOUT = 60 * 60 * 24
+# hits shown on one page of the web search, the platforms are asked for the results page by page
+WEB_SEARCH_PAGE_SIZE = 25
+# when True, the next page of results is fetched in the background while the current one is shown
+WEB_SEARCH_PREFETCH = True
+# the selected web results are imported from the data of the platforms, CrossRef is asked only for those which lack
+# one of these fields, or which cannot be stored as they are
+WEB_IMPORT_CROSSREF_FIELDS = ["abstract"]
+
+# when True, the time of each recomputed automated list is printed after each request or import job
+PROPAGATION_REPORT = False
+
+# compiled filters of the publication lists kept by each process
+CRITERIA_PLAN_CACHE_SIZE = 256
+
+# the overlaps of the publication lists of a mapping are cached, and counted again after their publications change
+MAPPING_OVERLAP_CACHE_TIMEOUT = 60 * 60
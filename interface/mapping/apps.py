@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MappingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mapping'
+
+    def ready(self):
+        # from local app
+        from .signals import connect
+        connect()
@@ -1,139 +1,268 @@
-from django.db.models import Q
+import re
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any
+
+from django.conf import settings
+from django.core.exceptions import FieldError, ValidationError
+from django.db.models import Exists, OuterRef, Q
 from .models import Mapping, ReviewField, PublicationList
 from publication.models import Publication
 
-def create_parser(text: str) -> list:
+
+class CriteriaError(BufferError):
 	"""
-	This method converts the text of filter to a list of conditions, testing examples:
-	test_cases = [
-		"(((x=y)))",
-		"not (x=y)",
-		"( not ( not (xaaa=y) and (y=z)))",
-		"(x=y) and (a=b) or (c=z)",
-		"(x=y) and ((b=c) or (d=z)) or ((x=y) or ( not (a== w )))",
-	]
-	:param text: the filter text
-	:return: array of conditions, the priority is with the item that appears first
+		A syntax error of a filter, `position` is the index of the character where it was found.
+	"""
+
+	def __init__(self, message: str, position: int) -> None:
+		super().__init__(f"{message} at character {position + 1}")
+		self.message = message
+		self.position = position
+
+
+@dataclass(frozen=True)
+class Condition:
+	key: str  # a field of the publication or the name of a review field, with an optional lookup, e.g. "year__gte"
+	value: str
+	position: int
+
+
+@dataclass(frozen=True)
+class Not:
+	operand: Any
+	position: int
+
+
+@dataclass(frozen=True)
+class Operation:
+	operator: str  # "and" or "or"
+	left: Any
+	right: Any
+	position: int
+
+
+@dataclass(frozen=True)
+class Token:
+	kind: str  # "(", ")", "and", "or", "not" or "condition"
+	position: int
+	condition: Condition | None = None
+
+
+OPERATOR = re.compile(r'(and|or|not)(?=[\s(]|$)', re.IGNORECASE)
+CONDITION = re.compile(r'([A-Za-z_]\w*)\s*==?\s*')
+# a value ends with a closing parenthesis or a following "and" / "or"
+VALUE_END = re.compile(r'\)|\s+(?:and|or)(?=[\s(]|$)', re.IGNORECASE)
+
+
+def tokenize(text: str) -> list[Token]:
 	"""
+	:param text: e.g. "(year__gte=2020) and not (relevant=True)"
+	:raises CriteriaError:
+	"""
+	tokens = []
 	index = 0
-	stack = [[]]
 	while index < len(text):
 		c = text[index]
+		if c.isspace():
+			index += 1
+		elif c in "()":
+			tokens.append(Token(c, index))
+			index += 1
+		elif match := OPERATOR.match(text, index):
+			tokens.append(Token(match.group(1).lower(), index))
+			index = match.end()
+		elif match := CONDITION.match(text, index):
+			end = VALUE_END.search(text, match.end())
+			value_end = end.start() if end else len(text)
+			value = text[match.end():value_end].strip()
+			tokens.append(Token("condition", index, Condition(match.group(1), value, index)))
+			index = value_end
+		else:
+			raise CriteriaError(f"expected a condition such as (year=2020) instead of \"{text[index:index + 10]}\"", index)
+	return tokens
 
-		if c == '(':
-			stack.append ([])
-			index = index + 1
 
-		elif c == ')':
-			if len(stack) < 2:
-				raise BufferError
+class Parser:
+	"""
+		Builds the syntax tree of the tokens. The operators have no priorities, they are applied from the left to the
+		right (e.g. "(a=1) or (b=2) and (c=3)" is "((a=1) or (b=2)) and (c=3)"), a "not" applies to what follows it.
+	"""
 
-			item = stack.pop()
-			if '=' in item:
-				item = {''.join(item[:item.index('=')]): ''.join(item[item.index('=')+1:]).replace("=", "")}
-			stack[-1].append(item)
-			index = index + 1
+	def __init__(self, text: str) -> None:
+		self.text = text
+		self.tokens = tokenize(text)
+		self.index = 0
 
-		elif text[index:index + 5].lower() in [' not ', ' and ']:
-			stack[-1].append(text[index+1:index+4])
-			index = index + 5
+	def peek(self) -> Token | None:
+		return self.tokens[self.index] if self.index < len(self.tokens) else None
 
-		elif text[index:index + 4].lower() == ' or ':
-			stack[-1].append('or')
-			index = index + 4
+	def next(self, expected: str) -> Token:
+		token = self.peek()
+		if token is None:
+			raise CriteriaError(f"expected {expected} after the end of the filter", len(self.text))
+		self.index += 1
+		return token
 
-		elif text[index:index + 4].lower() == 'not ':
-			stack[-1].append('not')
-			index = index + 4
+	def parse(self) -> Any:
+		if not self.tokens:
+			return None
+		tree = self.expression()
+		token = self.peek()
+		if token is not None:
+			raise CriteriaError(f"unexpected \"{token.kind}\"", token.position)
+		return tree
 
-		else:
-			stack[-1].append(c)
-			index = index + 1
+	def expression(self) -> Any:
+		tree = self.unary()
+		while (token := self.peek()) is not None and token.kind in ["and", "or"]:
+			self.index += 1
+			tree = Operation(token.kind, tree, self.unary(), token.position)
+		return tree
 
-	if len(stack) > 1:
-		raise BufferError
+	def unary(self) -> Any:
+		token = self.next("a condition")
+		if token.kind == "not":
+			return Not(self.unary(), token.position)
+		if token.kind == "condition":
+			return token.condition
+		if token.kind == "(":
+			tree = self.expression()
+			closing = self.next("\")\"")
+			if closing.kind != ")":
+				raise CriteriaError(f"expected \")\" instead of \"{closing.kind}\"", closing.position)
+			return tree
+		raise CriteriaError(f"expected a condition instead of \"{token.kind}\"", token.position)
 
-	return stack[0]
 
+@lru_cache(maxsize=1024)
+def parse_criteria(text: str) -> Any:
+	"""
+	:param text: the filter text
+	:return: the syntax tree (`Condition`, `Not` and `Operation`), None for an empty filter
+	:raises CriteriaError: with the position of the syntax error
+	"""
+	return Parser(text).parse()
 
-def create_user_q(mapping: Mapping, publication_list: PublicationList,  key: str, value: Any) -> Q | None:
-	try:
-		mapping_fields = ReviewField.objects.filter(mapping=mapping)
-		key_spliter = key.split('__')
 
-		if len(key_spliter) == 1:
-			filtered = ""  # default filter
-		else:
-			filtered = "__" + key_spliter[1]  # default filter
-		field_name = key_spliter[0]
+def create_user_q(mapping: Mapping, publication_list: PublicationList,  key: str, value: Any,
+		review_fields: dict | None = None) -> Q | None:
+	"""
+	Compiles a condition on a review field to a correlated subquery, e.g. "relevant=True" to
+	EXISTS(SELECT 1 FROM mapping_reviewfieldvalueboolean WHERE review_field_id = ... AND publication_id = publication.id
+	AND value), so the filter runs as a single query of the list.
+	:param key: the name of the review field, with an optional lookup, e.g. "score__gte"
+	:param review_fields: the review fields of the mapping by their names, they are loaded if not given
+	:return: None if there is no such review field, or the value does not fit it
+	"""
+	if review_fields is None:
+		review_fields = {field.name: field for field in ReviewField.objects.filter(mapping=mapping)}
 
-		target_field = mapping_fields.get(name=field_name)
-		query = Q(**{f"value{filtered}": value})
+	key_spliter = key.split('__')
+	if len(key_spliter) == 1:
+		filtered = ""  # default filter
+	else:
+		filtered = "__" + key_spliter[1]  # default filter
+	field_name = key_spliter[0]
 
-		target_objects = target_field.get_value_class().objects.all()
-		publications = publication_list.publications.filter(id__in=[t.publication.id for t in target_objects.filter(query)])
+	target_field = review_fields.get(field_name)
+	if target_field is None:
+		return None
 
-		return Q(id__in=[p.id for p in publications])
-	except:
+	try:
+		values = target_field.get_value_class().objects\
+			.filter(review_field=target_field, publication=OuterRef("pk"))\
+			.filter(**{f"value{filtered}": value})
+	except (FieldError, NotImplementedError, TypeError, ValueError, ValidationError):
 		return None
 
-def create_advanced_query(mapping: Mapping, publication_list: PublicationList, text: str) -> Q:
-	"""
-	Converts the string filter to django.db.Q model
-	:param text: filter text
-	:return: Q model
-	"""
+	return Q(Exists(values))
 
-	def creat_q_item(tokens: list) -> Q:
-		if len(tokens) == 0:
-			return Q()
+PUBLICATION_FIELDS = [f.name for f in Publication._meta.fields]
 
-		def manage_stack(_stack: list, _token: Any) -> list:
-			if len(_stack) > 0:
-				operator = _stack.pop()
 
-				if operator == "and":
-					_stack.append(_stack.pop() & _token)
+def compile_tree(tree: Any, mapping: Mapping, review_fields: dict) -> Q:
+	if tree is None:
+		return Q()
+	if isinstance(tree, Not):
+		return ~compile_tree(tree.operand, mapping, review_fields)
+	if isinstance(tree, Operation):
+		left = compile_tree(tree.left, mapping, review_fields)
+		right = compile_tree(tree.right, mapping, review_fields)
+		return left & right if tree.operator == "and" else left | right
 
-				elif operator == "or":
-					_stack.append(_stack.pop() | _token)
+	user_q = None
+	if tree.key not in PUBLICATION_FIELDS:
+		user_q = create_user_q(mapping, None, tree.key, tree.value, review_fields)
+	return user_q if user_q else Q(**{tree.key: tree.value})
 
-				elif operator == "not":
-					_stack.append(~_token)
-				else:
-					raise BufferError
-			else:
-				_stack.append(_token)
 
-			return _stack
+@lru_cache(maxsize=getattr(settings, "CRITERIA_PLAN_CACHE_SIZE", 256))
+def compile_criteria(mapping: Mapping, review_fields_version: int, text: str) -> Q:
+	"""
+	The compiled filters are kept for the version of the review fields of the mapping, so paging and sorting a
+	filtered list neither parses nor compiles the filter again. The returned Q is shared, it must not be changed.
+	"""
+	review_fields = {field.name: field for field in ReviewField.objects.filter(mapping=mapping)}
+	return compile_tree(parse_criteria(text), mapping, review_fields)
 
-		stack = []
-		for token in tokens:
-			if isinstance(token, dict):
-				user_q = None
-				for key, value in token.items():
-					if key in [f.name for f in Publication._meta.fields]:
-						break
-					user_q = create_user_q(mapping, publication_list, key, value)
 
-				if user_q:
-					token = user_q
-				else:
-					token = Q(**token)
+@dataclass
+class FilterExplanation:
+	"""
+		What a filter costs: its SQL, the query plan of the database and the seconds of each phase ("parse", "plan",
+		"execute", "count" and "page fetch").
+	"""
+	text: str
+	sql: str = ""
+	plan: str = ""
+	# the rows which the database expects, if its plan tells them (e.g. PostgreSQL, MySQL, not SQLite)
+	estimated_rows: int | None = None
+	rows: int | None = None
+	timings: dict = field(default_factory=dict)
 
-				stack = manage_stack(stack, token)
+	def measure(self, phase: str, function, *args):
+		started = time.perf_counter()
+		result = function(*args)
+		self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
+		return result
 
-			elif isinstance(token, list):
-				stack = manage_stack(stack, creat_q_item(token))
+	def analyze(self, publications, page_size: int, page_number: int = 1) -> None:
+		"""
+		Explains and runs the filtered (and ordered) publications of a list.
+		:param publications: the queryset which is paged
+		"""
+		self.sql = str(publications.query)
+		try:
+			self.plan = publications.explain()
+		except Exception as e:
+			self.plan = f"the database cannot explain the query: {e}"
+		estimate = re.search(r'\brows=(\d+)', self.plan)
+		self.estimated_rows = int(estimate.group(1)) if estimate else None
 
-			else:
-				stack.append(token)
+		self.measure("execute", lambda: list(publications.values_list("id", flat=True)))
+		self.rows = self.measure("count", publications.count)
+		start = max(page_number - 1, 0) * page_size
+		self.measure("page fetch", lambda: list(publications[start:start + page_size]))
 
-		if len(stack) != 1:
-			raise BufferError
 
-		return stack[0]
+def create_advanced_query(mapping: Mapping, publication_list: PublicationList, text: str, explain: bool = False) \
+		-> Q | tuple[Q, FilterExplanation]:
+	"""
+	Converts the string filter to django.db.Q model, e.g. "(year__gte=2020) and not (relevant=True)"
+	:param text: filter text
+	:param explain: the filter is parsed and compiled without the cache, and returned with a `FilterExplanation`
+		of the time of both phases, see `FilterExplanation.analyze` for the rest
+	:return: Q model
+	:raises CriteriaError: (a BufferError) with the position of a syntax error
+	"""
+	if not explain:
+		return compile_criteria(mapping, mapping.review_fields_version, text)
 
-	tokens = create_parser(text)
-	return creat_q_item(tokens)
+	explanation = FilterExplanation(text)
+	tree = explanation.measure("parse", lambda: Parser(text).parse())
+	query = explanation.measure("plan", lambda: compile_tree(tree, mapping, {
+		review_field.name: review_field for review_field in ReviewField.objects.filter(mapping=mapping)
+	}))
+	return query, explanation
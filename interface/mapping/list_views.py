@@ -4,8 +4,9 @@ import os
 import re
 from typing import Any
 
-import requests
+from django.core.cache import cache
 from django.core.exceptions import FieldError
+from django.db.models import Count
 from django.core.files.storage import FileSystemStorage
 from django.http import HttpResponse
 from django.views.generic import TemplateView, View, CreateView, UpdateView, DeleteView
@@ -18,10 +19,11 @@ from pypdf.errors import PdfReadError
 
 # local packages
 from .models import Mapping, PublicationList, UserPreferences, ReviewField, ReviewFieldValue, ReviewFieldValueCoding
-from .criteria import create_advanced_query
+from .criteria import CriteriaError, create_advanced_query
 from .field_views import FieldReviewView
 
 # from external packages
+from publication.http_client import get_http_client
 from publication.models import FullText, FullTextAccess, Publication
 
 from django.conf import settings
@@ -29,15 +31,62 @@ from django.conf import settings
 
 def copy_publication_lists(request: Any, authorized_mappings: Any, publication_list: Any) -> None:
     if request.POST.__contains__("copy_from"):
-        copy_from = [int(x) for x in request.POST.get_list("copy_from")]
+        copy_from = [int(x) for x in request.POST.getlist("copy_from")]
         authorized_publication_lists = PublicationList.objects.filter(mapping__in=authorized_mappings)
         clones = authorized_publication_lists.filter(id__in=copy_from)
-        for clone in clones:
-            for publication in clone.publications:
-                if publication not in publication_list.publications.all():
-                    publication_list.publications.add(publication)
-
-        publication_list.save()
+        publication_list.add_publications(
+            Publication.objects.filter(publicationlist__in=clones).values_list("id", flat=True)
+        )
+
+
+def selected_publication_ids(request: Any) -> list[int]:
+    """
+    The page posts the selected publications as one comma separated field, so selecting a long list does not hit
+    DATA_UPLOAD_MAX_NUMBER_FIELDS. A page without the script posts each checkbox as a field of its own.
+    :return: ids of the selected publications
+    """
+    if request.POST.get("selected_publication_ids"):
+        return [int(x) for x in request.POST["selected_publication_ids"].split(",") if x.strip()]
+    return [int(x) for x in request.POST.getlist("selected_publications")]
+
+
+def compact_results(shared: int, total: int) -> dict:
+    return {
+        'shared': shared,
+        'shared_rate': f"{100 * shared / total:0.2f}%" if total > 0 else "",
+        'total': total,
+    }
+
+
+def publication_list_overlaps(mapping: Mapping) -> dict:
+    """
+    Counts the publications which each two lists of the mapping share, by one grouped query over the memberships.
+    The counts are cached until the publications of a list of the mapping change (`Mapping.lists_version`).
+    :return: list id -> other list id -> shared publications, the size of a list is its overlap with itself
+    """
+    key = f"mapping_overlaps_{mapping.id}_{mapping.lists_version}"
+    overlaps = cache.get(key)
+    if overlaps is None:
+        overlaps = {}
+        memberships = PublicationList.publications.through.objects\
+            .filter(publicationlist__mapping=mapping, publication__publicationlist__mapping=mapping)\
+            .values_list("publicationlist_id", "publication__publicationlist")\
+            .annotate(shared=Count("publication_id"))
+        for list_id, other_list_id, shared in memberships:
+            overlaps.setdefault(list_id, {})[other_list_id] = shared
+        cache.set(key, overlaps, getattr(settings, "MAPPING_OVERLAP_CACHE_TIMEOUT", 60 * 60))
+    return overlaps
+
+
+def shared_publications(publication_lists: Any, publications: Any) -> dict:
+    """
+    :return: list id -> the number of the publications (a queryset) which are in the list, by one grouped query
+    """
+    memberships = PublicationList.publications.through.objects\
+        .filter(publicationlist__in=publication_lists, publication__in=publications.values("id"))\
+        .values_list("publicationlist_id")\
+        .annotate(shared=Count("publication_id"))
+    return dict(memberships)
 
 
 class NewListView(LoginRequiredMixin, CreateView):
@@ -128,38 +177,33 @@ class MappingListView(LoginRequiredMixin, TemplateView):
                 follower_id = int(follower[0])
                 follower_instance = get_object_or_404(PublicationList, id=follower_id)
 
-        selected_publications = [int(x) for x in request.POST.getlist("selected_publications")]
+        selected_publications = selected_publication_ids(request)
         if selected_publications:
-            available_publications = current_publication_list.publications.filter(id__in=selected_publications)
+            available_publications = set(
+                current_publication_list.publications.filter(id__in=selected_publications).values_list("id", flat=True)
+            )
             if available_publications:
                 if copy_instance:
-                    for pub in available_publications:
-                        if pub not in copy_instance.publications.all():
-                            copy_instance.publications.add(pub)
-                            copy_instance.save()
-                        if move_instead_of_copy:
-                            current_publication_list.publications.remove(pub)
-                            current_publication_list.save()
+                    copy_instance.add_publications(available_publications)
+                    if move_instead_of_copy and copy_instance != current_publication_list:
+                        current_publication_list.remove_publications(available_publications)
                     return redirect("publication_list", mapping_id=mapping.id, list_id=copy_instance.id)
 
                 elif request.POST.__contains__("delete_from_current_list"):
-                    for pub in available_publications:
-                        current_publication_list.publications.remove(pub)
-                        current_publication_list.save()
+                    current_publication_list.remove_publications(available_publications)
 
         if request.POST.__contains__("import_from_publication_lists"):
             publication_lists = [int(x) for x in request.POST.getlist("selected_lists")]
             authorized_publication_lists = PublicationList.objects.filter(mapping__in=authorized_mapping)
             selected_publication_list_instances = authorized_publication_lists.filter(id__in=publication_lists)
 
-            for selected_publication_list_instance in selected_publication_list_instances:
-                for pub in selected_publication_list_instance.publications.all():
-                    if pub not in current_publication_list.publications.all():
-                        current_publication_list.publications.add(pub)
-                        current_publication_list.save()
+            current_publication_list.add_publications(
+                Publication.objects.filter(
+                    publicationlist__in=selected_publication_list_instances
+                ).values_list("id", flat=True)
+            )
 
         if request.POST.__contains__("export_as_csv"):
-            selected_publications = request.POST.getlist("selected_publications")
             user_fields = ReviewField.objects.filter(mapping=mapping)
             reviewers = mapping.reviewers.all()
             print (reviewers)
@@ -176,7 +220,7 @@ class MappingListView(LoginRequiredMixin, TemplateView):
                     data = [
                             str(selected_publication_object.id),
                             str(selected_publication_object.title.replace(',', ';')),
-                            str(selected_publication_object.doi),
+                            selected_publication_object.doi or "",
                             str(selected_publication_object.year),
                             str(selected_publication_object.venue.name.replace(',', ';')),
                             str(selected_publication_object.venue.publisher.replace(',', ';')),
@@ -203,7 +247,7 @@ class MappingListView(LoginRequiredMixin, TemplateView):
 
         if subscriber_instance_end:
             current_publication_list.subscriptions.remove(subscriber_instance_end)
-            current_publication_list.save(auto_update=True)
+            current_publication_list.save()
             subscriber_instance_end.followers.remove(current_publication_list)
             subscriber_instance_end.save()
 
@@ -229,19 +273,16 @@ class MappingListView(LoginRequiredMixin, TemplateView):
         return self.get(request, *args, **kwargs)
 
     def compare(self, publication_list: PublicationList, publications: Any, filter_object: Any = None) -> {}:
-        found = [pub for pub in publications if pub in publication_list.publications.all()]
-        compact_results = {
-            'shared': len(found),
-            'shared_rate': f"{100 * len(found) / len(publications):0.2f}%" if len(publications) > 0 else "",
-            'total': len(publications),
-        }
+        listed = set(publication_list.publications.values_list("id", flat=True))
+        found = [pub for pub in publications if pub.id in listed]
+        compact = compact_results(len(found), len(publications))
         if not filter_object:
-            return compact_results
+            return compact
         else:
-            only_in_results = [pub for pub in publications if pub not in publication_list.publications.all()]
-            only_in_list = [pub for pub in publication_list.publications.all() if pub not in publications]
+            only_in_results = [pub for pub in publications if pub.id not in listed]
+            only_in_list = publication_list.publications.exclude(id__in=publications.values("id"))
             return {
-                **compact_results,
+                **compact,
                 "found": found,
                 "only_in_results": only_in_results,
                 "only_in_list": only_in_list,
@@ -275,12 +316,14 @@ class MappingListView(LoginRequiredMixin, TemplateView):
         filter_text = ""
         filter_errors = ""
         filtered_size = None
+        explanation = None
 
         compared = {}
         detailed_results = {}
+        overlaps = publication_list_overlaps(mapping).get(publication_list.id, {})
         overall_results = {
             'all': {
-                pub_list.id: self.compare(pub_list, publications)
+                pub_list.id: compact_results(overlaps.get(pub_list.id, 0), original_size)
                 for pub_list in available_publication_lists
             }
         }
@@ -289,12 +332,17 @@ class MappingListView(LoginRequiredMixin, TemplateView):
             filter_text = request.GET.get('filter_text')
             if filter_text != "":
                 try:
-                    filter_object = create_advanced_query(mapping, publication_list,filter_text)
+                    if request.GET.__contains__("explain"):
+                        filter_object, explanation = create_advanced_query(
+                            mapping, publication_list, filter_text, explain=True)
+                    else:
+                        filter_object = create_advanced_query(mapping, publication_list,filter_text)
                     publications = publications.filter(filter_object)
                     filter_errors = ""
                     filtered_size = len(publications)
+                    shared = shared_publications(available_publication_lists, publications)
                     overall_results['filtered'] = {
-                        pub_list.id: self.compare(pub_list, publications)
+                        pub_list.id: compact_results(shared.get(pub_list.id, 0), filtered_size)
                         for pub_list in available_publication_lists
                     }
                     if request.GET.__contains__("compare_to"):
@@ -309,9 +357,10 @@ class MappingListView(LoginRequiredMixin, TemplateView):
                 except FieldError as e:
                     filter_errors = str(e)
                     filter_text = None
+                    explanation = None
 
-                except BufferError:
-                    filter_errors = "please check syntax of the filter"
+                except CriteriaError as e:
+                    filter_errors = f"please check syntax of the filter: {e}"
                     filter_text = None
 
         if request.GET.__contains__("order_text"):
@@ -324,6 +373,8 @@ class MappingListView(LoginRequiredMixin, TemplateView):
         paginator = Paginator(publications, max(page_size, 25))
         page_number = request.GET.get("page")
         page_obj = paginator.get_page(page_number)
+        if explanation:
+            explanation.analyze(publications, paginator.per_page, page_obj.number)
 
         review_fields = ReviewField.objects.filter(mapping=mapping)
         coding_codes = {
@@ -368,12 +419,14 @@ class MappingListView(LoginRequiredMixin, TemplateView):
             "filtered_size": filtered_size,
             "filter_text": filter_text,
             "filter_errors": filter_errors,
+            "explanation": explanation,
             "order_text": order_text,
             "available_publication_lists": available_publication_lists,
             "publication_list": publication_list,
             "user_preference": user_preference,
             "available_page_sizes": [x for x in range(25, min(201, original_size + 1), 25)],
             "publication_full_texts": publication_full_texts,
+            "import_jobs": publication_list.import_jobs.filter(status__in=["P", "R"]).order_by("created_at"),
             "page_obj": page_obj,
             "user_errors": user_errors if user_errors else None,
         }
@@ -438,7 +491,7 @@ class GetAccessForListView(LoginRequiredMixin, View):
             if "get_full_text_access" in request.POST:
                 full_text = full_text_access.full_text
                 if full_text.url != "":
-                    resource_request = requests.get(full_text.url, headers={
+                    resource_request = get_http_client().get(full_text.url, headers={
                         "Accept": "text/html,application/xhtml+xml,application/pdf,application/xml;q=0.9,image/avif,image/webp",
                         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0"})
 
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0009_reviewfieldvalueboolean'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapping',
+            name='review_fields_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
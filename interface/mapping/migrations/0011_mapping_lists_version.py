@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0010_mapping_review_fields_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapping',
+            name='lists_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -16,6 +16,10 @@ class Mapping(models.Model):
     leader = models.ForeignKey(Reviewer, on_delete=models.PROTECT)
     reviewers = models.ManyToManyField(Reviewer, related_name="reviewer_users")
     secret_key = models.TextField(max_length=255)
+    # raised on each change of the review fields, the compiled filters of the older versions are not used
+    review_fields_version = models.PositiveIntegerField(default=0)
+    # raised on each change of the publications of its lists, the cached overlaps of the older versions are not used
+    lists_version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -36,32 +40,74 @@ class PublicationList(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, auto_update=False, force_insert=False, force_update=False, using=None, update_fields=None):
-        if self.id:
-            # from local app
-            from .criteria import create_advanced_query
-            # in case there was a change in my list as the origin
-            for follower in self.followers.all():
-                # query = create_advanced_query(self.mapping, self, follower.criteria)
-                # filtered_publications = self.publications.filter(query)
-                # if filtered_publications:
-                #     for pub in filtered_publications:
-                #         if pub not in follower.publications.all():
-                #             follower.publications.add(pub)
-                follower.save(auto_update=True)
-
-            # in case there was a change in my subscriptions, such as cancellation or add
-            if self.criteria != "" and auto_update:
-                self.publications.clear()
-                for subscription in self.subscriptions.all():
-                    query = create_advanced_query(self.mapping, subscription, self.criteria)
-                    filtered_publications = subscription.publications.filter(query)
-                    if filtered_publications:
-                        for pub in filtered_publications:
-                            if pub not in self.publications.all():
-                                self.publications.add(pub)
-                                self.save(auto_update=False)
-
+        """
+        The automated lists follow the changes of their subscriptions by themselves (see `mapping.signals`),
+        `auto_update` rebuilds this list from all its subscriptions, e.g. after its criteria were changed.
+        """
         super().save(force_insert, force_update, using, update_fields)
+        if auto_update and self.criteria != "":
+            self.rebuild_publications()
+
+    def matching_publications(self, publication_ids=None) -> set:
+        """
+        :param publication_ids: only these publications are evaluated, all of the subscriptions by default
+        :return: ids of the publications of the subscriptions which match the criteria of this list
+        """
+        # from local app
+        from .criteria import create_advanced_query
+
+        matching = set()
+        for subscription in self.subscriptions.all():
+            publications = subscription.publications.all()
+            if publication_ids is not None:
+                publications = publications.filter(id__in=publication_ids)
+            query = create_advanced_query(self.mapping, subscription, self.criteria)
+            matching.update(publications.filter(query).values_list("id", flat=True))
+        return matching
+
+    def update_publications(self, publication_ids) -> None:
+        """
+        Evaluates the criteria for the changed publications of the subscriptions only: the matching ones are
+        added, the others are removed. The followers of this list are updated by the same way in turn.
+        """
+        publication_ids = set(publication_ids)
+        if self.criteria == "" or not publication_ids:
+            return
+
+        matching = self.matching_publications(publication_ids)
+        # only the actual changes are written, so the updates stop also in a cycle of followers
+        unmatched = set(self.publications.filter(id__in=publication_ids - matching).values_list("id", flat=True))
+        if matching:
+            self.publications.add(*matching)
+        if unmatched:
+            self.publications.remove(*unmatched)
+
+    def rebuild_publications(self) -> None:
+        """
+        Evaluates the criteria for all publications of the subscriptions, only the differences are written.
+        """
+        self.publications.set(self.matching_publications())
+
+    def add_publications(self, publication_ids) -> None:
+        """
+        Adds the publications by a single insert (those already in the list are skipped), the followers are updated
+        with all of them at once.
+        :param publication_ids: ids of the publications, or a queryset of them
+        """
+        publication_ids = set(publication_ids)
+        if publication_ids:
+            self.publications.add(*publication_ids)
+            self.save()
+
+    def remove_publications(self, publication_ids) -> None:
+        """
+        Removes the publications by a single delete, the followers are updated with all of them at once.
+        :param publication_ids: ids of the publications, or a queryset of them
+        """
+        publication_ids = set(publication_ids)
+        if publication_ids:
+            self.publications.remove(*publication_ids)
+            self.save()
 
     def __str__(self):
         return f"{self.name} for {self.mapping}"
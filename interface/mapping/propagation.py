@@ -0,0 +1,276 @@
+"""
+    Propagation of the changed publications to the automated lists. The changes are collected during a request or an
+    import job (see `deferred_propagation`) and each affected list is recomputed once afterwards, in the order of the
+    follower graph: a list is recomputed after all lists which it follows. Outside of `deferred_propagation` the
+    changes are propagated at once.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from django.conf import settings
+from django.core.exceptions import FieldError
+from django.db import transaction
+
+
+@dataclass
+class Recompute:
+    publication_list_id: int
+    name: str
+    evaluated: int
+    seconds: float
+    error: str = ""
+
+
+@dataclass
+class PropagationReport:
+    recomputes: list[Recompute] = field(default_factory=list)
+    # the ids of the lists of each cycle of followers
+    cycles: list[list[int]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "recomputes": [recompute.__dict__ for recompute in self.recomputes],
+            "cycles": self.cycles,
+            "seconds": self.seconds,
+        }
+
+    def __str__(self):
+        lines = [f"propagation: {len(self.recomputes)} lists recomputed in {self.seconds:.3f}s"]
+        for recompute in self.recomputes:
+            lines.append(f"  {recompute.name} ({recompute.publication_list_id}): {recompute.evaluated} publications "
+                         f"evaluated in {recompute.seconds:.3f}s {recompute.error}".rstrip())
+        for cycle in self.cycles:
+            lines.append(f"  cycle of followers: {' -> '.join(str(list_id) for list_id in cycle)}")
+        return "\n".join(lines)
+
+
+def strongly_connected(nodes: list, edges: dict) -> list[list]:
+    """
+    Tarjan's algorithm, without recursion.
+    :param edges: node -> its successors
+    :return: the strongly connected components, in a topological order (a component before its successors)
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(edges.get(root, ())))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            successor = next(successors, None)
+            if successor is None:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+            elif successor not in index:
+                index[successor] = low[successor] = len(index)
+                stack.append(successor)
+                on_stack.add(successor)
+                work.append((successor, iter(edges.get(successor, ()))))
+            elif successor in on_stack:
+                low[node] = min(low[node], index[successor])
+
+    # Tarjan finds the components in a reversed topological order
+    return components[::-1]
+
+
+class PropagationScheduler:
+    """
+        The changes collected in a thread: the changed publications of each list (which its followers evaluate) and
+        the publications which a list evaluates itself (e.g. after a review value or its subscriptions changed).
+    """
+
+    def __init__(self) -> None:
+        self.changed: dict[int, set] = {}
+        self.evaluate: dict[int, set] = {}
+        self.depth = 0
+        self.flushing = False
+        self.reports: list[PropagationReport] = []
+
+    def publications_changed(self, publication_list_id: int, publication_ids: set) -> None:
+        self.changed.setdefault(publication_list_id, set()).update(publication_ids)
+        self.schedule()
+
+    def evaluate_publications(self, publication_list_id: int, publication_ids: set) -> None:
+        self.evaluate.setdefault(publication_list_id, set()).update(publication_ids)
+        self.schedule()
+
+    def schedule(self) -> None:
+        if self.depth == 0 and not self.flushing:
+            self.flush()
+
+    def follower_graph(self, roots: set) -> dict:
+        """
+        :return: list id -> ids of its automated followers, for all lists reachable from the roots
+        """
+        # from local app
+        from .models import PublicationList
+
+        through = PublicationList.followers.through
+        edges = {}
+        frontier = set(roots)
+        while frontier:
+            for list_id in frontier:
+                edges.setdefault(list_id, set())
+            pairs = through.objects.filter(from_publicationlist_id__in=frontier)\
+                .exclude(to_publicationlist__criteria="")\
+                .values_list("from_publicationlist_id", "to_publicationlist_id")
+            for list_id, follower_id in pairs:
+                edges[list_id].add(follower_id)
+            frontier = {follower_id for followers in edges.values() for follower_id in followers} - set(edges)
+        return edges
+
+    def recompute(self, publication_list, publication_ids: set, report: PropagationReport) -> None:
+        """
+        Recomputes a single list in a savepoint, so a failing list neither fails the request nor stops the flush.
+        The error is kept in the report.
+        """
+        # from local app
+        from .criteria import CriteriaError
+
+        started = time.perf_counter()
+        error = ""
+        try:
+            with transaction.atomic():
+                publication_list.update_publications(publication_ids)
+        except (CriteriaError, BufferError, FieldError) as e:
+            error = f"the criteria cannot be evaluated: {e!r}"
+        except Exception as e:
+            error = f"the list cannot be recomputed: {e!r}"
+        seconds = time.perf_counter() - started
+        report.recomputes.append(Recompute(
+            publication_list.id, publication_list.name, len(publication_ids), seconds, error))
+        if error:
+            print(f"the publication list {publication_list.name} ({publication_list.id}) failed after {seconds:.3f}s, "
+                  f"{error}")
+
+    def flush(self) -> PropagationReport:
+        """
+        Recomputes each list affected by the collected changes once, in the order of the follower graph. The lists
+        of a cycle are recomputed one after another, as long as they change each other (at most once per member).
+        """
+        # from local app
+        from .models import PublicationList
+
+        report = PropagationReport()
+        if not self.changed and not self.evaluate:
+            return report
+
+        started = time.perf_counter()
+        self.flushing = True
+        try:
+            edges = self.follower_graph(set(self.changed) | set(self.evaluate))
+            predecessors = {}
+            for list_id, followers in edges.items():
+                for follower_id in followers:
+                    predecessors.setdefault(follower_id, set()).add(list_id)
+
+            components = strongly_connected(sorted(edges), {list_id: sorted(edges[list_id]) for list_id in edges})
+            automated = {
+                publication_list.id: publication_list
+                for publication_list in PublicationList.objects.filter(id__in=edges).exclude(criteria="")
+                .select_related("mapping")
+            }
+
+            for component in components:
+                pending = {
+                    list_id: self.evaluate.pop(list_id, set()).union(
+                        *[self.changed.get(subscription_id, set()) for subscription_id in predecessors.get(list_id, ())]
+                    )
+                    for list_id in component
+                }
+                cyclic = len(component) > 1 or component[0] in edges[component[0]]
+                if cyclic:
+                    report.cycles.append(component)
+                    print(f"the publication lists {component} follow each other in a cycle")
+
+                # the lists of a cycle are recomputed again with the changes of the previous pass, at most once
+                # per member
+                for _ in range(len(component) if cyclic else 1):
+                    before = {list_id: set(self.changed.get(list_id, ())) for list_id in component}
+                    for list_id in component:
+                        if list_id in automated and pending[list_id]:
+                            self.recompute(automated[list_id], pending[list_id], report)
+                    new = {list_id: self.changed.get(list_id, set()) - before[list_id] for list_id in component}
+                    pending = {
+                        list_id: set().union(*[
+                            new[subscription_id] for subscription_id in predecessors.get(list_id, ())
+                            if subscription_id in new
+                        ])
+                        for list_id in component
+                    }
+                    if not any(pending.values()):
+                        break
+        finally:
+            self.changed = {}
+            self.evaluate = {}
+            self.flushing = False
+
+        report.seconds = time.perf_counter() - started
+        self.reports.append(report)
+        del self.reports[:-10]
+        failed = any(recompute.error for recompute in report.recomputes)
+        if report.cycles or failed or getattr(settings, "PROPAGATION_REPORT", False):
+            print(report)
+        return report
+
+
+_local = threading.local()
+
+
+def get_scheduler() -> PropagationScheduler:
+    """
+    :return: the scheduler of the current thread
+    """
+    if not hasattr(_local, "scheduler"):
+        _local.scheduler = PropagationScheduler()
+    return _local.scheduler
+
+
+@contextmanager
+def deferred_propagation() -> Iterator[PropagationScheduler]:
+    """
+    Collects the changes within the block, the automated lists are recomputed when the outermost block is left.
+    """
+    scheduler = get_scheduler()
+    scheduler.depth += 1
+    try:
+        yield scheduler
+    finally:
+        scheduler.depth -= 1
+        if scheduler.depth == 0:
+            scheduler.flush()
+
+
+class PropagationMiddleware:
+    """
+        Recomputes the automated lists once per request, after the view made all its changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deferred_propagation():
+            return self.get_response(request)
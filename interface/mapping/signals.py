@@ -0,0 +1,149 @@
+"""
+    Keeps the automated lists up to date: when publications are added to (or removed from) a list, or a review value
+    of a publication changes, only these publications are evaluated against the criteria of the lists which follow it.
+    A renamed review field and a deleted list make their automated lists evaluate all the publications concerned.
+    The changes are handed over to the scheduler of `mapping.propagation`.
+"""
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from .models import Mapping, PublicationList, ReviewField, ReviewFieldValue
+from .propagation import get_scheduler
+
+
+def publications_changed(sender, instance, action, reverse, pk_set, **kwargs) -> None:
+    """
+    `PublicationList.publications` was changed, from the side of the list or of a publication (`reverse`).
+    """
+    if action == "pre_clear":
+        # the cleared ids are not sent with the signal
+        related = instance.publicationlist_set if reverse else instance.publications
+        instance._cleared_ids = set(related.values_list("id", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_ids", set())
+    elif action not in ["post_add", "post_remove"]:
+        return
+
+    if not pk_set:
+        return
+    mappings = Mapping.objects.filter(publicationlist__id__in=pk_set) if reverse else \
+        Mapping.objects.filter(id=instance.mapping_id)
+    mappings.update(lists_version=F("lists_version") + 1)
+
+    if reverse:
+        for publication_list_id in pk_set:
+            get_scheduler().publications_changed(publication_list_id, {instance.pk})
+    else:
+        get_scheduler().publications_changed(instance.pk, set(pk_set))
+
+
+def subscriptions_changed(sender, instance, action, reverse, pk_set, **kwargs) -> None:
+    """
+    `PublicationList.subscriptions` was changed, the publications of the added or removed subscriptions are evaluated.
+    """
+    if action == "pre_clear":
+        related = instance.my_subscriptions if reverse else instance.subscriptions
+        instance._cleared_ids = set(related.values_list("id", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_ids", set())
+    elif action not in ["post_add", "post_remove"]:
+        return
+
+    if not pk_set:
+        return
+    if reverse:
+        # `instance` is the subscription, `pk_set` are its followers
+        publication_ids = set(instance.publications.values_list("id", flat=True))
+        for follower_id in pk_set:
+            get_scheduler().evaluate_publications(follower_id, publication_ids)
+    elif instance.criteria != "":
+        publication_ids = set(
+            PublicationList.publications.through.objects.filter(publicationlist_id__in=pk_set)
+            .values_list("publication_id", flat=True)
+        )
+        get_scheduler().evaluate_publications(instance.pk, publication_ids)
+
+
+def review_value_changed(sender, instance, **kwargs) -> None:
+    """
+    A review value was saved or deleted, the automated lists whose criteria use its field re-evaluate the publication.
+    """
+    review_field = ReviewField.objects.filter(id=instance.review_field_id).first()
+    if review_field is None:
+        # the field itself is being deleted
+        return
+
+    publication_lists = PublicationList.objects.filter(mapping_id=review_field.mapping_id)\
+        .exclude(criteria="").filter(criteria__contains=review_field.name)
+    for publication_list_id in publication_lists.values_list("id", flat=True):
+        get_scheduler().evaluate_publications(publication_list_id, {instance.publication_id})
+
+
+def subscribed_publication_ids(publication_list: PublicationList) -> set:
+    """
+    :return: ids of the publications of the list and of its subscriptions
+    """
+    through = PublicationList.publications.through.objects
+    return set(through.filter(publicationlist_id=publication_list.id).values_list("publication_id", flat=True)) | \
+        set(through.filter(publicationlist__in=publication_list.subscriptions.all())
+            .values_list("publication_id", flat=True))
+
+
+def review_field_saving(sender, instance, **kwargs) -> None:
+    """
+    Keeps the name of a review field before it is saved, the criteria of a renamed field are evaluated again.
+    """
+    instance._previous_name = ReviewField.objects.filter(id=instance.pk).values_list("name", flat=True).first() \
+        if instance.pk is not None else None
+
+
+def review_field_changed(sender, instance, **kwargs) -> None:
+    """
+    A review field was added, renamed or deleted, the filters of its mapping are compiled again and the automated
+    lists whose criteria use its name (or its name before) evaluate all their publications.
+    """
+    Mapping.objects.filter(id=instance.mapping_id).update(review_fields_version=F("review_fields_version") + 1)
+
+    previous_name = instance.__dict__.pop("_previous_name", None)
+    if kwargs.get("created") is False and previous_name == instance.name:
+        return
+    names = {instance.name, previous_name} - {None}
+    publication_lists = PublicationList.objects.filter(mapping_id=instance.mapping_id).exclude(criteria="")
+    for publication_list in publication_lists:
+        if any(name in publication_list.criteria for name in names):
+            get_scheduler().evaluate_publications(publication_list.id, subscribed_publication_ids(publication_list))
+
+
+def publication_list_deleting(sender, instance, **kwargs) -> None:
+    """
+    The publications and followers of a list are removed without `m2m_changed`, they are kept for its followers.
+    """
+    instance._follower_ids = set(instance.my_subscriptions.exclude(criteria="").values_list("id", flat=True))
+    instance._publication_ids = set(instance.publications.values_list("id", flat=True)) \
+        if instance._follower_ids else set()
+
+
+def publication_list_deleted(sender, instance, **kwargs) -> None:
+    """
+    The followers of a deleted list evaluate its publications again, without it as a subscription.
+    """
+    Mapping.objects.filter(id=instance.mapping_id).update(lists_version=F("lists_version") + 1)
+
+    publication_ids = instance.__dict__.pop("_publication_ids", set())
+    for follower_id in instance.__dict__.pop("_follower_ids", set()):
+        get_scheduler().evaluate_publications(follower_id, publication_ids)
+
+
+def connect() -> None:
+    m2m_changed.connect(publications_changed, sender=PublicationList.publications.through)
+    m2m_changed.connect(subscriptions_changed, sender=PublicationList.subscriptions.through)
+    pre_delete.connect(publication_list_deleting, sender=PublicationList)
+    post_delete.connect(publication_list_deleted, sender=PublicationList)
+    pre_save.connect(review_field_saving, sender=ReviewField)
+    post_save.connect(review_field_changed, sender=ReviewField)
+    post_delete.connect(review_field_changed, sender=ReviewField)
+    for value_class in ReviewFieldValue.__subclasses__():
+        post_save.connect(review_value_changed, sender=value_class)
+        post_delete.connect(review_value_changed, sender=value_class)
@@ -1,3 +1,300 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db.models import Exists, Q
+from django.test import SimpleTestCase, TestCase
+
+from mapping.criteria import (
+    Condition, CriteriaError, Not, Operation, compile_criteria, create_advanced_query, parse_criteria,
+)
+from mapping.models import Mapping, PublicationList, ReviewField, ReviewFieldValueBoolean
+from mapping.propagation import deferred_propagation, get_scheduler, strongly_connected
+from publication.models import Publication, Venue
+from reviewer.models import Reviewer
+
+
+class ParseCriteriaTests(SimpleTestCase):
+
+    def test_operators_are_applied_from_left_to_right(self):
+        self.assertEqual(parse_criteria("(a=1) or (b=2) and (c=3)"), Operation(
+            "and",
+            Operation("or", Condition("a", "1", 1), Condition("b", "2", 10), 6),
+            Condition("c", "3", 20),
+            15,
+        ))
+        self.assertEqual(parse_criteria("(a=1) and ((b=2) or (c=3))"), Operation(
+            "and",
+            Condition("a", "1", 1),
+            Operation("or", Condition("b", "2", 12), Condition("c", "3", 21), 17),
+            6,
+        ))
+
+    def test_not_applies_to_what_follows_it(self):
+        self.assertEqual(parse_criteria("not (a=1) and (b=2)"), Operation(
+            "and", Not(Condition("a", "1", 5), 0), Condition("b", "2", 15), 10,
+        ))
+        self.assertEqual(parse_criteria("not not (a=1)"), Not(Not(Condition("a", "1", 9), 4), 0))
+
+    def test_values(self):
+        self.assertEqual(parse_criteria("year__gte = 2020"), Condition("year__gte", "2020", 0))
+        self.assertEqual(parse_criteria("(a==w)"), Condition("a", "w", 1))
+        self.assertEqual(parse_criteria("(title__icontains=self adaptive)"),
+                         Condition("title__icontains", "self adaptive", 1))
+        self.assertEqual(parse_criteria("(a=1) AND (b=2)").operator, "and")
+        self.assertIsNone(parse_criteria(""))
+
+    def test_errors_have_positions(self):
+        cases = [
+            ("(x=y", 4, 'expected ")" after the end of the filter'),
+            ("(x=y))", 5, 'unexpected ")"'),
+            ("(x=y) and", 9, "expected a condition after the end of the filter"),
+            ("(x=y) (a=b)", 6, 'unexpected "("'),
+            ("and (x=y)", 0, 'expected a condition instead of "and"'),
+            ("()", 1, 'expected a condition instead of ")"'),
+        ]
+        for text, position, message in cases:
+            with self.subTest(text=text):
+                with self.assertRaises(CriteriaError) as raised:
+                    parse_criteria(text)
+                self.assertEqual(raised.exception.position, position)
+                self.assertEqual(raised.exception.message, message)
+                self.assertEqual(str(raised.exception), f"{message} at character {position + 1}")
+
+    def test_errors_are_buffer_errors(self):
+        # the views report a BufferError as a wrong filter
+        with self.assertRaises(BufferError):
+            parse_criteria("(x y)")
+
+
+class CompileCriteriaTests(TestCase):
+
+    def setUp(self):
+        compile_criteria.cache_clear()
+        self.reviewer = Reviewer.objects.create_user(email="reviewer@example.org", password="password")
+        self.mapping = Mapping.objects.create(name="mapping", leader=self.reviewer, secret_key="secret")
+        self.publication_list = PublicationList.objects.create(
+            name="list", reviewer=self.reviewer, mapping=self.mapping)
+
+    def test_compiled_filter_is_reused(self):
+        first = create_advanced_query(self.mapping, self.publication_list, "(year__gte=2020)")
+        second = create_advanced_query(self.mapping, self.publication_list, "(year__gte=2020)")
+        self.assertIs(first, second)
+        self.assertEqual(first, Q(year__gte="2020"))
+        self.assertEqual(compile_criteria.cache_info().hits, 1)
+
+    def test_review_field_change_compiles_again(self):
+        before = create_advanced_query(self.mapping, self.publication_list, "(relevant=True)")
+        # no review field of this name yet, so it is taken as a field of the publication
+        self.assertEqual(before, Q(relevant="True"))
+
+        ReviewField.objects.create(name="relevant", type="B", mapping=self.mapping)
+        version = self.mapping.review_fields_version
+        self.mapping.refresh_from_db()
+        self.assertEqual(self.mapping.review_fields_version, version + 1)
+
+        after = create_advanced_query(self.mapping, self.publication_list, "(relevant=True)")
+        self.assertIsInstance(after.children[0], Exists)
+        self.assertEqual(compile_criteria.cache_info().misses, 2)
+
+
+class FollowerTests(TestCase):
+    """
+        The signals update an automated list by the changed publications only, the result has to be the one of a
+        full `rebuild_publications`.
+    """
+
+    def setUp(self):
+        compile_criteria.cache_clear()
+        self.reviewer = Reviewer.objects.create_user(email="reviewer@example.org", password="password")
+        self.mapping = Mapping.objects.create(name="mapping", leader=self.reviewer, secret_key="secret")
+        venue = Venue.objects.create(name="venue", type="J")
+        self.publications = Publication.objects.bulk_create([
+            Publication(title=f"title {i}", clean_title=f"title{i}", year=2000 + i, venue=venue) for i in range(6)
+        ])
+        self.relevant = ReviewField.objects.create(name="relevant", type="B", mapping=self.mapping)
+        for publication in self.publications[:4]:
+            self.set_relevant(self.relevant, publication, True)
+
+        self.source = self.create_list("source")
+        self.source.publications.add(*self.publications[:3])
+        self.follower = self.create_list("follower", "(relevant=True) and (year__gte=2001)")
+        self.follow(self.follower, self.source)
+
+    def create_list(self, name: str, criteria: str = "") -> PublicationList:
+        return PublicationList.objects.create(
+            name=name, reviewer=self.reviewer, mapping=self.mapping, type="A" if criteria else "M", criteria=criteria)
+
+    def set_relevant(self, review_field: ReviewField, publication: Publication, value: bool) -> None:
+        ReviewFieldValueBoolean.objects.update_or_create(
+            review_field=review_field, publication=publication, reviewer=self.reviewer, defaults={"value": value})
+
+    @staticmethod
+    def follow(follower: PublicationList, subscription: PublicationList) -> None:
+        follower.subscriptions.add(subscription)
+        subscription.followers.add(follower)
+
+    def assertFollowerIsRebuilt(self, expected: list[int]) -> None:
+        updated = set(self.follower.publications.values_list("id", flat=True))
+        self.assertEqual(updated, {self.publications[i].id for i in expected})
+        self.follower.rebuild_publications()
+        self.assertEqual(updated, set(self.follower.publications.values_list("id", flat=True)))
+
+    def test_following(self):
+        self.assertFollowerIsRebuilt([1, 2])
+
+    def test_publications_are_added_and_removed(self):
+        self.source.publications.add(self.publications[3], self.publications[4])
+        self.assertFollowerIsRebuilt([1, 2, 3])
+        self.source.publications.remove(self.publications[1])
+        self.assertFollowerIsRebuilt([2, 3])
+        # from the side of the publication
+        self.publications[1].publicationlist_set.add(self.source)
+        self.assertFollowerIsRebuilt([1, 2, 3])
+        self.source.publications.clear()
+        self.assertFollowerIsRebuilt([])
+
+    def test_review_value_is_changed(self):
+        self.set_relevant(self.relevant, self.publications[2], False)
+        self.assertFollowerIsRebuilt([1])
+        self.set_relevant(self.relevant, self.publications[2], True)
+        self.assertFollowerIsRebuilt([1, 2])
+        ReviewFieldValueBoolean.objects.get(publication=self.publications[1]).delete()
+        self.assertFollowerIsRebuilt([2])
+
+    def test_review_field_is_renamed(self):
+        draft = ReviewField.objects.create(name="draft", type="B", mapping=self.mapping)
+        self.set_relevant(draft, self.publications[2], False)
+        self.set_relevant(draft, self.publications[1], True)
+
+        # the fields are renamed in a single request, as by `EditFieldsView`
+        with deferred_propagation():
+            self.relevant.name = "previous"
+            self.relevant.save()
+            draft.name = "relevant"
+            draft.save()
+        self.assertFollowerIsRebuilt([1])
+
+    def test_list_is_deleted(self):
+        other = self.create_list("other")
+        other.publications.add(self.publications[2], self.publications[3])
+        self.follow(self.follower, other)
+        self.assertFollowerIsRebuilt([1, 2, 3])
+
+        self.source.delete()
+        self.assertFollowerIsRebuilt([2, 3])
+
+    def test_followers_of_followers(self):
+        second = self.create_list("second", "(year__lte=2001)")
+        self.follow(second, self.follower)
+        self.source.publications.add(self.publications[3])
+        self.source.publications.remove(self.publications[2])
+
+        updated = set(second.publications.values_list("id", flat=True))
+        self.assertEqual(updated, {self.publications[1].id})
+        second.rebuild_publications()
+        self.assertEqual(updated, set(second.publications.values_list("id", flat=True)))
+
+
+class PropagationTests(TestCase):
+
+    def setUp(self):
+        compile_criteria.cache_clear()
+        self.reviewer = Reviewer.objects.create_user(email="reviewer@example.org", password="password")
+        self.mapping = Mapping.objects.create(name="mapping", leader=self.reviewer, secret_key="secret")
+        venue = Venue.objects.create(name="venue", type="J")
+        self.publications = Publication.objects.bulk_create([
+            Publication(title=f"title {i}", clean_title=f"title{i}", year=2000 + i, venue=venue) for i in range(6)
+        ])
+        self.source = self.create_list("source")
+
+    def create_list(self, name: str, criteria: str = "", *subscriptions: PublicationList) -> PublicationList:
+        publication_list = PublicationList.objects.create(
+            name=name, reviewer=self.reviewer, mapping=self.mapping, type="A" if criteria else "M", criteria=criteria)
+        for subscription in subscriptions:
+            publication_list.subscriptions.add(subscription)
+            subscription.followers.add(publication_list)
+        return publication_list
+
+    def publication_ids(self, publication_list: PublicationList, *expected: int) -> None:
+        self.assertEqual(set(publication_list.publications.values_list("id", flat=True)),
+                         {self.publications[i].id for i in expected})
+
+    def test_strongly_connected(self):
+        self.assertEqual(strongly_connected([3, 2, 1], {1: [2], 2: [3]}), [[1], [2], [3]])
+        self.assertEqual(strongly_connected([1, 2, 3], {1: [2], 2: [1, 3]}), [[1, 2], [3]])
+
+    def test_chain_is_recomputed_in_order(self):
+        # created from the end, so the order of the ids is not the one of the chain
+        c = self.create_list("c", "(year__gte=2001)")
+        b = self.create_list("b", "(year__lte=2004)")
+        a = self.create_list("a", "(year__gte=2000)", self.source)
+        b.subscriptions.add(a)
+        a.followers.add(b)
+        c.subscriptions.add(b)
+        b.followers.add(c)
+
+        with deferred_propagation() as scheduler:
+            self.source.publications.add(*self.publications)
+        report = scheduler.reports[-1]
+        self.assertEqual([recompute.publication_list_id for recompute in report.recomputes], [a.id, b.id, c.id])
+        self.assertEqual(report.cycles, [])
+        self.publication_ids(c, 1, 2, 3, 4)
+
+    @mock.patch("builtins.print")
+    def test_cycle_terminates(self, _):
+        a = self.create_list("a", "(year__gte=2001)", self.source)
+        b = self.create_list("b", "(year__lte=2004)", a)
+        a.subscriptions.add(b)
+        b.followers.add(a)
+
+        with deferred_propagation() as scheduler:
+            self.source.publications.add(*self.publications)
+        report = scheduler.reports[-1]
+        self.assertEqual(report.cycles, [sorted([a.id, b.id])])
+        # each member is recomputed at most once more
+        self.assertLessEqual(len(report.recomputes), 4)
+        self.publication_ids(a, 1, 2, 3, 4, 5)
+        self.publication_ids(b, 1, 2, 3, 4)
+
+    @mock.patch("builtins.print")
+    def test_failing_list_does_not_stop_the_others(self, _):
+        broken = self.create_list("broken", "(year__gte=2001)", self.source)
+        wrong = self.create_list("wrong", "(year__gte=2001", self.source)
+        working = self.create_list("working", "(year__gte=2001)", self.source)
+        update_publications = PublicationList.update_publications
+
+        def fail_on_broken(publication_list, publication_ids):
+            if publication_list.id == broken.id:
+                raise ValueError("broken")
+            update_publications(publication_list, publication_ids)
+
+        with mock.patch.object(PublicationList, "update_publications", autospec=True, side_effect=fail_on_broken):
+            with deferred_propagation() as scheduler:
+                self.source.publications.add(*self.publications[:3])
+        errors = {recompute.publication_list_id: recompute.error for recompute in scheduler.reports[-1].recomputes}
+        self.assertTrue(errors[broken.id].startswith("the list cannot be recomputed"))
+        self.assertTrue(errors[wrong.id].startswith("the criteria cannot be evaluated"))
+        self.assertEqual(errors[working.id], "")
+        self.publication_ids(broken)
+        self.publication_ids(wrong)
+        self.publication_ids(working, 1, 2)
+
+    def test_deferred_changes_are_recomputed_once(self):
+        a = self.create_list("a", "(year__gte=2001)", self.source)
+        b = self.create_list("b", "(year__lte=2004)", a)
+        get_scheduler().reports.clear()
+
+        with deferred_propagation() as scheduler:
+            for publication in self.publications:
+                self.source.publications.add(publication)
+            with deferred_propagation():
+                self.source.publications.remove(self.publications[5])
+            # the inner block does not flush
+            self.assertEqual(scheduler.reports, [])
+            self.publication_ids(a)
+
+        self.assertEqual(len(scheduler.reports), 1)
+        recomputes = scheduler.reports[-1].recomputes
+        self.assertEqual([recompute.publication_list_id for recompute in recomputes], [a.id, b.id])
+        self.assertEqual(recomputes[0].evaluated, 6)
+        self.publication_ids(a, 1, 2, 3, 4)
+        self.publication_ids(b, 1, 2, 3, 4)
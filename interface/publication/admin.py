@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Affiliation, Author, Country, Keyword, Publication, Venue, Source, FullText, FullTextAccess
+from .models import Affiliation, Author, Country, Keyword, Publication, Venue, Source, FullText, FullTextAccess, \
+	ImportJob, MetadataRecord, MetadataDump
 
 admin.site.register(Affiliation)
 admin.site.register(Author)
@@ -9,4 +10,7 @@ admin.site.register(Publication)
 admin.site.register(Venue)
 admin.site.register(Source)
 admin.site.register(FullText)
-admin.site.register(FullTextAccess)
\ No newline at end of file
+admin.site.register(FullTextAccess)
+admin.site.register(ImportJob)
+admin.site.register(MetadataRecord)
+admin.site.register(MetadataDump)
\ No newline at end of file
@@ -0,0 +1,358 @@
+import codecs
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List
+
+from .constants import ARTICLE_TYPES
+from .extractors import AuthorRecord, CrossRefRecord, FullTextRecord, VenueRecord
+from .parsers import is_doi, normalize_doi
+
+
+ENTRY_HEAD = re.compile(r'@\s*([A-Za-z]+)\s*([{(])')
+DELIMITERS = re.compile(r'[{}()]')
+# the end of an entry is searched outside of the quoted values, e.g. title = "Mapping (studies) at scale"
+ENTRY_DELIMITERS = re.compile(r'[{}()"]')
+FIELD_NAME = re.compile(r'\s*([^\s=,{}"#()]+)\s*=\s*')
+BARE_VALUE = re.compile(r'[^\s,#{}"]+')
+PROTECTING_BRACES = re.compile(r'(?<!\\)[{}]')
+
+YEAR = re.compile(r'\b(\d{4})\b')
+
+# the fields which name the venue, in the order they are looked up
+VENUE_FIELDS = ["journal", "booktitle", "series", "school", "institution", "organization", "publisher", "howpublished"]
+
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+
+@dataclass
+class BibTeXEntry:
+	entry_type: str  # e.g. "article", lower case
+	key: str
+	fields: Dict[str, str] = field(default_factory=dict)  # the names are in lower case
+
+	@property
+	def doi(self) -> None | str:
+		return self.fields.get("doi") or None
+
+	@property
+	def keywords(self) -> List[str]:
+		return [keyword.strip() for keyword in re.split(r'[,;]', self.fields.get("keywords", "")) if keyword.strip()]
+
+	def extra_info(self) -> dict:
+		"""
+		:return: the information which is added to the resolved publication, e.g. {"abstract": "...", "keywords_list": [...]}
+		"""
+		extra_info = {}
+		if self.fields.get("abstract"):
+			extra_info["abstract"] = self.fields["abstract"]
+		if self.keywords:
+			extra_info["keywords_list"] = self.keywords
+		return extra_info
+
+
+def split_authors(authors: str) -> List[AuthorRecord]:
+	"""
+	:param authors: e.g. "Doe, John and Jane Smith and others"
+	"""
+	records = []
+	for name in re.split(r'\s+and\s+', authors):
+		name = name.strip()
+		if not name or name.lower() == "others":
+			continue
+
+		if ',' in name:
+			# "von Last, Jr, First" or "Last, First"
+			parts = [part.strip() for part in name.split(',')]
+			last_name, first_name = parts[0], parts[-1]
+		else:
+			# "First von Last"
+			parts = name.rsplit(' ', 1)
+			first_name, last_name = (parts[0], parts[1]) if len(parts) > 1 else ("", parts[0])
+		records.append(AuthorRecord(first_name=first_name, last_name=last_name))
+	return records
+
+
+def build_record(entry: BibTeXEntry) -> CrossRefRecord:
+	"""
+	Builds the record of a publication from the fields of its BibTeX entry, without asking CrossRef.
+	:return: the record, its `error` tells why it cannot be stored (e.g. a missing year)
+	"""
+	fields = entry.fields
+	doi = normalize_doi(entry.doi or "")
+	record = CrossRefRecord(doi=doi if is_doi(doi) else "", status="resolved", doi_type=entry.entry_type)
+	record.title = fields.get("title", "")
+	record.abstract = fields.get("abstract", "")
+	record.keywords = list(dict.fromkeys(keyword.lower() for keyword in entry.keywords))
+	record.authors = split_authors(fields.get("author", ""))
+
+	# e.g. "Dept. A, Univ. X, Italy; Univ. Y, Czechia", used only if there is one affiliation for each author
+	affiliations = [affiliation.strip() for affiliation in fields.get("affiliation", "").split(';')]
+	if len(affiliations) == len(record.authors):
+		for author, affiliation in zip(record.authors, affiliations):
+			author.affiliation = affiliation or None
+
+	year = YEAR.search(fields.get("year", "") or fields.get("date", ""))
+	record.year = year.group(1) if year else None
+
+	venue_name = next((fields[name] for name in VENUE_FIELDS if fields.get(name)), None)
+	if venue_name is not None:
+		record.publisher_name = fields.get("publisher", "")
+		record.venue = VenueRecord(
+			name=venue_name,
+			type=ARTICLE_TYPES.get(entry.entry_type, "X"),
+			publisher=record.publisher_name,
+			volume=fields.get("volume", ""),
+			number=fields.get("number", ""),
+		)
+
+	if fields.get("url", "").lower().endswith(".pdf"):
+		record.full_texts = [FullTextRecord(url=fields["url"], type="P")]
+
+	for supplied_field in ["doi", "title", "year", "venue", "authors", "abstract", "keywords", "full_texts"]:
+		if getattr(record, supplied_field):
+			record.field_stages[supplied_field] = "bibtex"
+
+	if not record.title:
+		record.error = "error in finding title"
+	elif record.year is None:
+		record.error = "error in finding year"
+	elif record.venue is None:
+		record.error = "error in finding venue"
+	return record
+
+
+def missing_fields(record: CrossRefRecord, fields: List[str]) -> List[str]:
+	"""
+	:param fields: the fields which should be filled, e.g. ["abstract", "authors"]
+	:return: those which are empty, or all of them if the record cannot be stored as it is
+	"""
+	if record.error:
+		return list(fields)
+	return [name for name in fields if not getattr(record, name, None)]
+
+
+def complete_record(record: CrossRefRecord, crossref_record: CrossRefRecord, fields: List[str]) -> CrossRefRecord:
+	"""
+	Fills the missing fields of a record built from BibTeX with those of the CrossRef record of its DOI.
+	:return: the completed record; the CrossRef record, if the BibTeX one could not be stored
+	"""
+	if crossref_record.error:
+		return record
+
+	if record.error:
+		# what the entry has is still kept
+		for name in ["abstract", "keywords"]:
+			if getattr(record, name) and not getattr(crossref_record, name):
+				setattr(crossref_record, name, getattr(record, name))
+				crossref_record.field_stages[name] = "bibtex"
+		return crossref_record
+
+	for name in missing_fields(record, fields):
+		if getattr(crossref_record, name, None):
+			setattr(record, name, getattr(crossref_record, name))
+			record.field_stages[name] = crossref_record.field_stages.get(name, "xml")
+	return record
+
+
+def decode_chunks(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+	"""
+	Decodes the chunks of an uploaded file one by one, a character split between two chunks is kept for the next one.
+	"""
+	decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+	for chunk in chunks:
+		text = decoder.decode(chunk)
+		if text:
+			yield text
+	text = decoder.decode(b"", final=True)
+	if text:
+		yield text
+
+
+class BibTeXTokenizer:
+	"""
+		Reads BibTeX entries from a stream of text chunks and yields them one by one. Only the entry that is being
+		read is kept in memory, so the memory use does not depend on the size of the file. Values may span several
+		lines, contain nested braces, be quoted or concatenated with `#`; @string macros are replaced, @comment and
+		@preamble are skipped.
+	"""
+	skipped_types = ["comment", "preamble"]
+
+	def __init__(self, max_entry_size: int = 1024 * 1024) -> None:
+		"""
+		:param max_entry_size: the number of characters after which an unfinished entry is considered broken
+		"""
+		self.max_entry_size = max_entry_size
+		self.strings = {month: month for month in MONTHS}
+		self.broken_entries = 0
+
+	def entries(self, chunks: Iterable[str]) -> Iterator[BibTeXEntry]:
+		buffer = ""
+		position = 0        # where the unread part of the buffer starts
+		head = None         # (type, closing delimiter, start of the body) of the entry being read
+		scanned = 0         # how far the body has been searched for its end
+		depth = 0
+		quoted = False      # within a quoted value of the body
+
+		for chunk in chunks:
+			buffer = buffer[position:] + chunk
+			if head is not None:
+				head = (head[0], head[1], head[2] - position)
+				scanned -= position
+			position = 0
+
+			while True:
+				if head is None:
+					start = buffer.find('@', position)
+					if start < 0:
+						position = len(buffer)
+						break
+
+					match = ENTRY_HEAD.match(buffer, start)
+					if match is None:
+						if len(buffer) - start > 64:
+							# not an entry, e.g. an e-mail address in a comment
+							position = start + 1
+							continue
+						position = start
+						break
+
+					head = (match.group(1).lower(), '}' if match.group(2) == '{' else ')', match.end())
+					scanned = match.end()
+					depth = 0
+					quoted = False
+
+				end = None
+				for delimiter in ENTRY_DELIMITERS.finditer(buffer, scanned):
+					character = delimiter.group()
+					if character == '{':
+						depth += 1
+					elif character == '}' and depth > 0:
+						depth -= 1
+					elif character == '"' and depth == 0 and buffer[delimiter.start() - 1] != '\\':
+						quoted = not quoted
+					elif character == head[1] and depth == 0 and not quoted:
+						end = delimiter.start()
+						break
+
+				if end is None:
+					scanned = len(buffer)
+					if scanned - head[2] > self.max_entry_size:
+						# a missing closing brace, the entry is skipped
+						self.broken_entries += 1
+						position = head[2]
+						head = None
+						continue
+					position = min(position, head[2])
+					break
+
+				entry = self.parse_entry(head[0], buffer[head[2]:end])
+				position = end + 1
+				head = None
+				if entry is not None:
+					yield entry
+
+		if head is not None:
+			self.broken_entries += 1
+
+	def parse_entry(self, entry_type: str, body: str) -> None | BibTeXEntry:
+		if entry_type in BibTeXTokenizer.skipped_types:
+			return None
+
+		if entry_type == "string":
+			self.strings.update(self.parse_fields(body, 0))
+			return None
+
+		comma = body.find(',')
+		if comma < 0:
+			return BibTeXEntry(entry_type=entry_type, key=body.strip())
+
+		return BibTeXEntry(entry_type=entry_type, key=body[:comma].strip(), fields=self.parse_fields(body, comma + 1))
+
+	def parse_fields(self, body: str, position: int) -> Dict[str, str]:
+		fields = {}
+		while True:
+			match = FIELD_NAME.match(body, position)
+			if match is None:
+				break
+
+			name = match.group(1).lower()
+			pieces = []
+			position = match.end()
+			while position < len(body):
+				character = body[position]
+				if character == '{':
+					end = BibTeXTokenizer.closing_brace(body, position)
+					pieces.append(body[position + 1:end])
+				elif character == '"':
+					end = BibTeXTokenizer.closing_quote(body, position)
+					pieces.append(body[position + 1:end])
+				else:
+					bare = BARE_VALUE.match(body, position)
+					if bare is None:
+						break
+					end = bare.end() - 1
+					value = bare.group()
+					pieces.append(value if value.isdigit() else self.strings.get(value.lower(), value))
+
+				position = end + 1
+				while position < len(body) and body[position].isspace():
+					position += 1
+				if position < len(body) and body[position] == '#':
+					position += 1
+					while position < len(body) and body[position].isspace():
+						position += 1
+					continue
+				break
+
+			fields[name] = BibTeXTokenizer.clean_value("".join(pieces))
+
+			# the next field starts after the comma
+			comma = body.find(',', position)
+			if comma < 0:
+				break
+			position = comma + 1
+
+		return fields
+
+	@staticmethod
+	def closing_brace(text: str, start: int) -> int:
+		depth = 0
+		for delimiter in DELIMITERS.finditer(text, start):
+			character = delimiter.group()
+			if character == '{':
+				depth += 1
+			elif character == '}':
+				depth -= 1
+				if depth == 0:
+					return delimiter.start()
+		return len(text)
+
+	@staticmethod
+	def closing_quote(text: str, start: int) -> int:
+		depth = 0
+		for position in range(start + 1, len(text)):
+			character = text[position]
+			if character == '{':
+				depth += 1
+			elif character == '}':
+				depth -= 1
+			elif character == '"' and depth == 0 and text[position - 1] != '\\':
+				return position
+		return len(text)
+
+	@staticmethod
+	def clean_value(value: str) -> str:
+		"""
+		Removes the braces which protect the case of words (e.g. "{IoT} Systems") and joins the lines of the value.
+		"""
+		if '{' in value or '}' in value:
+			value = PROTECTING_BRACES.sub('', value)
+		return " ".join(value.split())
+
+
+def read_bibtex(chunks: Iterable[str]) -> Iterator[BibTeXEntry]:
+	"""
+	:param chunks: the text of a .bib file, e.g. [text] or `decode_chunks(uploaded_file.chunks())`
+	:return: the entries in their order in the file
+	"""
+	return BibTeXTokenizer().entries(chunks)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches, InvalidCacheBackendError
+
+
+CROSSREF_CACHE_ALIAS = "crossref"
+
+
+class CachedResponse:
+	"""
+		A stored response of dx.doi.org, it offers the part of `requests.Response` that the parsers use.
+	"""
+	status_code: int
+	text: str
+	from_cache: bool
+
+	def __init__(self, status_code: int, text: str, from_cache: bool = True) -> None:
+		self.status_code = status_code
+		self.text = text
+		self.from_cache = from_cache
+
+	@property
+	def ok(self) -> bool:
+		return self.status_code < 400
+
+	def json(self) -> dict:
+		return json.loads(self.text)
+
+
+class CrossRefCache:
+	"""
+		Persistent cache of the responses of dx.doi.org, keyed by the normalized DOI and the accepted content type.
+		Failed lookups (404, unresolved DOIs, ...) are stored as negative entries with a shorter timeout, so bad DOIs
+		are not fetched again on every import. The storage, timeout and size are set by `CACHES['crossref']`.
+	"""
+
+	def __init__(self, alias: str = CROSSREF_CACHE_ALIAS) -> None:
+		try:
+			self.cache = caches[alias]
+		except InvalidCacheBackendError:
+			self.cache = None
+
+	@staticmethod
+	def normalize(doi: str) -> str:
+		return doi.strip().lower()
+
+	@staticmethod
+	def key(doi: str, accept: str) -> str:
+		raw = f"{accept}|{CrossRefCache.normalize(doi)}"
+		return f"crossref:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+	def get(self, doi: str, accept: str) -> None | CachedResponse:
+		if self.cache is None:
+			return None
+
+		entry = self.cache.get(self.key(doi, accept))
+		if entry is None:
+			return None
+
+		return CachedResponse(status_code=entry["status_code"], text=entry["text"])
+
+	def set(self, doi: str, accept: str, status_code: int, text: str) -> None:
+		if self.cache is None:
+			return
+
+		if status_code == 200:
+			timeout = None  # the default timeout of the cache
+			entry = {"status_code": status_code, "text": text}
+		else:
+			# negative entry, the body of an error is not needed
+			timeout = getattr(settings, "CROSSREF_NEGATIVE_CACHE_TIMEOUT", 60 * 60 * 24)
+			entry = {"status_code": status_code, "text": ""}
+
+		if timeout is None:
+			self.cache.set(self.key(doi, accept), entry)
+		else:
+			self.cache.set(self.key(doi, accept), entry, timeout)
+
+	def set_negative(self, doi: str, accept: str, status_code: int = 404) -> None:
+		"""
+		Replaces a stored response by a negative entry, e.g. when CrossRef answered but the DOI is not resolved.
+		"""
+		self.set(doi, accept, status_code, "")
+
+	def delete(self, doi: str, accept: str) -> None:
+		if self.cache is not None:
+			self.cache.delete(self.key(doi, accept))
+
+
+crossref_cache = CrossRefCache()
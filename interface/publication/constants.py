@@ -32,6 +32,7 @@ ARTICLE_TYPES = {
 	"Journals": "J",
 	"manual": "X",
 	"masterthesis": "M",
+	"mastersthesis": "M",
 	"misc": "X",
 	"phdthesis": "D",
 	"proceedings": "X",
@@ -87,3 +88,19 @@ FULL_TEXT_STATUS = [
 	("D", "Downloaded"),
 	("U", "Uploaded")
 ]
+
+IMPORT_JOB_KINDS = [
+	("D", "DOI list"),
+	("B", "BibTeX"),
+	("R", "RIS"),
+	("C", "CSV"),
+	("J", "JSONL"),
+	("W", "Web search"),
+]
+
+IMPORT_JOB_STATUS = [
+	("P", "Pending"),
+	("R", "Running"),
+	("D", "Done"),
+	("F", "Failed"),
+]
@@ -0,0 +1,328 @@
+from bisect import bisect_right
+import re
+from dataclasses import dataclass, field
+from typing import List
+import xml.etree.ElementTree as eT
+
+from .constants import FULL_TEXT_TYPES_REVERSE
+
+
+QR_NAMESPACE = "http://www.crossref.org/qrschema/3.0"
+X_NAMESPACE = "http://www.crossref.org/xschema/1.1"
+
+
+def clean_title(title: str) -> str:
+	"""
+	:return: the title without spaces and symbols, in lower case (see `Publication.clean_title`)
+	"""
+	return re.sub('[^a-zA-Z0-9]+', '', str(title)).lower()
+
+
+@dataclass
+class AuthorRecord:
+	first_name: str
+	last_name: str
+	affiliation: None | str = None  # the raw text, e.g. "institute, city, country"
+
+
+@dataclass
+class VenueRecord:
+	name: str
+	type: str  # see VENUE_TYPES
+	publisher: str = ""
+	volume: str = ""
+	number: str = ""
+
+
+@dataclass
+class FullTextRecord:
+	url: str
+	type: str  # see FULL_TEXT_TYPES
+
+
+@dataclass
+class CrossRefRecord:
+	"""
+		The data of a unixsd record of CrossRef, before anything is stored in the database. The BibTeX import builds
+		the same records from its entries, those may have no DOI.
+	"""
+	doi: str
+	status: str = ""
+	doi_type: str = ""
+	publisher_name: str = ""
+	venue: None | VenueRecord = None
+	title: str = ""
+	year: None | str = None
+	abstract: str = ""
+	authors: List[AuthorRecord] = field(default_factory=list)
+	keywords: List[str] = field(default_factory=list)
+	full_texts: List[FullTextRecord] = field(default_factory=list)
+	# the stage ("xml" or "json") which supplied each field
+	field_stages: dict = field(default_factory=dict)
+	# the reason why the record cannot be used, empty if it is complete
+	error: str = ""
+
+	@property
+	def resolved(self) -> bool:
+		return self.status == "resolved"
+
+	@property
+	def key(self) -> str:
+		"""
+		:return: the DOI, or the clean title of a record without a DOI
+		"""
+		return self.doi if self.doi else clean_title(self.title)
+
+
+class ElementIndex:
+	"""
+		Indexes a whole element tree in a single walk. Every element gets the pre-order numbers of itself and of the
+		last element in its subtree, so the descendants of an element with a given name are found by a binary search
+		instead of walking the subtree again.
+	"""
+
+	def __init__(self, root: eT.Element) -> None:
+		self.spans = {}
+		self.positions = {}
+		self.elements = {}
+
+		position = 0
+		stack = [(root, False)]
+		while stack:
+			element, closed = stack.pop()
+			if closed:
+				self.spans[id(element)] = (self.spans[id(element)][0], position - 1)
+				continue
+
+			self.spans[id(element)] = (position, position)
+			name = ElementIndex.local_name(element.tag)
+			self.positions.setdefault(name, []).append(position)
+			self.elements.setdefault(name, []).append(element)
+			position += 1
+
+			stack.append((element, True))
+			stack.extend((child, False) for child in reversed(element))
+
+	@staticmethod
+	def local_name(tag: str) -> str:
+		return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ""
+
+	@staticmethod
+	def namespace(tag: str) -> str:
+		return tag[1:].split('}', 1)[0] if isinstance(tag, str) and tag.startswith('{') else ""
+
+	def find_all(self, root: eT.Element, name: str, namespace: None | str = None) -> List[eT.Element]:
+		"""
+		:return: descendants of `root` (not `root` itself) called `name`, in document order
+		"""
+		if name not in self.positions:
+			return []
+
+		first, last = self.spans[id(root)]
+		positions = self.positions[name]
+		found = self.elements[name][bisect_right(positions, first):bisect_right(positions, last)]
+		if namespace is not None:
+			found = [element for element in found if ElementIndex.namespace(element.tag) == namespace]
+		return found
+
+	def find_one(self, root: eT.Element, name: str, namespace: None | str = None) -> None | eT.Element:
+		"""
+		:return: the descendant of `root` called `name`, None if there is none or more than one
+		"""
+		if namespace is None and name in self.positions:
+			# the common case, only the number of matches is needed
+			first, last = self.spans[id(root)]
+			positions = self.positions[name]
+			start, end = bisect_right(positions, first), bisect_right(positions, last)
+			return self.elements[name][start] if end - start == 1 else None
+
+		found = self.find_all(root, name, namespace)
+		return found[0] if len(found) == 1 else None
+
+	def find_first_of(self, root: eT.Element, names: List[str]) -> None | eT.Element:
+		"""
+		:return: the single descendant called by the first of the synonyms in `names` that matches exactly once
+		"""
+		for name in names:
+			element = self.find_one(root, name)
+			if element is not None:
+				return element
+		return None
+
+
+class UnixsdExtractor:
+	"""
+		Extracts a `CrossRefRecord` from a unixsd response of CrossRef, walking the xml only once.
+	"""
+	venue_types = {
+		"conference_paper": "conference",
+		"journal_article": "journal",
+	}
+	synonyms_for_conference_names = ["conference_name", "proceedings_title"]
+	synonyms_for_journal_names = ["full_title", "journal_title"]
+	synonyms_for_first_names = ["first_name", "firstname", "given_name", "givenname"]
+	synonyms_for_last_names = ["last_name", "lastname", "surname", "family_name", "familyname"]
+
+	def __init__(self, doi: str) -> None:
+		self.doi = doi
+
+	def extract(self, root: eT.Element) -> CrossRefRecord:
+		record = CrossRefRecord(doi=self.doi)
+		index = ElementIndex(root)
+
+		query = index.find_one(root, "query")
+		if query is None:
+			record.error = "error in finding query"
+			return record
+
+		record.status = query.attrib.get("status", "")
+		if not record.resolved:
+			record.error = "error in status"
+			return record
+
+		publisher_name = index.find_one(query, "publisher_name")
+		doi_type = index.find_one(query, "doi", QR_NAMESPACE)
+
+		if doi_type is None:
+			record.error = "error in finding doi type"
+			return record
+
+		record.publisher_name = publisher_name.text if publisher_name is not None else ""
+
+		# e.g conference paper
+		record.doi_type = doi_type.attrib.get("type", "")
+
+		doi_record = index.find_one(query, "doi_record")
+		if doi_record is None:
+			record.error = "error in finding record"
+			return record
+
+		venue_type = UnixsdExtractor.venue_types.get(record.doi_type)
+		venue = index.find_one(doi_record, venue_type) if venue_type else None
+		if venue is None:
+			record.error = "error in finding venue"
+			return record
+
+		record.venue = self.extract_venue(index, venue, venue_type, record.publisher_name)
+		if record.venue is None:
+			record.error = "error in finding venue name"
+			return record
+
+		publication = index.find_one(venue, record.doi_type)
+		if publication is None:
+			record.error = "error in finding publication"
+			return record
+
+		contributors = index.find_one(publication, "contributors")
+		if contributors is None:
+			record.error = "error in finding contributors"
+			return record
+
+		record.authors = self.extract_authors(index, contributors)
+
+		dates = index.find_all(publication, "publication_date", QR_NAMESPACE)
+		if not dates:
+			dates = index.find_all(doi_record, "publication_date")
+			if not dates:
+				record.error = "error in finding publication dates"
+				return record
+
+		for publication_date in dates:
+			year = index.find_one(publication_date, "year")
+			if year is not None:
+				record.year = year.text
+				break
+
+		if record.year is None:
+			record.error = "error in finding year"
+			return record
+
+		title = index.find_one(publication, "title", X_NAMESPACE)
+		if title is None:
+			record.error = "error in finding title"
+			return record
+		record.title = title.text
+
+		# optional stuff
+		abstract_element = index.find_one(publication, "abstract")
+		if abstract_element is not None:
+			abstract_p = index.find_one(abstract_element, "p")
+			if abstract_p is not None:
+				record.abstract = abstract_p.text or ""
+
+		record.full_texts = self.extract_full_texts(index, publication)
+
+		for supplied_field in ["doi", "title", "year", "venue", "authors"]:
+			record.field_stages[supplied_field] = "xml"
+		if record.abstract:
+			record.field_stages["abstract"] = "xml"
+		if record.full_texts:
+			record.field_stages["full_texts"] = "xml"
+		return record
+
+	def extract_venue(self, index: ElementIndex, venue: eT.Element, venue_type: str, publisher_name: str) \
+			-> None | VenueRecord:
+		if venue_type == "conference":
+			conference_name = index.find_first_of(venue, UnixsdExtractor.synonyms_for_conference_names)
+			if conference_name is not None:
+				# ("P", "Conference Proceedings"),
+				return VenueRecord(name=conference_name.text, type="P", publisher=publisher_name)
+
+		if venue_type == "journal":
+			journal_name = index.find_first_of(venue, UnixsdExtractor.synonyms_for_journal_names)
+			if journal_name is not None:
+				# ("J", "Journal Article"),
+				journal = VenueRecord(name=journal_name.text, type="J", publisher=publisher_name)
+
+				issue = index.find_one(venue, "issue")
+				if issue is not None and issue.text:
+					journal.number = issue.text.strip()
+
+				volume = index.find_one(venue, "volume")
+				if volume is not None and volume.text:
+					journal.volume = volume.text.strip()
+
+				return journal
+
+		return None
+
+	def extract_authors(self, index: ElementIndex, contributors: eT.Element) -> List[AuthorRecord]:
+		authors = []
+		for contributor in contributors:
+			last_name = index.find_first_of(contributor, UnixsdExtractor.synonyms_for_last_names)
+			first_name = index.find_first_of(contributor, UnixsdExtractor.synonyms_for_first_names)
+			affiliation = index.find_one(contributor, "affiliation")
+
+			if last_name is not None and first_name is not None:
+				authors.append(AuthorRecord(
+					first_name=first_name.text,
+					last_name=last_name.text,
+					affiliation=affiliation.text if affiliation is not None else None,
+				))
+
+		return authors
+
+	def extract_full_texts(self, index: ElementIndex, publication: eT.Element) -> List[FullTextRecord]:
+		collection = index.find_one(publication, "collection")
+		if collection is None:
+			return []
+
+		resources = index.find_all(collection, "resource")
+		if not resources:
+			return [FullTextRecord(url="", type="P")]
+
+		full_texts = []
+		for resource in resources:
+			file_type = "pdf"
+			if 'mime_type' in resource.attrib:
+				file_types = resource.attrib['mime_type'].split('/')
+				file_type = file_types[1] if len(file_types) > 1 else file_types[0]
+
+			full_text_type = FULL_TEXT_TYPES_REVERSE.get(f"application/{file_type}")
+			if full_text_type is None:
+				# unknown media types (e.g. text/html) are not stored
+				continue
+
+			full_texts.append(FullTextRecord(url=resource.text, type=full_text_type))
+
+		return full_texts
@@ -0,0 +1,139 @@
+import threading
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .rate_limit import RateLimiter, is_throttled
+
+
+class HostStats:
+	"""
+		Latency and error counters of the requests sent to a single host.
+	"""
+
+	def __init__(self) -> None:
+		self.requests = 0
+		self.errors = 0
+		self.throttled = 0
+		self.total_latency = 0.0
+		self.max_latency = 0.0
+		self.waited = 0.0
+
+	def record(self, latency: float, failed: bool, throttled: bool = False, waited: float = 0.0) -> None:
+		self.requests += 1
+		self.total_latency += latency
+		self.max_latency = max(self.max_latency, latency)
+		self.waited += waited
+		if failed:
+			self.errors += 1
+		if throttled:
+			self.throttled += 1
+
+	def as_dict(self) -> dict:
+		return {
+			"requests": self.requests,
+			"errors": self.errors,
+			"throttled": self.throttled,
+			"average_latency": self.total_latency / self.requests if self.requests else 0.0,
+			"max_latency": self.max_latency,
+			"rate_limit_wait": self.waited,
+		}
+
+
+class HttpClient:
+	"""
+		A single HTTP client for all outbound requests (CrossRef, query platforms, full texts). It keeps the
+		connections to each host alive, applies default connect/read timeouts and retries 5xx answers with
+		an exponential backoff. The requests to each host are rate limited (see `RateLimiter`), refused ones (429)
+		are not retried by `Retry`, but when the limiter allows it, which also backs off. The client is shared by the
+		worker threads.
+	"""
+	retry_statuses = [500, 502, 503, 504]
+
+	def __init__(self) -> None:
+		self.timeout = (
+			getattr(settings, "HTTP_CONNECT_TIMEOUT", 5),
+			getattr(settings, "HTTP_READ_TIMEOUT", 30),
+		)
+		retry = Retry(
+			total=getattr(settings, "HTTP_RETRIES", 3),
+			backoff_factor=getattr(settings, "HTTP_BACKOFF_FACTOR", 0.5),
+			status_forcelist=HttpClient.retry_statuses,
+			allowed_methods=["HEAD", "GET", "OPTIONS"],
+			respect_retry_after_header=True,
+			raise_on_status=False,
+		)
+		pool_size = getattr(settings, "HTTP_POOL_SIZE", 10)
+		adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+		self.session = requests.Session()
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+
+		self.throttled_retries = getattr(settings, "HTTP_RETRIES", 3)
+		self.rate_limiter = RateLimiter()
+
+		self._stats: dict[str, HostStats] = {}
+		self._lock = threading.Lock()
+
+	def request(self, method: str, url: str, rate_limit: None | float = None, **kwargs: Any) -> Response:
+		"""
+		:param rate_limit: the requests per second to the host of the url (e.g. `QueryPlatform.rate_limit`),
+			`HTTP_RATE_LIMITS` or the rate announced by the host by default
+		:raises RateLimitExceeded: if the host cannot be asked within `HTTP_RATE_LIMIT_MAX_WAIT`
+		"""
+		kwargs.setdefault("timeout", self.timeout)
+		host = urlsplit(url).netloc
+		for attempt in range(self.throttled_retries + 1):
+			waited = self.rate_limiter.acquire(host, rate_limit)
+			started = time.perf_counter()
+			response = None
+			try:
+				response = self.session.request(method, url, **kwargs)
+			finally:
+				latency = time.perf_counter() - started
+				throttled = response is not None and is_throttled(response)
+				with self._lock:
+					self._stats.setdefault(host, HostStats()).record(
+						latency, response is None or response.status_code >= 400, throttled, waited)
+
+			self.rate_limiter.observe(host, response, rate_limit)
+			if not throttled:
+				break
+		return response
+
+	def get(self, url: str, **kwargs: Any) -> Response:
+		return self.request("GET", url, **kwargs)
+
+	def stats(self) -> dict:
+		"""
+		:return: the counters of each host, e.g. {"dx.doi.org": {"requests": 3, "errors": 0, "throttled": 0, ...}}
+		"""
+		with self._lock:
+			return {host: host_stats.as_dict() for host, host_stats in self._stats.items()}
+
+	def reset_stats(self) -> None:
+		with self._lock:
+			self._stats = {}
+
+
+_client: None | HttpClient = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+	"""
+	:return: the shared client of this process, created on first use
+	"""
+	global _client
+	if _client is None:
+		with _client_lock:
+			if _client is None:
+				_client = HttpClient()
+	return _client
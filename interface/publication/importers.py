@@ -0,0 +1,363 @@
+"""
+	Readers of the exported libraries (RIS, CSV and JSONL). They read the text chunk by chunk and yield each record
+	as a `BibTeXEntry` with the usual BibTeX field names ("title", "author", "journal", "year", "doi", ...), so all
+	formats are imported by the same pipeline as the BibTeX files.
+"""
+import csv
+import json
+import re
+from typing import Callable, Dict, Iterable, Iterator
+
+from .bibtex import BibTeXEntry, read_bibtex
+
+
+# RIS types, see https://en.wikipedia.org/wiki/RIS_(file_format)
+RIS_TYPES = {
+	"JOUR": "article",
+	"JFULL": "article",
+	"EJOUR": "article",
+	"MGZN": "article",
+	"CONF": "inproceedings",
+	"CPAPER": "inproceedings",
+	"BOOK": "book",
+	"EBOOK": "book",
+	"CHAP": "inbook",
+	"ECHAP": "inbook",
+	"THES": "phdthesis",
+	"RPRT": "techreport",
+	"UNPB": "unpublished",
+}
+
+RIS_FIELDS = {
+	"TI": "title",
+	"T1": "title",
+	"AU": "author",
+	"A1": "author",
+	"JO": "journal",
+	"JF": "journal",
+	"T2": "journal",
+	"BT": "booktitle",
+	"PY": "year",
+	"Y1": "year",
+	"DA": "date",
+	"DO": "doi",
+	"AB": "abstract",
+	"N2": "abstract",
+	"KW": "keywords",
+	"VL": "volume",
+	"IS": "number",
+	"PB": "publisher",
+	"UR": "url",
+	"L1": "url",
+}
+RIS_TAG = re.compile(r'^([A-Z][A-Z0-9])  -(?: (.*))?$')
+
+# the columns of the exports of Scopus, Web of Science (tab-delimited) and Zotero, in lower case
+CSV_FIELDS = {
+	"title": "title",
+	"ti": "title",
+	"authors": "author",
+	"author": "author",
+	"au": "author",
+	"source title": "journal",
+	"publication title": "journal",
+	"so": "journal",
+	"venue": "journal",
+	"year": "year",
+	"publication year": "year",
+	"py": "year",
+	"doi": "doi",
+	"di": "doi",
+	"abstract": "abstract",
+	"abstract note": "abstract",
+	"ab": "abstract",
+	"author keywords": "keywords",
+	"index keywords": "keywords",
+	"manual tags": "keywords",
+	"automatic tags": "keywords",
+	"de": "keywords",
+	"volume": "volume",
+	"vl": "volume",
+	"issue": "number",
+	"is": "number",
+	"publisher": "publisher",
+	"pu": "publisher",
+	"link": "url",
+	"url": "url",
+	"document type": "type",
+	"item type": "type",
+	"dt": "type",
+}
+
+# document types of the exports, in lower case
+DOCUMENT_TYPES = {
+	"article": "article",
+	"review": "article",
+	"journalarticle": "article",
+	"article-journal": "article",
+	"journal-article": "article",
+	"conference paper": "inproceedings",
+	"proceedings paper": "inproceedings",
+	"conferencepaper": "inproceedings",
+	"paper-conference": "inproceedings",
+	"proceedings-article": "inproceedings",
+	"book": "book",
+	"book chapter": "inbook",
+	"booksection": "inbook",
+	"chapter": "inbook",
+	"book-chapter": "inbook",
+	"thesis": "phdthesis",
+	"dissertation": "phdthesis",
+	"report": "techreport",
+}
+
+INITIALS = re.compile(r'^(.+?)\s+((?:[A-Z]\.-?\s?)+)$')
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+	"""
+	Splits a stream of text chunks into lines, the line endings are kept (as `csv` expects them). Only a line feed
+	ends a line, `str.splitlines` would also split a value at a form feed, a record separator or a line separator.
+	"""
+	rest = ""
+	for chunk in chunks:
+		lines = (rest + chunk).split('\n')
+		rest = lines.pop()
+		for line in lines:
+			yield line + '\n'
+	if rest:
+		yield rest
+
+
+def join_authors(names: Iterable[str]) -> str:
+	"""
+	:param names: e.g. ["Doe, John", "Smith J.", "Jane Smith"]
+	:return: the names in the BibTeX form, e.g. "Doe, John and Smith, J. and Jane Smith"
+	"""
+	authors = []
+	for name in names:
+		name = name.strip()
+		if not name:
+			continue
+		initials = INITIALS.match(name) if ',' not in name else None
+		authors.append(f"{initials.group(1)}, {initials.group(2).strip()}" if initials else name)
+	return " and ".join(authors)
+
+
+def document_type(value: str, default: str = "misc") -> str:
+	return DOCUMENT_TYPES.get(value.strip().lower(), default)
+
+
+def read_ris(chunks: Iterable[str]) -> Iterator[BibTeXEntry]:
+	"""
+	:param chunks: the text of a RIS file
+	"""
+	fields = {}
+	authors = []
+	keywords = []
+	entry_type = None
+	last_field = None
+	number = 0
+
+	for line in iter_lines(chunks):
+		line = line.rstrip('\r\n')
+		match = RIS_TAG.match(line)
+		if match is None:
+			# a value which continues on the next line
+			if last_field is not None and line.strip():
+				fields[last_field] = f"{fields.get(last_field, '')} {line.strip()}"
+			continue
+
+		tag, value = match.group(1), (match.group(2) or "").strip()
+		last_field = None
+		if tag == "TY":
+			fields, authors, keywords = {}, [], []
+			entry_type = RIS_TYPES.get(value, "misc")
+		elif tag == "ER":
+			if entry_type is not None:
+				number += 1
+				fields["author"] = join_authors(authors)
+				fields["keywords"] = "; ".join(keywords)
+				yield BibTeXEntry(entry_type=entry_type, key=fields.get("doi") or f"ris-{number}", fields=fields)
+			entry_type = None
+		elif tag in RIS_FIELDS:
+			name = RIS_FIELDS[tag]
+			if name == "author":
+				authors.append(value)
+			elif name == "keywords":
+				keywords.append(value)
+			elif name == "journal" and entry_type == "inproceedings":
+				fields.setdefault("booktitle", value)
+			else:
+				fields.setdefault(name, value)
+				last_field = name
+
+
+def read_csv(chunks: Iterable[str]) -> Iterator[BibTeXEntry]:
+	"""
+	:param chunks: the text of a CSV file with a header, or of a tab-delimited export of Web of Science
+	"""
+	lines = iter_lines(chunks)
+	header = next(lines, None)
+	if header is None:
+		return
+
+	delimiter = '\t' if header.count('\t') > header.count(',') else ','
+	columns = [
+		CSV_FIELDS.get(column.strip().lstrip('\ufeff').lower())
+		for column in next(csv.reader([header], delimiter=delimiter))
+	]
+
+	for number, row in enumerate(csv.reader(lines, delimiter=delimiter), start=1):
+		fields = {}
+		for name, value in zip(columns, row):
+			value = " ".join(value.split())
+			if name is None or not value:
+				continue
+			if name in fields:
+				# e.g. the author keywords and the index keywords
+				fields[name] = f"{fields[name]}; {value}"
+			else:
+				fields[name] = value
+
+		if not fields:
+			continue
+
+		author = fields.get("author", "")
+		fields["author"] = join_authors(author.split(';') if ';' in author else author.split(','))
+		entry_type = document_type(fields.pop("type", ""), "article")
+		if entry_type == "inproceedings" and "journal" in fields:
+			fields["booktitle"] = fields.pop("journal")
+		yield BibTeXEntry(entry_type=entry_type, key=fields.get("doi") or f"csv-{number}", fields=fields)
+
+
+def read_json_record(record: dict) -> Dict[str, str]:
+	"""
+	Reads a CSL-JSON record (e.g. of CrossRef), an OpenAlex work, or a flat record with BibTeX field names.
+	:return: the fields in the BibTeX form
+	"""
+	fields = {}
+
+	title = record.get("title") or record.get("display_name") or ""
+	fields["title"] = title[0] if isinstance(title, list) and title else title
+
+	doi = record.get("DOI") or record.get("doi") or ""
+	fields["doi"] = doi
+
+	authors = record.get("author") or []
+	if isinstance(authors, list):
+		# CSL-JSON
+		authors = join_authors(
+			f"{author.get('family', '')}, {author['given']}" if author.get("given")
+			else author.get("family") or author.get("name", "")
+			for author in authors if isinstance(author, dict)
+		)
+	if record.get("authorships"):
+		# OpenAlex
+		authors = join_authors(
+			(authorship.get("author") or {}).get("display_name", "") for authorship in record["authorships"]
+		)
+	fields["author"] = authors
+
+	venue = record.get("container-title") or record.get("journal") or record.get("booktitle") or ""
+	if not venue and isinstance(record.get("primary_location"), dict):
+		venue = ((record["primary_location"].get("source") or {}).get("display_name")) or ""
+	fields["journal"] = venue[0] if isinstance(venue, list) and venue else venue
+
+	year = record.get("publication_year") or record.get("year") or ""
+	for date_field in ["issued", "published-print", "published-online", "published"]:
+		if not year and isinstance(record.get(date_field), dict):
+			date_parts = record[date_field].get("date-parts") or [[]]
+			year = date_parts[0][0] if date_parts and date_parts[0] else ""
+	fields["year"] = str(year)
+
+	abstract = record.get("abstract") or ""
+	if not abstract and isinstance(record.get("abstract_inverted_index"), dict):
+		# OpenAlex keeps the positions of each word
+		positions = {
+			position: word
+			for word, word_positions in record["abstract_inverted_index"].items() for position in word_positions
+		}
+		abstract = " ".join(positions[position] for position in sorted(positions))
+	fields["abstract"] = re.sub(r'<[^>]+>', '', abstract).strip()
+
+	keywords = record.get("keywords") or record.get("keyword") or record.get("subject") or []
+	if isinstance(keywords, str):
+		keywords = re.split(r'[,;]', keywords)
+	fields["keywords"] = "; ".join(
+		(keyword.get("display_name") or keyword.get("keyword") or "") if isinstance(keyword, dict) else str(keyword)
+		for keyword in keywords
+	)
+
+	for name, synonyms in [("volume", ["volume"]), ("number", ["issue", "number"]), ("publisher", ["publisher"]),
+						   ("url", ["URL", "url"])]:
+		value = next((record[synonym] for synonym in synonyms if isinstance(record.get(synonym), (str, int))), "")
+		fields[name] = str(value)
+
+	return {name: " ".join(value.split()) for name, value in fields.items() if value and value.strip()}
+
+
+def json_entry(record: dict, default_key: str) -> BibTeXEntry:
+	"""
+	:param record: see `read_json_record`
+	:param default_key: the key of the entry if the record has no DOI
+	"""
+	fields = read_json_record(record)
+	entry_type = document_type(str(record.get("type") or record.get("ENTRYTYPE") or ""), "article")
+	if entry_type == "inproceedings" and "journal" in fields:
+		fields["booktitle"] = fields.pop("journal")
+	return BibTeXEntry(entry_type=entry_type, key=fields.get("doi") or default_key, fields=fields)
+
+
+def read_jsonl(chunks: Iterable[str]) -> Iterator[BibTeXEntry]:
+	"""
+	:param chunks: the text of a file with one JSON record per line
+	"""
+	for number, line in enumerate(iter_lines(chunks), start=1):
+		line = line.strip()
+		if not line:
+			continue
+		try:
+			record = json.loads(line)
+		except json.JSONDecodeError as e:
+			print(f"line {number} is not json: {e}")
+			continue
+		if not isinstance(record, dict):
+			continue
+
+		yield json_entry(record, f"jsonl-{number}")
+
+
+# the readers of each format, by the extension of the file
+READERS: Dict[str, Callable[[Iterable[str]], Iterator[BibTeXEntry]]] = {
+	"bib": read_bibtex,
+	"ris": read_ris,
+	"csv": read_csv,
+	"tsv": read_csv,
+	"txt": read_csv,
+	"jsonl": read_jsonl,
+	"ndjson": read_jsonl,
+}
+
+# the kind of the import jobs of each format, see IMPORT_JOB_KINDS
+FORMAT_KINDS = {
+	"bib": "B",
+	"ris": "R",
+	"csv": "C",
+	"tsv": "C",
+	"txt": "C",
+	"jsonl": "J",
+	"ndjson": "J",
+}
+
+
+def get_format(file_name: str, file_format: None | str = None) -> None | str:
+	"""
+	:param file_name: e.g. "scopus.csv"
+	:param file_format: overrides the extension of the file, e.g. "ris"
+	:return: the format (a key of READERS), None if it is not known
+	"""
+	if not file_format:
+		file_format = file_name.rsplit('.', 1)[-1] if '.' in file_name else ""
+	file_format = file_format.lower()
+	return file_format if file_format in READERS else None
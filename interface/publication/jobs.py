@@ -0,0 +1,145 @@
+import os
+import socket
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.utils import timezone
+
+from .bibtex import BibTeXEntry
+from .models import ImportJob
+from .parsers import normalize_doi, normalize_doi_list, normalize_extra_infos
+
+
+def worker_name() -> str:
+	return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_import_job(publication_list, reviewer, kind: str, doi_list: List[str], extra_infos: None | dict = None,
+		entries: None | List[dict] = None) -> ImportJob:
+	"""
+	Stores an import to be processed by the `run_import_jobs` worker. If the imports are not run in the background
+	(`IMPORT_JOBS_IN_BACKGROUND`), the job is processed right away.
+	:param publication_list: the list which receives the publications
+	:param reviewer: the reviewer who started the import
+	:param kind: see IMPORT_JOB_KINDS
+	:param doi_list: the DOIs to be imported, they are normalized and the duplicates are skipped
+	:param extra_infos: e.g. {doi: {"abstract": "...", "keywords_list": ["...", ...]}}
+	:param entries: BibTeX entries (see `BibTeXEntry`) which are imported from their own fields
+	:return: the job
+	"""
+	doi_list = normalize_doi_list(doi_list)
+	job = ImportJob.objects.create(
+		kind=kind,
+		publication_list=publication_list,
+		reviewer=reviewer,
+		payload={"doi_list": doi_list, "extra_infos": normalize_extra_infos(extra_infos or {}), "entries": entries or []},
+		total=len(doi_list) + len(entries or []),
+	)
+
+	if not getattr(settings, "IMPORT_JOBS_IN_BACKGROUND", True):
+		if claim_import_job(job.id, worker_name()):
+			job.refresh_from_db()
+			run_import_job(job)
+
+	return job
+
+
+def claim_import_job(job_id: int, worker: str) -> bool:
+	"""
+	Marks a pending job as running. Only one worker succeeds, as the status is checked and changed by a single query.
+	:return: True if the job was claimed by this worker
+	"""
+	return ImportJob.objects.filter(id=job_id, status="P").update(
+		status="R", worker=worker, started_at=timezone.now(), updated_at=timezone.now()) == 1
+
+
+def claim_next_import_job(worker: str) -> None | ImportJob:
+	"""
+	:return: the oldest pending job, claimed for the given worker, or None if there is none
+	"""
+	for job_id in ImportJob.objects.filter(status="P").order_by("created_at", "id").values_list("id", flat=True):
+		if claim_import_job(job_id, worker):
+			return ImportJob.objects.get(id=job_id)
+	return None
+
+
+def requeue_stale_import_jobs(timeout: int) -> int:
+	"""
+	Puts the running jobs back to the queue if their worker has not reported any progress for a while, e.g. because
+	it was stopped. They continue where they stopped.
+	:param timeout: seconds without progress
+	:return: the number of jobs put back
+	"""
+	return ImportJob.objects.filter(status="R", updated_at__lt=timezone.now() - timedelta(seconds=timeout)) \
+		.update(status="P", worker="", updated_at=timezone.now())
+
+
+def run_import_job(job: ImportJob, chunk_size: None | int = None) -> ImportJob:
+	"""
+	Imports the DOIs and then the BibTeX entries of a claimed job in chunks. The publications of each chunk are added to the publication list
+	as soon as they are stored, and the counters are saved, so the progress can be followed and a stopped job
+	continues after the last finished chunk.
+	:param job: a running job
+	:param chunk_size: the number of DOIs resolved together, `IMPORT_JOB_CHUNK_SIZE` by default
+	:return: the finished job
+	"""
+	# from local app
+	from .views import get_publications_by_bibtex_entries, get_publications_by_list_of_doi_list, store_publications
+	# from other apps
+	from mapping.propagation import deferred_propagation
+
+	if chunk_size is None:
+		chunk_size = getattr(settings, "IMPORT_JOB_CHUNK_SIZE", 50)
+	chunk_size = max(chunk_size, 1)
+
+	doi_list = job.payload.get("doi_list", [])
+	extra_infos = job.payload.get("extra_infos") or {}
+	entries = job.payload.get("entries") or []
+	items = [("doi", doi) for doi in doi_list] + [("entry", entry) for entry in entries]
+	entry_options = {}
+	if job.kind == "W":
+		# the results of a web search, CrossRef only fills the gaps
+		entry_options = {
+			"crossref_fields": getattr(settings, "WEB_IMPORT_CROSSREF_FIELDS", ["abstract"]),
+			"source_name": "Web search",
+		}
+
+	# the automated lists which follow the list are updated once, with all the imported publications
+	with deferred_propagation():
+		try:
+			for start in range(job.processed, len(items), chunk_size):
+				chunk = items[start:start + chunk_size]
+				chunk_dois = [doi for kind, doi in chunk if kind == "doi"]
+				chunk_entries = [BibTeXEntry(**entry) for kind, entry in chunk if kind == "entry"]
+				chunk_infos = {doi: extra_infos[doi] for doi in chunk_dois if doi in extra_infos}
+
+				publications = get_publications_by_list_of_doi_list(chunk_dois, chunk_infos if chunk_infos else None) \
+					if chunk_dois else []
+				found = {normalize_doi(publication.doi) for publication in publications}
+				not_found = [doi for doi in chunk_dois if doi not in found]
+
+				if chunk_entries:
+					entry_publications = get_publications_by_bibtex_entries(chunk_entries, **entry_options)
+					publications += entry_publications.values()
+					not_found += [entry.key for entry in chunk_entries if entry.key not in entry_publications]
+
+				store_publications(publications, job.publication_list)
+				job.resolved += len(chunk) - len(not_found)
+				job.failed += len(not_found)
+				if not_found:
+					job.errors += "".join(f"cannot import {item}\n" for item in not_found)
+				job.save(update_fields=["resolved", "failed", "errors", "updated_at"])
+
+			job.status = "D"
+
+		except Exception as e:
+			print(f"import job {job.id} failed: {e}")
+			job.status = "F"
+			job.errors += f"{e}\n"
+
+	job.finished_at = timezone.now()
+	# the list (and its jobs) may have been deleted meanwhile
+	ImportJob.objects.filter(id=job.id).update(
+		status=job.status, errors=job.errors, finished_at=job.finished_at, updated_at=job.finished_at)
+	return job
@@ -0,0 +1,174 @@
+import csv
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from publication.bibtex import build_record, decode_chunks
+from publication.importers import READERS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measures the throughput of the library importers (BibTeX, RIS, CSV, JSONL) over synthetic files."
+
+    formats = ["bib", "ris", "csv", "jsonl"]
+    types = [("article", "JOUR", "Article", "journal-article"), ("inproceedings", "CONF", "Conference Paper",
+                                                                   "proceedings-article")]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=50000, help="records of each synthetic file")
+        parser.add_argument("--formats", nargs="+", default=Command.formats, choices=Command.formats)
+        parser.add_argument("--chunk-size", type=int, default=64 * 1024, help="bytes read at once")
+        parser.add_argument("--persist", action="store_true",
+                            help="also store the publications, in a transaction which is rolled back")
+        parser.add_argument("--keep", default=None, help="a folder where the synthetic files are kept")
+
+    def handle(self, *args, **options):
+        if options["records"] < 1:
+            raise CommandError("--records should be positive")
+
+        folder = Path(options["keep"]) if options["keep"] else Path(tempfile.mkdtemp(prefix="robin_import_"))
+        folder.mkdir(parents=True, exist_ok=True)
+
+        for file_format in options["formats"]:
+            path = folder / f"synthetic.{file_format}"
+            started = time.perf_counter()
+            self.write_file(path, file_format, options["records"])
+            self.stdout.write(f"{file_format}: generated {path} ({path.stat().st_size / 1e6:.1f} MB) "
+                              f"in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            entries = 0
+            broken = 0
+            for entry in READERS[file_format](decode_chunks(self.read_chunks(path, options["chunk_size"]))):
+                entries += 1
+                if build_record(entry).error:
+                    broken += 1
+            read_time = time.perf_counter() - started
+            self.stdout.write(f"{file_format}: read {entries} records ({broken} incomplete) in {read_time:.2f}s, "
+                              f"{entries / read_time:.0f} records/s, {path.stat().st_size / 1e6 / read_time:.1f} MB/s")
+
+            if options["persist"]:
+                self.persist(path, file_format, options["chunk_size"])
+
+        if not options["keep"]:
+            for path in folder.iterdir():
+                path.unlink()
+            folder.rmdir()
+
+    def persist(self, path: Path, file_format: str, chunk_size: int) -> None:
+        # from local app
+        from publication.views import get_publications_by_bibtex_entries
+
+        batch_size = getattr(settings, "BIBTEX_IMPORT_BATCH_SIZE", 1000)
+        started = time.perf_counter()
+        stored = 0
+        try:
+            with transaction.atomic():
+                batch = []
+                for entry in READERS[file_format](decode_chunks(self.read_chunks(path, chunk_size))):
+                    batch.append(entry)
+                    if len(batch) >= batch_size:
+                        stored += len(get_publications_by_bibtex_entries(batch, max_workers=1))
+                        batch = []
+                if batch:
+                    stored += len(get_publications_by_bibtex_entries(batch, max_workers=1))
+                raise Rollback()
+        except Rollback:
+            pass
+
+        persist_time = time.perf_counter() - started
+        self.stdout.write(f"{file_format}: read and stored {stored} records in {persist_time:.2f}s, "
+                          f"{stored / persist_time:.0f} records/s (rolled back)")
+
+    @staticmethod
+    def read_chunks(path: Path, chunk_size: int):
+        with open(path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+    def synthetic_records(self, records: int):
+        generator = random.Random(records)
+        words = ["adaptive", "architecture", "mapping", "study", "systems", "learning", "software", "self",
+                 "quality", "testing", "evolution", "microservices", "energy", "digital", "twin", "robotics"]
+        for i in range(records):
+            entry_type, ris_type, csv_type, json_type = Command.types[i % 2]
+            title = " ".join(generator.choice(words) for _ in range(8)).capitalize() + f" {i}"
+            yield {
+                "key": f"record{i}",
+                "types": (entry_type, ris_type, csv_type, json_type),
+                "title": title,
+                "authors": [(f"Last{generator.randrange(records // 4 + 1)}", f"First{generator.randrange(500)}")
+                            for _ in range(generator.randint(1, 6))],
+                "venue": f"Venue {generator.randrange(300)}",
+                "year": str(generator.randint(1990, 2024)),
+                "doi": f"10.5555/synthetic.{i}" if i % 10 else "",
+                "abstract": " ".join(generator.choice(words) for _ in range(generator.randint(80, 200))),
+                "keywords": list({generator.choice(words) for _ in range(4)}),
+                "volume": str(generator.randint(1, 60)),
+                "number": str(generator.randint(1, 12)),
+            }
+
+    def write_file(self, path: Path, file_format: str, records: int) -> None:
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            if file_format == "csv":
+                writer = csv.writer(file)
+                writer.writerow(["Authors", "Title", "Year", "Source title", "Volume", "Issue", "DOI", "Abstract",
+                                 "Author Keywords", "Document Type"])
+
+            for record in self.synthetic_records(records):
+                entry_type, ris_type, csv_type, json_type = record["types"]
+                if file_format == "bib":
+                    venue_field = "journal" if entry_type == "article" else "booktitle"
+                    authors = " and ".join(f"{last}, {first}" for last, first in record["authors"])
+                    file.write(
+                        f"@{entry_type}{{{record['key']},\n"
+                        f"  title = {{{record['title']}}},\n"
+                        f"  author = {{{authors}}},\n"
+                        f"  {venue_field} = {{{record['venue']}}},\n"
+                        f"  year = {{{record['year']}}},\n"
+                        f"  volume = {{{record['volume']}}},\n"
+                        f"  number = {{{record['number']}}},\n"
+                        f"  doi = {{{record['doi']}}},\n"
+                        f"  abstract = {{{record['abstract']}}},\n"
+                        f"  keywords = {{{', '.join(record['keywords'])}}}\n"
+                        f"}}\n\n"
+                    )
+                elif file_format == "ris":
+                    file.write(f"TY  - {ris_type}\n")
+                    for last, first in record["authors"]:
+                        file.write(f"AU  - {last}, {first}\n")
+                    file.write(f"TI  - {record['title']}\nT2  - {record['venue']}\nPY  - {record['year']}\n"
+                               f"VL  - {record['volume']}\nIS  - {record['number']}\nDO  - {record['doi']}\n"
+                               f"AB  - {record['abstract']}\n")
+                    for keyword in record["keywords"]:
+                        file.write(f"KW  - {keyword}\n")
+                    file.write("ER  - \n\n")
+                elif file_format == "csv":
+                    writer.writerow([
+                        ", ".join(f"{last} {first[0]}." for last, first in record["authors"]), record["title"],
+                        record["year"], record["venue"], record["volume"], record["number"], record["doi"],
+                        record["abstract"], "; ".join(record["keywords"]), csv_type,
+                    ])
+                elif file_format == "jsonl":
+                    file.write(json.dumps({
+                        "type": json_type,
+                        "title": [record["title"]],
+                        "author": [{"family": last, "given": first} for last, first in record["authors"]],
+                        "container-title": [record["venue"]],
+                        "issued": {"date-parts": [[int(record["year"])]]},
+                        "volume": record["volume"],
+                        "issue": record["number"],
+                        "DOI": record["doi"],
+                        "abstract": record["abstract"],
+                        "subject": record["keywords"],
+                    }) + "\n")
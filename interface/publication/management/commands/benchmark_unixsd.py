@@ -0,0 +1,127 @@
+import json
+import time
+from dataclasses import asdict
+from pathlib import Path
+import xml.etree.ElementTree as eT
+
+from django.core.management.base import BaseCommand, CommandError
+
+from publication.extractors import CrossRefRecord, UnixsdExtractor
+
+
+# recorded responses of CrossRef, with the records which the parser before `UnixsdExtractor` made of them
+# in baseline.json (null for a response which it rejected)
+CORPUS = Path(__file__).resolve().parents[2] / "fixtures" / "unixsd"
+
+
+def record_as_baseline(record: CrossRefRecord) -> None | dict:
+    """
+    :return: the fields of the record which are compared with the baseline, None if the record cannot be used
+    """
+    if record.error:
+        return None
+
+    return {
+        "title": record.title,
+        "year": record.year,
+        "abstract": record.abstract,
+        "venue": asdict(record.venue),
+        "authors": [asdict(author) for author in record.authors],
+        "full_texts": [asdict(full_text) for full_text in record.full_texts],
+    }
+
+
+class Command(BaseCommand):
+    help = "Measures the extraction of CrossRef unixsd records over a corpus of recorded xml responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=[str(CORPUS)],
+                            help="xml files, or folders which are searched for *.xml files (the recorded corpus "
+                                 "by default)")
+        parser.add_argument("--repeat", type=int, default=5, help="how many times the corpus is extracted")
+        parser.add_argument("--check", action="store_true",
+                            help="compares the records with the baseline.json of their folder, fails on a difference")
+
+    def handle(self, *args, **options):
+        corpus = []
+        for path in map(Path, options["paths"]):
+            files = sorted(path.rglob("*.xml")) if path.is_dir() else [path]
+            for file in files:
+                corpus.append((file, file.read_text(encoding="utf-8")))
+
+        if not corpus:
+            raise CommandError("no xml responses were found")
+
+        read_time = extract_time = 0.0
+        failed = {}
+        records = {}
+        slowest = (0.0, None)
+        for _ in range(max(options["repeat"], 1)):
+            for file, text in corpus:
+                started = time.perf_counter()
+                try:
+                    root = eT.fromstring(text)
+                except eT.ParseError as e:
+                    failed[file] = f"error reading from xml: {e}"
+                    continue
+                read = time.perf_counter()
+                record = UnixsdExtractor(file.stem).extract(root)
+                extracted = time.perf_counter()
+
+                read_time += read - started
+                extract_time += extracted - read
+                slowest = max(slowest, (extracted - read, file), key=lambda item: item[0])
+                records[file] = record
+                if record.error:
+                    failed[file] = record.error
+
+        extracted_records = len(corpus) * max(options["repeat"], 1)
+        total_time = read_time + extract_time
+        self.stdout.write(f"records:          {len(corpus)} x {max(options['repeat'], 1)}")
+        self.stdout.write(f"xml reading:      {read_time:0.3f}s")
+        self.stdout.write(f"extraction:       {extract_time:0.3f}s "
+                          f"({1000 * extract_time / extracted_records:0.3f}ms per record)")
+        self.stdout.write(f"throughput:       {extracted_records / total_time if total_time else 0:0.1f} records/s")
+        if slowest[1] is not None:
+            self.stdout.write(f"slowest record:   {slowest[1]} ({1000 * slowest[0]:0.3f}ms)")
+        for file, error in failed.items():
+            self.stdout.write(self.style.WARNING(f"{file}: {error}"))
+
+        if options["check"]:
+            differences = self.compare_with_baseline(records)
+            for difference in differences:
+                self.stdout.write(self.style.ERROR(difference))
+            if differences:
+                raise CommandError(f"{len(differences)} records differ from the baseline")
+            self.stdout.write(self.style.SUCCESS(f"{len(records)} records are equal to the baseline"))
+
+    @staticmethod
+    def compare_with_baseline(records: dict) -> list[str]:
+        """
+        :param records: xml file -> its extracted record
+        :return: a description of each record which differs from the baseline.json of its folder
+        """
+        baselines = {}
+        differences = []
+        for file, record in records.items():
+            if file.parent not in baselines:
+                baseline_file = file.parent / "baseline.json"
+                baselines[file.parent] = json.loads(baseline_file.read_text(encoding="utf-8")) \
+                    if baseline_file.exists() else {}
+
+            baseline = baselines[file.parent]
+            if file.name not in baseline:
+                differences.append(f"{file}: no baseline is recorded")
+                continue
+
+            expected = baseline[file.name]
+            actual = record_as_baseline(record)
+            if expected is None or actual is None:
+                if expected != actual:
+                    differences.append(f"{file}: expected {expected}, extracted {actual} ({record.error})")
+                continue
+
+            for key in expected:
+                if expected[key] != actual.get(key):
+                    differences.append(f"{file}: {key} is {actual.get(key)!r} instead of {expected[key]!r}")
+        return differences
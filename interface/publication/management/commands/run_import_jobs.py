@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from publication.http_client import get_http_client
+from publication.jobs import claim_next_import_job, requeue_stale_import_jobs, run_import_job, worker_name
+
+
+class Command(BaseCommand):
+    help = "Processes the queued imports of publications. Several workers may run at the same time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="stop when the queue is empty")
+        parser.add_argument("--sleep", type=float, default=2.0, help="seconds to wait when the queue is empty")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="DOIs resolved together, IMPORT_JOB_CHUNK_SIZE by default")
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        stale_timeout = getattr(settings, "IMPORT_JOB_STALE_TIMEOUT", 15 * 60)
+        self.stdout.write(f"worker {worker} is waiting for import jobs")
+
+        try:
+            while True:
+                requeued = requeue_stale_import_jobs(stale_timeout)
+                if requeued:
+                    self.stdout.write(f"{requeued} stale job(s) put back to the queue")
+
+                job = claim_next_import_job(worker)
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+
+                self.stdout.write(f"job {job.id}: importing {job.pending} of {job.total} DOIs "
+                                  f"into '{job.publication_list.name}'")
+                started = time.perf_counter()
+                # the requests of this job only, the worker runs one job at a time
+                get_http_client().reset_stats()
+                job = run_import_job(job, options["chunk_size"])
+                self.stdout.write(f"job {job.id}: {job.get_status_display().lower()} in "
+                                  f"{time.perf_counter() - started:.1f}s, "
+                                  f"{job.resolved} resolved, {job.failed} failed")
+                for host, stats in get_http_client().stats().items():
+                    self.stdout.write(f"  {host}: {stats['requests']} requests, {stats['errors']} errors, "
+                                      f"{stats['throttled']} throttled, "
+                                      f"{stats['average_latency']:.2f}s average / {stats['max_latency']:.2f}s max "
+                                      f"latency, {stats['rate_limit_wait']:.1f}s waited for the rate limit")
+        except KeyboardInterrupt:
+            self.stdout.write(f"worker {worker} stopped")
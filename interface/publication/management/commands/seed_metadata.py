@@ -0,0 +1,115 @@
+import gzip
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from publication.importers import json_entry
+from publication.models import MetadataDump, MetadataRecord
+from publication.parsers import is_doi, normalize_doi
+
+
+class Command(BaseCommand):
+    help = "Loads a local CrossRef or OpenAlex dump (JSON lines, optionally gzipped) into the metadata store, " \
+           "which is used to resolve DOIs without dx.doi.org. An interrupted load continues where it stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="a .jsonl or .jsonl.gz file, one work per line")
+        parser.add_argument("--batch-size", type=int, default=5000, help="records written by one query")
+        parser.add_argument("--restart", action="store_true", help="load the file from its beginning")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"]).resolve()
+        if not path.is_file():
+            raise CommandError(f"{path} is not a file")
+        batch_size = max(options["batch_size"], 1)
+
+        stat = path.stat()
+        dump, created = MetadataDump.objects.get_or_create(path=str(path))
+        if options["restart"] or dump.size != stat.st_size or dump.modified_at != stat.st_mtime:
+            if not created:
+                self.stdout.write(f"{path} is loaded from its beginning")
+            dump.size = stat.st_size
+            dump.modified_at = stat.st_mtime
+            dump.offset = dump.lines = dump.rows = 0
+            dump.finished = False
+            dump.save()
+        elif dump.finished:
+            self.stdout.write(f"{path} is already loaded ({dump.rows} rows), use --restart to load it again")
+            return
+        elif dump.offset:
+            self.stdout.write(f"continuing {path} from line {dump.lines} ({dump.rows} rows)")
+
+        opener = gzip.open if path.suffix == ".gz" else open
+        started = time.perf_counter()
+        rows = 0
+        with opener(path, "rb") as file:
+            # the offset is counted in the uncompressed data, gzip files are decompressed up to it
+            file.seek(dump.offset)
+            batch = {}
+            for line in file:
+                dump.offset += len(line)
+                dump.lines += 1
+                for record in self.read_line(line, dump.lines):
+                    batch[record.doi] = record
+
+                if len(batch) >= batch_size:
+                    rows += self.write(dump, batch)
+                    batch = {}
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"{dump.lines} lines, {dump.rows} rows, {rows / elapsed:.0f} rows/s")
+
+            rows += self.write(dump, batch, finished=True)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"loaded {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s), "
+            f"{MetadataRecord.objects.count()} DOIs are in the metadata store"
+        ))
+
+    def read_line(self, line: bytes, number: int) -> list:
+        line = line.strip()
+        if not line:
+            return []
+
+        try:
+            work = json.loads(line)
+        except ValueError as e:
+            self.stderr.write(f"line {number} is not json: {e}")
+            return []
+
+        # some dumps keep a page of works in each line
+        works = work.get("items", [work]) if isinstance(work, dict) else []
+        if isinstance(works, dict):
+            works = works.get("items", [])
+
+        records = []
+        for work in works:
+            if not isinstance(work, dict):
+                continue
+            entry = json_entry(work, "")
+            doi = normalize_doi(entry.fields.pop("doi", ""))
+            if is_doi(doi):
+                records.append(MetadataRecord(doi=doi, entry_type=entry.entry_type, fields=entry.fields))
+        return records
+
+    @staticmethod
+    def write(dump: MetadataDump, batch: dict, finished: bool = False) -> int:
+        """
+        Inserts or updates the records of a batch and saves the offset within the same transaction, so the
+        batch is either loaded and skipped next time, or not loaded at all.
+        :return: the number of written rows
+        """
+        with transaction.atomic():
+            for record in batch.values():
+                record.dump = dump
+            MetadataRecord.objects.bulk_create(
+                batch.values(), update_conflicts=True, unique_fields=["doi"],
+                update_fields=["entry_type", "fields", "dump"],
+            )
+            dump.rows += len(batch)
+            dump.finished = finished
+            dump.save()
+        return len(batch)
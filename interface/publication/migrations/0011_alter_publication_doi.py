@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publication', '0010_importjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='publication',
+            name='doi',
+            field=models.CharField(blank=True, max_length=1024, null=True, unique=True),
+        ),
+    ]
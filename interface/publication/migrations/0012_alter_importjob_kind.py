@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publication', '0011_alter_publication_doi'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='kind',
+            field=models.CharField(choices=[('D', 'DOI list'), ('B', 'BibTeX'), ('R', 'RIS'), ('C', 'CSV'), ('J', 'JSONL'), ('W', 'Web search')], default='D', max_length=1),
+        ),
+    ]
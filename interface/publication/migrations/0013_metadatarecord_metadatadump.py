@@ -0,0 +1,38 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publication', '0012_alter_importjob_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadataDump',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=2048, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('modified_at', models.FloatField(default=0)),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('lines', models.PositiveBigIntegerField(default=0)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetadataRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doi', models.CharField(max_length=1024, unique=True)),
+                ('entry_type', models.CharField(max_length=32)),
+                ('fields', models.JSONField(default=dict)),
+                ('dump', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='records', to='publication.metadatadump')),
+            ],
+        ),
+    ]
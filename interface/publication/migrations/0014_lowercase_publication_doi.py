@@ -0,0 +1,73 @@
+# DOIs are case-insensitive and normalize_doi keeps them in lower case, the older publications kept the case given
+# by CrossRef. The publications which differ only by the case of their DOI are merged into the oldest one.
+
+from django.db import migrations
+from django.db.models.functions import Lower
+
+
+def merge_publication(Publication, duplicate, kept) -> None:
+    """
+    Moves the authors, keywords and the references of the other models (lists, review values, comments, full texts,
+    queries) from the duplicate to the kept publication and deletes the duplicate. What the kept publication has
+    already is not duplicated.
+    """
+    throughs = [field.remote_field.through for field in Publication._meta.many_to_many] + \
+        [relation.through for relation in Publication._meta.related_objects if relation.many_to_many]
+    for through in throughs:
+        publication_field = next(
+            field.name for field in through._meta.fields
+            if field.is_relation and field.related_model is Publication
+        )
+        other_field = next(
+            field.name for field in through._meta.fields
+            if field.is_relation and field.related_model is not Publication
+        )
+        kept_rows = through.objects.filter(**{publication_field: kept})
+        existing = set(kept_rows.values_list(f"{other_field}_id", flat=True))
+        through.objects.filter(**{publication_field: duplicate, f"{other_field}_id__in": existing}).delete()
+        through.objects.filter(**{publication_field: duplicate}).update(**{publication_field: kept})
+
+    for relation in Publication._meta.related_objects:
+        if relation.many_to_many:
+            continue
+        related = relation.related_model.objects
+        if {"review_field", "reviewer"} <= {field.name for field in relation.related_model._meta.fields}:
+            # a review value of the kept publication wins over the one of the duplicate, codes are merged
+            key = ["review_field_id", "reviewer_id"]
+            if relation.related_model._meta.model_name == "reviewfieldvaluecoding":
+                key.append("value")
+            existing = set(related.filter(**{relation.field.name: kept}).values_list(*key))
+            related.filter(id__in=[
+                row[0] for row in related.filter(**{relation.field.name: duplicate}).values_list("id", *key)
+                if row[1:] in existing
+            ]).delete()
+        related.filter(**{relation.field.name: duplicate}).update(**{relation.field.name: kept})
+    duplicate.delete()
+
+
+def lowercase_doi(apps, schema_editor):
+    Publication = apps.get_model('publication', 'Publication')
+
+    kept = {}
+    for publication in Publication.objects.exclude(doi=None).exclude(doi="").order_by("id"):
+        lower_doi = publication.doi.lower()
+        if lower_doi in kept:
+            merge_publication(Publication, publication, kept[lower_doi])
+        else:
+            kept[lower_doi] = publication
+
+    Publication.objects.exclude(doi=None).update(doi=Lower("doi"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publication', '0013_metadatarecord_metadatadump'),
+        # the lists, review values and comments which refer to the merged publications
+        ('mapping', '0011_mapping_lists_version'),
+        ('query', '0004_queryplatform_rate_limit'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_doi, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,5 @@
 from django.db import models
-from .constants import FULL_TEXT_TYPES, FULL_TEXT_STATUS, VENUE_TYPES
+from .constants import FULL_TEXT_TYPES, FULL_TEXT_STATUS, VENUE_TYPES, IMPORT_JOB_KINDS, IMPORT_JOB_STATUS
 
 
 class Source(models.Model):
@@ -104,7 +104,7 @@ class Publication(models.Model):
     source = models.ForeignKey(Source, on_delete=models.SET_NULL, null=True)
 
     abstract = models.TextField(blank=True)
-    doi = models.CharField(max_length=1024, unique=True)
+    doi = models.CharField(max_length=1024, unique=True, null=True, blank=True)   # publications from BibTeX may have none
 
     def __str__(self) -> str:
         return f"{self.title}, {self.id}"
@@ -133,4 +133,90 @@ class FullTextAccess(models.Model):
         super().delete(using=using, keep_parents=keep_parents)
 
     def __str__(self):
-        return f"{self.id} {self.full_text} for {self.mapping} is {self.get_status_display()}"
\ No newline at end of file
+        return f"{self.id} {self.full_text} for {self.mapping} is {self.get_status_display()}"
+
+
+class ImportJob(models.Model):
+    """
+        An import of publications into a publication list, which is processed by the `run_import_jobs` worker
+        outside of the HTTP request. The payload keeps the DOIs and the extra information that came with them, the
+        counters report the progress.
+    """
+    kind = models.CharField(max_length=1, choices=IMPORT_JOB_KINDS, default="D")
+    status = models.CharField(max_length=1, choices=IMPORT_JOB_STATUS, default="P")
+    publication_list = models.ForeignKey("mapping.PublicationList", on_delete=models.CASCADE, related_name="import_jobs")
+    reviewer = models.ForeignKey("reviewer.Reviewer", on_delete=models.CASCADE, related_name="import_jobs")
+    payload = models.JSONField(default=dict)                            # {"doi_list": [...], "extra_infos": {...}}
+
+    total = models.PositiveIntegerField(default=0)
+    resolved = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def processed(self) -> int:
+        return self.resolved + self.failed
+
+    @property
+    def pending(self) -> int:
+        return max(self.total - self.processed, 0)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ["P", "R"]
+
+    def progress(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.get_kind_display(),
+            "status": self.get_status_display(),
+            "total": self.total,
+            "resolved": self.resolved,
+            "failed": self.failed,
+            "pending": self.pending,
+            "errors": self.errors,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def __str__(self):
+        return f"{self.id} {self.get_kind_display()} into {self.publication_list} is {self.get_status_display()}"
+
+
+class MetadataRecord(models.Model):
+    """
+        The metadata of a DOI from a local dump of CrossRef or OpenAlex (see the `seed_metadata` command), so the DOI
+        can be resolved without dx.doi.org. The fields are kept in the BibTeX form (see `BibTeXEntry`).
+    """
+    doi = models.CharField(max_length=1024, unique=True)                # normalized
+    entry_type = models.CharField(max_length=32)                        # e.g. "article"
+    fields = models.JSONField(default=dict)                             # {"title": "...", "author": "...", ...}
+    dump = models.ForeignKey("MetadataDump", on_delete=models.SET_NULL, null=True, blank=True, related_name="records")
+
+    def __str__(self):
+        return f"{self.doi} ({self.entry_type})"
+
+
+class MetadataDump(models.Model):
+    """
+        A dump which has been (or is being) loaded into the metadata records. The offset is saved with each batch,
+        so an interrupted load continues where it stopped.
+    """
+    path = models.CharField(max_length=2048, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    modified_at = models.FloatField(default=0)                         # mtime of the file, a change restarts the load
+    offset = models.PositiveBigIntegerField(default=0)                 # of the uncompressed data
+    lines = models.PositiveBigIntegerField(default=0)
+    rows = models.PositiveBigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path}: {self.rows} rows{'' if self.finished else ', unfinished'}"
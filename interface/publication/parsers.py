@@ -1,14 +1,16 @@
-from typing import List, Any
+from typing import List, Any, Iterable
 import re
+from urllib.parse import unquote
 
-import requests
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
-from django.db.models import Model
 from requests import Response
 import xml.etree.ElementTree as eT
 
-from .constants import FULL_TEXT_TYPES_REVERSE
+from .cache import CachedResponse, crossref_cache
+from .extractors import CrossRefRecord, UnixsdExtractor
+from .http_client import get_http_client
 from .models import Source, Country, Affiliation, Author, Venue, Keyword, Publication, FullText
 
 
@@ -44,13 +46,111 @@ ARTICLE_TYPES = {
 }
 
 
+class EntityCache:
+	"""
+		An identity map of the entities used during one import batch. The candidates are loaded in bulk (`__in`
+		queries) and every later lookup of the same entity returns the same model instance, without a query.
+		Entities which do not exist are remembered too, and the instances created in the batch replace them.
+	"""
+	# the fields which identify an entity, the same as used by `GenericModelFactory.find_object`
+	lookup_fields = {
+		Source: ["name"],
+		Country: ["name"],
+		Venue: ["name"],
+		Affiliation: ["institute"],
+		Author: ["last_name", "first_name"],
+		Keyword: ["name"],
+		Publication: ["doi"],
+	}
+	chunk_size = 500
+
+	def __init__(self) -> None:
+		self.instances = {model: {} for model in EntityCache.lookup_fields}
+
+	@staticmethod
+	def key(model: type(models.Model), data: dict) -> None | tuple:
+		if model not in EntityCache.lookup_fields:
+			return None
+		return tuple(data[field] for field in EntityCache.lookup_fields[model])
+
+	def lookup(self, model: type(models.Model), data: dict) -> (bool, None | models.Model):
+		"""
+		:return: whether the entity is known to the cache, and its instance (None if it does not exist)
+		"""
+		key = EntityCache.key(model, data)
+		if key is None or key not in self.instances[model]:
+			return False, None
+		return True, self.instances[model][key]
+
+	def remember(self, model: type(models.Model), data: dict, instance: None | models.Model) -> None:
+		key = EntityCache.key(model, data)
+		if key is not None:
+			self.instances[model][key] = instance
+
+	def preload(self, model: type(models.Model), keys: Iterable[tuple]) -> None:
+		"""
+		Loads the entities with the given keys (values of `lookup_fields`) using as few queries as possible.
+		"""
+		fields = EntityCache.lookup_fields[model]
+		known = self.instances[model]
+		wanted = {tuple(key) for key in keys} - set(known)
+		if not wanted:
+			return
+
+		first_values = list({key[0] for key in wanted})
+		for i in range(0, len(first_values), EntityCache.chunk_size):
+			candidates = model.objects.filter(**{f"{fields[0]}__in": first_values[i:i + EntityCache.chunk_size]})
+			for instance in candidates.order_by("id"):
+				key = tuple(getattr(instance, field) for field in fields)
+				if key in wanted and key not in known:
+					known[key] = instance
+
+		for key in wanted:
+			known.setdefault(key, None)
+
+	def preload_records(self, records: Iterable[CrossRefRecord]) -> None:
+		"""
+		Loads all entities which are referenced by the given (extracted) CrossRef records.
+		"""
+		records = [record for record in records if record is not None and not record.error]
+		countries, institutes, authors, venues = set(), set(), set(), set()
+		for record in records:
+			if record.venue is not None:
+				venues.add((record.venue.name,))
+			for author in record.authors:
+				authors.add((author.last_name, author.first_name))
+				if author.affiliation is not None:
+					institute, country_name = split_affiliation(author.affiliation)
+					institutes.add((institute,))
+					countries.add((country_name,))
+
+		self.preload(Source, [("CrossRef",)])
+		self.preload(Publication, [(record.doi,) for record in records])
+		self.preload(Venue, venues)
+		self.preload(Country, countries)
+		self.preload(Affiliation, institutes)
+		self.preload(Author, authors)
+
+
 class GenericModelFactory:
 	model: type(models.Model)
 
-	def __init__(self, _model) -> None:
+	def __init__(self, _model, cache: None | EntityCache = None) -> None:
 		self.model = _model
+		self.cache = cache
 
 	def find_object(self, data: dict) -> models.Model | None:
+		if self.cache is not None:
+			found, instance = self.cache.lookup(self.model, data)
+			if found:
+				return instance
+
+		instance = self.query_object(data)
+		if self.cache is not None:
+			self.cache.remember(self.model, data, instance)
+		return instance
+
+	def query_object(self, data: dict) -> models.Model | None:
 		try:
 			if self.model == Source or self.model == Country or self.model == Venue:
 				return self.model.objects.get(name=data['name'])
@@ -62,7 +162,7 @@ class GenericModelFactory:
 				return self.model.objects.filter(last_name=data['last_name']).get(first_name=data['first_name'])
 
 			if self.model == Keyword:
-				return self.model.objects.get(keyword=data['keyword'])
+				return self.model.objects.get(name=data['name'])
 
 			if self.model == Publication:
 				return self.model.objects.get(doi=data['doi'])
@@ -79,13 +179,79 @@ class GenericModelFactory:
 	def create_or_get(self, data: dict) -> models.Model | None:
 		instance = self.find_object(data)
 		if instance is None:
-			return self.model(**data)
+			instance = self.model(**data)
+			if self.cache is not None:
+				# the caller saves it, later lookups in the batch get the same instance
+				self.cache.remember(self.model, data, instance)
 
 		return instance
 
 
 
 
+def split_affiliation(affiliation_text: str) -> (str, str):
+	"""
+	:param affiliation_text: e.g. "institute, city, country"
+	:return: the institute and the name of the country
+	"""
+	parsed_affiliation = affiliation_text.split(',')
+	if len(parsed_affiliation) > 1:
+		country_name = parsed_affiliation[-1]
+		institute = ",".join(parsed_affiliation[0:-1])
+	else:
+		country_name = "EMPTY"
+		institute = parsed_affiliation[0]
+
+	return institute.strip(), country_name.strip()
+
+
+DOI_PREFIX = re.compile(r'^(?:(?:https?://)?(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+DOI_PATTERN = re.compile(r'^10\.\d+(?:\.\d+)*/\S+$')
+
+
+def normalize_doi(doi: str) -> str:
+	"""
+	DOIs are case-insensitive, and they are often given as links.
+	:param doi: e.g. "https://doi.org/10.1109/ICSA.2020.00001", "doi:10.1109/ICSA.2020.00001" or "10.1109/ICSA.2020.00001"
+	:return: the canonical form, e.g. "10.1109/icsa.2020.00001", or an empty string
+	"""
+	doi = doi.strip().strip('"\'{}<>')
+	if DOI_PREFIX.match(doi):
+		doi = unquote(DOI_PREFIX.sub('', doi))
+	return doi.strip().lower()
+
+
+def is_doi(doi: str) -> bool:
+	"""
+	:param doi: a normalized DOI
+	"""
+	return DOI_PATTERN.match(doi) is not None
+
+
+def normalize_doi_list(doi_list: Iterable[str]) -> List[str]:
+	"""
+	:return: the normalized DOIs in their first order, without duplicates and empty strings
+	"""
+	return [doi for doi in dict.fromkeys(normalize_doi(doi) for doi in doi_list) if doi]
+
+
+def normalize_extra_infos(extra_infos: dict) -> dict:
+	"""
+	:param extra_infos: e.g. {doi: {"abstract": "...", "keywords_list": ["...", ...]}}
+	:return: the same information keyed by the normalized DOIs, the keywords of duplicates are merged
+	"""
+	normalized = {}
+	for doi, extra_info in extra_infos.items():
+		normalized_info = normalized.setdefault(normalize_doi(doi), {})
+		for key, value in extra_info.items():
+			if key == "keywords_list":
+				normalized_info[key] = normalized_info.get(key, []) + list(value)
+			elif len(normalized_info.get(key, "")) < len(value):
+				normalized_info[key] = value
+	normalized.pop("", None)
+	return normalized
+
+
 def find_article_type(key):
 	if key in ARTICLE_TYPES:
 		return ARTICLE_TYPES[key]
@@ -326,359 +492,333 @@ class IEEEXploreParser(Parser):
 
 
 class ScopusParser(Parser):
-	def parse_affiliation(self, text: Any) -> Any:
-		pass
+	"""
+		Reads the results of the Scopus Search API. The STANDARD view has the venue and the first author; the COMPLETE
+		view (see `retrieve_scopus_details`) adds all authors, the abstract and the author keywords.
+	"""
+	def parse_affiliation(self, affiliation: Any) -> dict:
+		if not affiliation or not affiliation.get("affilname"):
+			return {}
+		return {
+			"institute": affiliation["affilname"],
+			"country": {
+				"name": self.try_get(msg=affiliation, key="affiliation-country") or "",
+			}
+		}
 
-	def parse_authors(self, text: Any) -> Any:
-		pass
+	def parse_authors(self, entry: Any) -> Any:
+		affiliations = {
+			self.try_get(msg=affiliation, key="afid"): self.parse_affiliation(affiliation)
+			for affiliation in self.try_get(msg=entry, key="affiliation") or []
+		}
+
+		authors = []
+		for author in self.try_get(msg=entry, key="author") or []:
+			author_affiliations = [afid.get("$") for afid in self.try_get(msg=author, key="afid") or []]
+			authors.append({
+				"first_name": self.try_get(msg=author, key="given-name") or "",
+				"last_name": self.try_get(msg=author, key="surname") or self.try_get(msg=author, key="authname"),
+				"affiliation": affiliations.get(self.try_access(author_affiliations, 0), {}),
+			})
+
+		creator = self.try_get(msg=entry, key="dc:creator")
+		if not authors and creator:
+			# only the first author, e.g. "Doe J."
+			names = creator.split(' ', 1)
+			authors.append({
+				"first_name": names[1] if len(names) > 1 else "",
+				"last_name": names[0],
+				"affiliation": self.try_access(list(affiliations.values()), 0) or {},
+			})
+		return authors
+
+	def parse_keywords(self, keywords: None | str) -> list:
+		if not keywords:
+			return []
+		return [{"name": keyword.strip()} for keyword in keywords.split('|') if keyword.strip()]
 
 	def parse_text(self, text: Any) -> Any:
 		entities = text["search-results"]["entry"]
 		publications = []
 		for i, entry in enumerate(entities):
-			doi = self.try_get(msg=entry, key='doi'),
+			if "error" in entry:
+				# e.g. "Result set was empty"
+				continue
+			doi = self.try_get(msg=entry, key='prism:doi')
 			if doi is not None:
+				article_type = find_article_type(self.try_get(msg=entry, key='prism:aggregationType'))
 				publications.append({
+					"source": "Scopus",
 					"title": entry['dc:title'],
 					"clean_title": re.sub(r'[^a-zA-Z0-9]+', '', str(entry["dc:title"])).lower(),
 					"id": i,
-					"doi": self.try_get(msg=entry, key='prism:doi'),
-					"url": f"http://doi.org/{self.try_get(msg=entry, key='prism:doi')}",
-					"article_type": find_article_type(self.try_get(msg=entry, key='prism:aggregationType')),
+					"doi": doi,
+					"url": f"http://doi.org/{doi}",
+					"article_type": article_type,
+					"event": {
+						"name": self.try_get(msg=entry, key="prism:publicationName"),
+						"article_type": article_type,
+						"volume": self.try_get(msg=entry, key="prism:volume"),
+						"number": self.try_get(msg=entry, key="prism:issueIdentifier"),
+						"publisher": None,
+					},
+					"authors": {"all": self.parse_authors(entry)},
 					"year": int(re.findall(r".*(\d\d\d\d).*", self.try_get(msg=entry, key="prism:coverDate"))[0]),
+					"abstract": self.try_get(msg=entry, key="dc:description") or "",
+					"citations": self.try_get(msg=entry, key="citedby-count"),
+					"author_keywords": {
+						"all": self.parse_keywords(self.try_get(msg=entry, key="authkeywords")),
+					},
 				})
 		return publications
 
 
 class DOIParser(Parser):
-	xml_resp: Response
-	json_resp: Response
+	# None if the request failed, e.g. timed out or refused by the rate limit (see `fetch_error`)
+	xml_resp: None | Response | CachedResponse = None
+	fetch_error: str = ""
+	json_resp: None | Response | CachedResponse = None
+	xml_root: None | eT.Element = None
+	xml_read: bool = False
+	record: None | CrossRefRecord = None
+	json_merged: bool = False
 	doi: str
-	venue_types = {
-		"conference_paper": "conference",
-		"journal_article": "journal",
-	}
 
-	def __init__(self, doi: str):
-		url = f"https://dx.doi.org/{doi}"
-		try:
-			self.xml_resp = requests.get(url, headers={"Accept": "application/vnd.crossref.unixsd+xml"})
-		except:
-			print("The server is down or not accepting xml")
+	xml_type = "application/vnd.crossref.unixsd+xml"
+	json_type = "application/json"
+	# answers of dx.doi.org which will not change by asking again, they are stored as negative entries
+	negative_statuses = [400, 404, 410]
+
+	def __init__(self, doi: str, stored_record: None | CrossRefRecord = None, check_store: bool = True):
+		"""
+		:param doi: the DOI to be resolved
+		:param stored_record: the record of the DOI from the local metadata store, if it was looked up beforehand
+		:param check_store: look the DOI up in the local metadata store (see `find_stored_records`) before CrossRef
+		"""
+		# the json record is only fetched when the xml lacks a field, see `get_json`
+		self.json_resp = None
+		self.doi = normalize_doi(doi)
+
+		if stored_record is None and check_store:
+			stored_record = DOIParser.find_stored_records([self.doi]).get(self.doi)
+
+		if stored_record is not None:
+			# nothing is asked from CrossRef
+			self.record = stored_record
+			self.xml_read = True
+			self.json_merged = True
+			return
 
 		try:
-			self.json_resp = requests.get(url, headers={"Accept": "application/json"})
-		except:
-			print("The server is down or not accepting json")
-
-		self.xml_ns = {
-			'qr': 'http://www.crossref.org/qrschema/3.0',
-			'x': 'http://www.crossref.org/xschema/1.1',
-			'any': '*',
-		}
-		self.doi = doi
+			self.xml_resp = DOIParser.fetch(self.doi, DOIParser.xml_type)
+		except Exception as e:
+			# e.g. a timeout or `RateLimitExceeded`, nothing is cached, so the DOI is asked again by the next import
+			self.fetch_error = f"{self.doi} cannot be fetched from CrossRef: {e!r}"
+			print(self.fetch_error)
+
+	@property
+	def field_stages(self) -> dict:
+		"""
+		:return: the stage ("xml", "json" or "store") which supplied each field of the publication
+		"""
+		return self.record.field_stages if self.record is not None else {}
 
-	def xml_find_items(self, root, namespace, query, singleton=True):
-		items = root.findall(f".//{namespace}:{query}", self.xml_ns)
-		if not items:
-			return None
+	@staticmethod
+	def find_stored_records(doi_list: List[str]) -> dict:
+		"""
+		Looks the DOIs up in the local metadata store, which is filled by the `seed_metadata` command.
+		:param doi_list: normalized DOIs
+		:return: the complete record of each found DOI
+		"""
+		# from local app
+		from .bibtex import BibTeXEntry, build_record
+		from .models import MetadataRecord
+
+		records = {}
+		for i in range(0, len(doi_list), EntityCache.chunk_size):
+			stored = MetadataRecord.objects.filter(doi__in=doi_list[i:i + EntityCache.chunk_size])
+			for doi, entry_type, fields in stored.values_list("doi", "entry_type", "fields"):
+				record = build_record(BibTeXEntry(entry_type=entry_type, key=doi, fields=fields))
+				if not record.error:
+					record.doi = doi
+					record.field_stages = {name: "store" for name in record.field_stages}
+					records[doi] = record
+		return records
 
-		if singleton and len(items) != 1:
-			return None
+	@staticmethod
+	def fetch(doi: str, accept: str) -> Response | CachedResponse:
+		"""
+		Gets the record of a DOI from the persistent cache, or from dx.doi.org if it is not cached yet.
+		:param doi: the DOI to be fetched
+		:param accept: the requested content type
+		:return: the (cached) response, with `CROSSREF_OFFLINE` enabled a missing entry is answered by 504
+		"""
+		cached_response = crossref_cache.get(doi, accept)
+		if cached_response is not None:
+			return cached_response
+
+		if getattr(settings, "CROSSREF_OFFLINE", False):
+			print(f"{doi} is not cached and CrossRef is offline")
+			return CachedResponse(status_code=504, text="", from_cache=False)
+
+		response = get_http_client().get(f"https://dx.doi.org/{doi}", headers={"Accept": accept})
+		if response.status_code == 200 or response.status_code in DOIParser.negative_statuses:
+			crossref_cache.set(doi, accept, response.status_code, response.text)
+
+		return response
+
+	def get_json(self) -> None | Response | CachedResponse:
+		"""
+		Fetches the json record of the DOI on the first call.
+		"""
+		if self.json_resp is None:
+			try:
+				self.json_resp = DOIParser.fetch(self.doi, DOIParser.json_type)
+			except:
+				print("The server is down or not accepting json")
+
+		return self.json_resp
+
+	def missing_fields(self) -> List[str]:
+		"""
+		:return: fields listed in `CROSSREF_JSON_FIELDS` which are not available in the xml record
+		"""
+		record = self.read_record()
+		if record is None or record.error:
+			return []
 
-		if singleton:
-			return items[0]
-		else:
-			return items
+		missing = []
+		for field in getattr(settings, "CROSSREF_JSON_FIELDS", ["abstract"]):
+			if field == "abstract" and not record.abstract:
+				missing.append(field)
+
+			elif field == "keywords" and not record.keywords:
+				# unixsd records do not carry the subjects
+				missing.append(field)
+
+		return missing
+
+	def prefetch(self) -> None:
+		"""
+		Reads the xml record and, only if it lacks any of the wanted fields, the json record. It does not touch the
+		database, so it is safe to be run in a worker thread.
+		"""
+		self.complete_record()
+
+	def read_xml(self) -> None | eT.Element:
+		"""
+		Parses the fetched xml response into an element tree, without touching the database. The result is kept,
+		so it can be called from a worker thread ahead of `parse`.
+		:return: root of the xml response, or None if the DOI was not found or the xml is malformed
+		"""
+		if self.xml_read:
+			return self.xml_root
+
+		self.xml_read = True
+		if self.xml_resp is None:
+			return None
 
-	def parse_xml(self) -> None | Publication:
 		if self.xml_resp.status_code != 200:
-			print("doi not found")
+			print(f"{self.doi} not found ({self.xml_resp.status_code})")
 			return None
 
 		xml_data = self.xml_resp.text
 
 		try:
-			root = eT.fromstring(xml_data)
+			self.xml_root = eT.fromstring(xml_data)
 		except eT.ParseError as e:
 			print(f"error reading from xml: {e}")
 			return None
 
-		query = self.xml_find_items(root=root, namespace="any", query="query")
-		if query is None:
-			print("error in finding query")
-			return None
-
-		if 'status' not in query.attrib or query.attrib['status'] != 'resolved':
-			print("error in status")
-			return None
+		return self.xml_root
 
-		publisher_name = self.xml_find_items(root=query, namespace="any", query="publisher_name")
-		doi_type = self.xml_find_items(root=query, namespace="qr", query="doi")
+	def read_record(self) -> None | CrossRefRecord:
+		"""
+		Extracts the data of the xml response, without touching the database. The result is kept.
+		:return: the extracted record (check its `error`), or None if the xml could not be read
+		"""
+		if self.record is None:
+			root = self.read_xml()
+			if root is None:
+				return None
+			self.record = UnixsdExtractor(self.doi).extract(root)
 
-		if doi_type is None:
-			print("error in finding doi type")
-			return None
+		return self.record
 
-		if publisher_name is not None:
-			publisher_name = publisher_name.text
-		else:
-			publisher_name = ""
+	def add_extra_info_from_json(self, record: CrossRefRecord) -> CrossRefRecord:
+		"""
+		Completes the fields which the xml record lacks from the json record. The json is fetched only when needed.
+		:param record: the record extracted from the xml
+		:return: the same record
+		"""
+		missing = self.missing_fields()
+		if not missing:
+			return record
 
-		# e.g conference paper
-		doi_type = doi_type.attrib["type"]
+		json_resp = self.get_json()
+		if json_resp is None or json_resp.status_code != 200:
+			print("json record is not available")
+			return record
 
-		record = self.xml_find_items(root=query, namespace="any", query="doi_record")
+		try:
+			json_record = json_resp.json()
+		except ValueError as e:
+			print(f"error reading from json: {e}")
+			return record
+
+		if "abstract" in missing:
+			abstract = self.try_get(msg=json_record, key="abstract")
+			if abstract:
+				# the abstract is given in JATS, only its text is kept
+				record.abstract = " ".join(re.sub(r"<[^>]+>", " ", abstract).split())
+				record.field_stages["abstract"] = "json"
+
+		if "keywords" in missing:
+			subjects = self.try_get(msg=json_record, key="subject")
+			if subjects:
+				record.keywords = [subject.strip().lower() for subject in subjects]
+				record.field_stages["keywords"] = "json"
+
+		return record
+
+	def complete_record(self) -> None | CrossRefRecord:
+		"""
+		The first phase of an import: the record of the DOI with all the fields that CrossRef can provide. It does
+		not touch the database.
+		"""
+		record = self.read_record()
+		if record is not None and not record.error and not self.json_merged:
+			self.json_merged = True
+			self.add_extra_info_from_json(record)
+
+		return record
+
+	def check_record(self) -> None | CrossRefRecord:
+		"""
+		:return: the completed record if it can be stored, otherwise None (the reason is reported)
+		"""
+		record = self.complete_record()
 		if record is None:
-			print("error in finding record")
-			return None
-
-		venue = self.xml_find_items(root=record, namespace="any", query=DOIParser.venue_types[doi_type])
-
-		if venue is None:
-			print("error in finding venue")
 			return None
 
-		venue_object = self.resolve_venue(venue, DOIParser.venue_types[doi_type], publisher_name)
-
-		publication = self.xml_find_items(root=venue, namespace="any", query=doi_type)
-		if publication is None:
-			print("error in finding publication")
+		if record.error:
+			print(record.error)
+			if record.status and not record.resolved:
+				crossref_cache.set_negative(self.doi, DOIParser.xml_type)
 			return None
 
-		contributors = self.xml_find_items(root=publication, namespace="any", query="contributors")
-
-		if contributors is None:
-			print("error in finding contributors")
-			return None
+		return record
 
-		authors = self.resolve_authors(contributors)
-		dates = self.xml_find_items(root=publication, namespace="qr", query="publication_date", singleton=False)
+	def parse(self, entity_cache: None | EntityCache = None) -> None | Publication:
+		"""
+		Creates the publication (and its venue, authors, ...) from the fetched records.
+		:param entity_cache: the identity map of the current import batch, if any
+		"""
+		# from local app
+		from .persistence import BulkPublicationWriter
 
-		if dates is None:
-			dates = self.xml_find_items(root=record, namespace="any", query="publication_date", singleton=False)
-			if dates is None:
-				print("error in finding publication dates")
-				return None
-
-		year = None
-		for publication_date in dates:
-			year = self.xml_find_items(root=publication_date, namespace="any", query="year")
-			if year is not None:
-				year = year.text
-				break
-
-		if year is None:
-			print("error in finding year")
-			return None
-
-		title = self.xml_find_items(root=publication, namespace="x", query="title")
-		if title is None:
-			print("error in finding title")
-			return None
-
-		# optional stuff
-		abstract = ""
-		abstract_element = self.xml_find_items(root=publication, namespace="any", query="abstract")
-		if abstract_element is not None:
-			abstract_p = self.xml_find_items(root=abstract_element, namespace="any", query="p")
-			if abstract_p is not None:
-				abstract = abstract_p.text
-
-		# finally creating the publication
-		source_factory = GenericModelFactory(Source)
-		source = source_factory.create_or_get(data={"name": "CrossRef"})
-		source.save()
-
-		publication_factory = GenericModelFactory(Publication)
-		publication_object = publication_factory.create_or_get(data={
-			"doi": self.doi,
-			"title": title.text,
-			"year": year,
-			"venue": venue_object,
-			"source": source,
-			"abstract": abstract,
-		})
-
-		if publication_object is None or not isinstance(publication_object, Publication):
-			print("failed at creating the publication")
+		record = self.check_record()
+		if record is None:
 			return None
 
-		publication_object.save()
-		for author in authors:
-			publication_object.authors.add(author)
-
-		publication_object.save()
-
-		# models which have publication as foreign key
-		full_texts = self.resolve_full_text(publication)
-		for full_text in full_texts:
-			full_text_factory = GenericModelFactory(FullText)
-			full_text_object = full_text_factory.create_or_get({"publication": publication_object, **full_text})
-
-			if full_text_object is not None and isinstance(full_text_object, FullText):
-				full_text_object.save()
-
-		return publication_object
-
-	def resolve_venue(self, venue, venue_type, publisher_name) -> Venue | None:
-
-		if venue_type == "conference":
-			synonyms_for_conference_names = ["conference_name", "proceedings_title"]
-			conference_name = None
-
-			for synonym in synonyms_for_conference_names:
-				conference_name = self.xml_find_items(root=venue, namespace="any", query=synonym)
-				if conference_name is not None:
-					break
-
-			if conference_name is not None:
-				conference_factory = GenericModelFactory(Venue)
-				conference = conference_factory.create_or_get(data={"name": conference_name.text})
-				if conference is not None:
-					# ("P", "Conference Proceedings"),
-					conference.type = "P"
-					conference.publisher = publisher_name
-					conference.save()
-
-				return conference
-
-		if venue_type == "journal":
-			synonyms_for_journal_names = ["full_title", "journal_title"]
-			journal_name = None
-
-			for synonym in synonyms_for_journal_names:
-				journal_name = self.xml_find_items(root=venue, namespace="any", query=synonym)
-				if journal_name is not None:
-					break
-
-			if journal_name is not None:
-				journal_factory = GenericModelFactory(Venue)
-				journal = journal_factory.create_or_get(data={"name": journal_name.text})
-				if journal is not None:
-					# ("J", "Journal Article"),
-					journal.type = "J"
-
-					issue = self.xml_find_items(root=venue, namespace="any", query="issue")
-					if issue is not None:
-						journal.issue = issue
-
-					volume = self.xml_find_items(root=venue, namespace="any", query="volume")
-					if volume is not None:
-						journal.volume = volume
-
-					journal.publisher = publisher_name
-					journal.save()
-
-				return journal
-		return None
-
-	def resolve_affiliation(self, affiliation_element) -> Model | None:
-		if affiliation_element is not None:
-			parsed_affiliation = affiliation_element.text.split(',')
-			if len(parsed_affiliation) > 1:
-				country_name = parsed_affiliation[-1]
-				institute = ",".join(parsed_affiliation[0:-1])
-			else:
-				country_name = "EMPTY"
-				institute = parsed_affiliation[0]
-
-			country_factory = GenericModelFactory(Country)
-			country = country_factory.create_or_get(data={"name": country_name.strip()})
-			if country is not None:
-				country.save()
-
-			affiliation_factory = GenericModelFactory(Affiliation)
-			affiliation = affiliation_factory.create_or_get(data={
-				"institute": institute.strip()})
-
-			if affiliation is not None:
-				affiliation.country = country
-				affiliation.save()
-
-			return affiliation
-
-		return None
-
-	def resolve_authors(self, contributors) -> List[Model]:
-		synonyms_for_first_names = ["first_name", "firstname", "given_name", "givenname"]
-		synonyms_for_last_names = ["last_name", "lastname", "surname", "family_name", "familyname"]
-
-		authors = []
-
-		for contributor in contributors:
-			last_name = None
-			first_name = None
-
-			for synonym in synonyms_for_last_names:
-				last_name = self.xml_find_items(root=contributor, namespace="any", query=synonym)
-				if last_name is not None:
-					break
-
-			for synonym in synonyms_for_first_names:
-				first_name = self.xml_find_items(root=contributor, namespace="any", query=synonym)
-				if first_name is not None:
-					break
-
-			affiliation = self.xml_find_items(root=contributor, namespace="any", query="affiliation")
-
-			if last_name is not None and first_name is not None:
-				author_factory = GenericModelFactory(Author)
-				created_affiliation = None
-				if affiliation is not None:
-					created_affiliation = self.resolve_affiliation(affiliation)
-
-				author = author_factory.create_or_get(data={
-					"last_name": last_name.text,
-					"first_name": first_name.text,
-					"affiliation": created_affiliation
-				})
-				author.save()
-				authors.append(author)
-
-		return authors
-
-	def resolve_full_text(self, root) -> []:
-		collection = self.xml_find_items(root=root, namespace="any", query="collection")
-		if collection is None:
-			return []
-
-		resources = self.xml_find_items(root=collection, namespace="any", query="resource", singleton=False)
-		if resources is None or len(resources) == 0:
-			return [{
-				'url': "",
-				'type': "P",
-			}]
-
-		full_texts = []
-
-		for i, resource in enumerate(resources):
-			file_type = "pdf"
-			if 'mime_type' in resource.attrib:
-				file_types = resource.attrib['mime_type'].split('/')
-				if len(file_types) > 0:
-					file_type = file_types[1]
-				else:
-					file_type = file_types[0]
-
-			full_texts.append({
-				'url': resource.text,
-				'type': FULL_TEXT_TYPES_REVERSE[f"application/{file_type}"],
-			})
-
-		return full_texts
-
-	def resolve_keywords(self, query):
-		pass
-
-	def add_extra_info_from_json(self, publication) -> Publication:
-		# TODO implement
-		return publication
-
-	def parse(self) -> None | Publication:
-		publication = self.parse_xml()
-
-		# TODO check if extra information is available from the json
-		# publication = self.add_extra_info_from_json(publication)
-
-		return publication
+		return BulkPublicationWriter(entity_cache).write([record]).get(record.doi)
\ No newline at end of file
@@ -0,0 +1,237 @@
+from typing import Any, Callable, Dict, Iterable, List
+
+from django.db import models, transaction
+
+from .extractors import CrossRefRecord, clean_title
+from .models import Source, Country, Affiliation, Author, Venue, Keyword, Publication, FullText
+from .parsers import EntityCache, split_affiliation
+
+
+class BulkPublicationWriter:
+	"""
+		The second phase of an import. The records of a batch are parsed beforehand without touching the database,
+		here all their entities are stored with a few bulk queries (`bulk_create`, `bulk_update` and inserts into the
+		many-to-many tables) inside one transaction.
+	"""
+	batch_size = 500
+
+	def __init__(self, entity_cache: None | EntityCache = None) -> None:
+		self.entity_cache = entity_cache if entity_cache is not None else EntityCache()
+
+	def ensure(self, model: type(models.Model), keys: Iterable[tuple], build: Callable[[tuple], models.Model]) \
+			-> Dict[tuple, models.Model]:
+		"""
+		Finds the entities with the given keys (see `EntityCache.lookup_fields`) and creates the missing ones.
+		:param model: the model of the entities
+		:param keys: the keys of the entities
+		:param build: creates an (unsaved) instance for a missing key
+		:return: the stored instance of each key
+		"""
+		keys = list(dict.fromkeys(keys))
+		self.entity_cache.preload(model, keys)
+		known = self.entity_cache.instances[model]
+
+		missing = [key for key in keys if known.get(key) is None or known[key].pk is None]
+		if missing:
+			new_objects = [build(key) for key in missing]
+			# models with unique fields may have been created meanwhile by another import
+			model.objects.bulk_create(new_objects, batch_size=self.batch_size, ignore_conflicts=any(
+				model._meta.get_field(field).unique for field in EntityCache.lookup_fields[model]))
+
+			if all(new_object.pk is not None for new_object in new_objects):
+				known.update(zip(missing, new_objects))
+			else:
+				# the backend did not return the primary keys
+				for key in missing:
+					known.pop(key, None)
+				self.entity_cache.preload(model, missing)
+
+		return {key: known[key] for key in keys}
+
+	def link(self, relation: Any, pairs: Iterable[tuple]) -> None:
+		"""
+		Inserts rows into a many-to-many table, the existing rows are kept.
+		:param relation: the many-to-many field descriptor, e.g. `Publication.authors`
+		:param pairs: (source id, target id) pairs
+		"""
+		through = relation.through
+		source_column = relation.field.m2m_field_name() + "_id"
+		target_column = relation.field.m2m_reverse_field_name() + "_id"
+		through.objects.bulk_create([
+			through(**{source_column: source_id, target_column: target_id})
+			for source_id, target_id in dict.fromkeys(pairs)
+		], batch_size=self.batch_size, ignore_conflicts=True)
+
+	def write(self, records: List[CrossRefRecord], source_name: str = "CrossRef") -> Dict[str, Publication]:
+		"""
+		:param records: the completed records, the ones with errors are skipped
+		:param source_name: the name of the `Source` of the publications
+		:return: the publication of each record, keyed by `CrossRefRecord.key` (the DOI if there is one)
+		"""
+		records = [record for record in records if record is not None and not record.error]
+		if not records:
+			return {}
+
+		with transaction.atomic():
+			self.entity_cache.preload_records(records)
+			return self.write_records(records, source_name)
+
+	def write_records(self, records: List[CrossRefRecord], source_name: str) -> Dict[str, Publication]:
+		source = self.ensure(Source, [(source_name,)], lambda key: Source(name=key[0]))[(source_name,)]
+
+		# countries and affiliations, the latest country of an institute wins
+		affiliation_countries = {}
+		for record in records:
+			for author in record.authors:
+				if author.affiliation is not None:
+					institute, country_name = split_affiliation(author.affiliation)
+					affiliation_countries[(institute,)] = (country_name,)
+
+		countries = self.ensure(Country, affiliation_countries.values(), lambda key: Country(name=key[0]))
+		affiliations = self.ensure(Affiliation, affiliation_countries.keys(), lambda key: Affiliation(
+			institute=key[0], country=countries[affiliation_countries[key]]))
+
+		changed_affiliations = []
+		for key, affiliation in affiliations.items():
+			country = countries[affiliation_countries[key]]
+			if affiliation.country_id != country.id:
+				affiliation.country = country
+				changed_affiliations.append(affiliation)
+		Affiliation.objects.bulk_update(changed_affiliations, ["country"], batch_size=self.batch_size)
+
+		# venues, their details are updated by the latest record
+		venue_records = {(record.venue.name,): record.venue for record in records if record.venue is not None}
+		venues = self.ensure(Venue, venue_records.keys(), lambda key: Venue(
+			name=key[0], type=venue_records[key].type, publisher=venue_records[key].publisher,
+			volume=venue_records[key].volume, number=venue_records[key].number))
+
+		for key, venue in venues.items():
+			venue_record = venue_records[key]
+			venue.type = venue_record.type
+			venue.publisher = venue_record.publisher
+			if venue_record.volume:
+				venue.volume = venue_record.volume
+			if venue_record.number:
+				venue.number = venue_record.number
+		Venue.objects.bulk_update(venues.values(), ["type", "publisher", "volume", "number"],
+			batch_size=self.batch_size)
+
+		# authors keep the affiliation they were created with
+		author_affiliations = {}
+		for record in records:
+			for author in record.authors:
+				key = (author.last_name, author.first_name)
+				if key not in author_affiliations and author.affiliation is not None:
+					author_affiliations[key] = affiliations[(split_affiliation(author.affiliation)[0],)]
+		authors = self.ensure(Author, [
+			(author.last_name, author.first_name) for record in records for author in record.authors
+		], lambda key: Author(last_name=key[0], first_name=key[1], affiliation=author_affiliations.get(key)))
+
+		keywords = self.ensure(Keyword, [
+			(keyword,) for record in records for keyword in record.keywords
+		], lambda key: Keyword(name=key[0]))
+
+		# publications, the existing ones are kept as they are
+		records_by_key = {record.key: record for record in records}
+		records_by_doi = {record.doi: record for record in records_by_key.values() if record.doi}
+		self.entity_cache.preload(Publication, [(doi,) for doi in records_by_doi])
+		existing_keys = {
+			doi for doi in records_by_doi
+			if self.entity_cache.instances[Publication].get((doi,)) is not None
+		}
+
+		def build(record: CrossRefRecord) -> Publication:
+			return Publication(
+				doi=record.doi or None,
+				title=record.title,
+				clean_title=clean_title(record.title),
+				year=record.year,
+				venue=venues[(record.venue.name,)],
+				source=source,
+				abstract=record.abstract,
+			)
+
+		publications = self.ensure(Publication, [(doi,) for doi in records_by_doi], lambda key: build(records_by_doi[key[0]]))
+		publications = {key[0]: publication for key, publication in publications.items()}
+
+		# publications without a DOI are identified by their clean title
+		untitled_records = {key: record for key, record in records_by_key.items() if not record.doi}
+		found_by_title = self.find_by_clean_title(untitled_records.keys())
+		existing_keys.update(found_by_title)
+		publications.update(found_by_title)
+		new_publications = {key: build(record) for key, record in untitled_records.items() if key not in found_by_title}
+		Publication.objects.bulk_create(new_publications.values(), batch_size=self.batch_size)
+		if any(publication.pk is None for publication in new_publications.values()):
+			# the backend did not return the primary keys
+			new_publications = self.find_by_clean_title(new_publications.keys(), doi__isnull=True)
+		publications.update(new_publications)
+
+		self.link(Publication.authors, [
+			(publications[record.key].id, authors[(author.last_name, author.first_name)].id)
+			for record in records for author in record.authors
+		])
+		self.link(Publication.keywords, [
+			(publications[record.key].id, keywords[(keyword,)].id)
+			for record in records for keyword in record.keywords
+		])
+
+		# full texts, a type is added only once per publication
+		existing_full_texts = set(FullText.objects.filter(
+			publication__in=[publications[key] for key in existing_keys]
+		).values_list("publication_id", "type"))
+		new_full_texts = {}
+		for record in records:
+			publication = publications[record.key]
+			for full_text in record.full_texts:
+				key = (publication.id, full_text.type)
+				if key not in existing_full_texts and key not in new_full_texts:
+					new_full_texts[key] = FullText(publication=publication, url=full_text.url, type=full_text.type)
+		FullText.objects.bulk_create(new_full_texts.values(), batch_size=self.batch_size)
+
+		return publications
+
+	def find_by_clean_title(self, titles: Iterable[str], **filters: Any) -> Dict[str, Publication]:
+		"""
+		:param titles: clean titles, see `Publication.clean_title`
+		:param filters: further conditions, e.g. doi__isnull=True
+		:return: the oldest publication of each found title
+		"""
+		titles = list(titles)
+		found = {}
+		for i in range(0, len(titles), EntityCache.chunk_size):
+			publications = Publication.objects.filter(clean_title__in=titles[i:i + EntityCache.chunk_size], **filters)
+			for publication in publications.order_by("id"):
+				found.setdefault(publication.clean_title, publication)
+		return found
+
+	def write_extra_infos(self, publications: Dict[str, Publication], extra_infos: dict) -> None:
+		"""
+		Adds the information that came with the DOIs (e.g. from a BibTeX entry): a longer text replaces the stored
+		one, and the keywords are added to the publication.
+		:param publications: the publication of each DOI
+		:param extra_infos: e.g. {doi: {"abstract": "...", "keywords_list": ["...", ...]}}
+		"""
+		changed_publications = {}
+		keyword_pairs = []
+		for doi, extra_info in extra_infos.items():
+			publication = publications.get(doi)
+			if publication is None:
+				continue
+
+			for key, value in extra_info.items():
+				if key == "keywords_list":
+					keyword_pairs += [
+						(publication, (keyword.strip().lower(),)) for keyword in value if keyword.strip()
+					]
+				elif key in publication.__dict__ and len(publication.__dict__[key]) < len(value):
+					publication.__dict__[key] = value
+					changed_publications.setdefault(key, {})[publication.id] = publication
+
+		with transaction.atomic():
+			for field, changed in changed_publications.items():
+				Publication.objects.bulk_update(changed.values(), [field], batch_size=self.batch_size)
+
+			keywords = self.ensure(Keyword, [key for _, key in keyword_pairs], lambda key: Keyword(name=key[0]))
+			self.link(Publication.keywords, [
+				(publication.id, keywords[key].id) for publication, key in keyword_pairs
+			])
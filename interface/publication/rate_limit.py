@@ -0,0 +1,216 @@
+"""
+	Rate limits of the outbound requests, a token bucket for each host. The buckets are kept in small files, so all
+	threads and processes (the web server and the import workers) share them. The rate of a host follows what the host
+	announces (the X-Rate-Limit-* headers of CrossRef), is halved after each 429 answer and regained step by step by
+	the following successful requests. A refused request blocks the host for its Retry-After, or for an exponential
+	backoff if the host does not tell it; this is the only backoff of the 429 answers (see `HttpClient`).
+"""
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Iterator
+
+from django.conf import settings
+from requests import RequestException, Response
+
+try:
+	import fcntl
+except ImportError:
+	# e.g. on Windows, the buckets are then shared by the threads of a single process only
+	fcntl = None
+
+
+INTERVAL = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$')
+INTERVAL_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 60 * 60}
+
+
+class RateLimitExceeded(RequestException):
+	"""
+		The host cannot be asked within `HTTP_RATE_LIMIT_MAX_WAIT`, e.g. its daily quota is spent.
+	"""
+
+
+def header(response: Response, *names: str) -> None | str:
+	"""
+	:return: the first of the given headers which the response has (e.g. "X-Rate-Limit-Limit" or "X-RateLimit-Limit")
+	"""
+	return next((response.headers[name] for name in names if name in response.headers), None)
+
+
+def parse_interval(interval: None | str) -> None | float:
+	"""
+	:param interval: e.g. "1s", "60s", "1m"
+	:return: the seconds, None if the interval cannot be read
+	"""
+	match = INTERVAL.match(interval or "")
+	if match is None:
+		return None
+	seconds = float(match.group(1)) * INTERVAL_UNITS[match.group(2) or "s"]
+	return seconds if seconds > 0 else None
+
+
+def parse_retry_after(retry_after: None | str, now: float) -> None | float:
+	"""
+	:param retry_after: seconds (e.g. "120") or a date (e.g. "Wed, 21 Oct 2015 07:28:00 GMT")
+	:return: the seconds to wait
+	"""
+	if not retry_after:
+		return None
+	if retry_after.strip().isdigit():
+		return float(retry_after)
+	try:
+		return max(parsedate_to_datetime(retry_after).timestamp() - now, 0.0)
+	except (TypeError, ValueError):
+		return None
+
+
+def is_throttled(response: Response) -> bool:
+	"""
+	:return: True if the host refused the request because of its rate limit
+	"""
+	if response.status_code == 429:
+		return True
+	# IEEE Xplore (Mashery) answers 403 to too many queries per second
+	return response.status_code == 403 and "OVER_QPS" in (response.headers.get("X-Mashery-Error-Code") or "")
+
+
+class RateLimiter:
+	"""
+		Token buckets of the hosts. A bucket holds at most one second of requests, each request takes a token, and
+		a request without a token waits until the bucket is refilled.
+	"""
+	min_rate = 0.1
+	# the part of the ceiling which each successful request regains after the rate was lowered
+	increase = 0.05
+
+	def __init__(self, directory: None | str | Path = None) -> None:
+		self.directory = Path(directory or getattr(settings, "HTTP_RATE_LIMIT_DIR", Path("cache") / "rate_limits"))
+		self.default_rate = getattr(settings, "HTTP_RATE_LIMIT", 10)
+		self.host_rates = getattr(settings, "HTTP_RATE_LIMITS", {})
+		self.max_wait = getattr(settings, "HTTP_RATE_LIMIT_MAX_WAIT", 60)
+		self.backoff_factor = getattr(settings, "HTTP_BACKOFF_FACTOR", 0.5)
+		self._locks: dict[str, threading.Lock] = {}
+		self._lock = threading.Lock()
+
+	def path(self, host: str) -> Path:
+		return self.directory / f"{re.sub(r'[^A-Za-z0-9.-]', '_', host)}.json"
+
+	@contextmanager
+	def bucket(self, host: str) -> Iterator[dict]:
+		"""
+		Locks the bucket of a host, for the threads of this process and for the other processes, and saves the
+		changes of the yielded state.
+		"""
+		with self._lock:
+			lock = self._locks.setdefault(host, threading.Lock())
+
+		with lock:
+			self.directory.mkdir(parents=True, exist_ok=True)
+			with open(self.path(host), "a+", encoding="utf-8") as file:
+				if fcntl is not None:
+					fcntl.flock(file, fcntl.LOCK_EX)
+				try:
+					file.seek(0)
+					try:
+						state = json.loads(file.read() or "{}")
+					except ValueError:
+						state = {}
+					yield state
+					file.seek(0)
+					file.truncate()
+					file.write(json.dumps(state))
+					file.flush()
+				finally:
+					if fcntl is not None:
+						fcntl.flock(file, fcntl.LOCK_UN)
+
+	def ceiling(self, state: dict, host: str, rate: None | float = None) -> float:
+		"""
+		:param rate: the configured rate of the host (e.g. `QueryPlatform.rate_limit`), `HTTP_RATE_LIMITS` by default
+		:return: the highest rate of the host, the configured one and the announced one are not exceeded
+		"""
+		configured = rate or self.host_rates.get(host)
+		announced = state.get("announced")
+		if configured and announced:
+			return max(min(configured, announced), RateLimiter.min_rate)
+		return max(configured or announced or self.default_rate, RateLimiter.min_rate)
+
+	def acquire(self, host: str, rate: None | float = None) -> float:
+		"""
+		Waits for a token of the host.
+		:return: the seconds waited
+		:raises RateLimitExceeded: if the token would come later than `HTTP_RATE_LIMIT_MAX_WAIT`
+		"""
+		waited = 0.0
+		while True:
+			with self.bucket(host) as state:
+				now = time.time()
+				current_rate = min(state.get("rate") or self.ceiling(state, host, rate), self.ceiling(state, host, rate))
+				capacity = max(current_rate, 1.0)
+				tokens = state.get("tokens", capacity)
+				tokens = min(capacity, tokens + (now - state.get("updated", now)) * current_rate)
+				state["rate"] = current_rate
+				state["tokens"] = tokens
+				state["updated"] = now
+
+				blocked_until = state.get("blocked_until", 0.0)
+				if blocked_until > now:
+					wait = blocked_until - now
+				elif tokens >= 1:
+					state["tokens"] = tokens - 1
+					return waited
+				else:
+					wait = (1 - tokens) / current_rate
+
+			if waited + wait > self.max_wait:
+				raise RateLimitExceeded(f"{host} cannot be asked within {self.max_wait}s")
+			time.sleep(wait)
+			waited += wait
+
+	def observe(self, host: str, response: Response, rate: None | float = None) -> None:
+		"""
+		Adapts the rate of the host to a response: the announced limits are followed, a refused request halves the
+		rate and blocks the host for its Retry-After (or HTTP_BACKOFF_FACTOR * 2 ^ (refusals in a row - 1) seconds, at
+		most `HTTP_RATE_LIMIT_MAX_WAIT`), a successful one raises the rate again.
+		"""
+		with self.bucket(host) as state:
+			now = time.time()
+			limit = header(response, "X-Rate-Limit-Limit", "X-RateLimit-Limit")
+			interval = parse_interval(header(response, "X-Rate-Limit-Interval", "X-RateLimit-Interval"))
+			if limit and limit.strip().isdigit() and interval:
+				# a limit without an interval is a quota (e.g. per week of Scopus), not a rate
+				state["announced"] = int(limit) / interval
+
+			remaining = header(response, "X-Rate-Limit-Remaining", "X-RateLimit-Remaining")
+			reset = header(response, "X-Rate-Limit-Reset", "X-RateLimit-Reset")
+			if remaining is not None and remaining.strip() == "0" and reset and reset.strip().isdigit():
+				# the reset is a time (seconds since the epoch) or the seconds until it
+				reset_at = float(reset) if float(reset) > 10 ** 9 else now + float(reset)
+				state["blocked_until"] = max(state.get("blocked_until", 0.0), reset_at)
+
+			ceiling = self.ceiling(state, host, rate)
+			current_rate = min(state.get("rate") or ceiling, ceiling)
+			if is_throttled(response):
+				current_rate = max(current_rate / 2, RateLimiter.min_rate)
+				state["refused"] = state.get("refused", 0) + 1
+				backoff = min(max(self.backoff_factor * 2 ** (state["refused"] - 1), 1 / current_rate), self.max_wait)
+				retry_after = parse_retry_after(response.headers.get("Retry-After"), now)
+				state["blocked_until"] = max(state.get("blocked_until", 0.0), now + (retry_after or backoff))
+				state["tokens"] = 0.0
+				state["updated"] = now
+				state["throttled"] = state.get("throttled", 0) + 1
+			elif response.status_code < 400:
+				state["refused"] = 0
+				current_rate = min(current_rate + ceiling * RateLimiter.increase, ceiling)
+			state["rate"] = current_rate
+
+	def state(self, host: str) -> dict:
+		"""
+		:return: the bucket of a host, e.g. {"rate": 9.5, "tokens": 3.2, "announced": 50, "throttled": 1, ...}
+		"""
+		with self.bucket(host) as state:
+			return dict(state)
@@ -1,3 +1,810 @@
-from django.test import TestCase
+import importlib
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from requests import Response
+
+from mapping.models import Mapping, PublicationList, ReviewField, ReviewFieldValueBoolean, ReviewFieldValueCoding
+from publication.bibtex import decode_chunks, read_bibtex
+from publication.cache import crossref_cache
+from publication.extractors import AuthorRecord, CrossRefRecord, FullTextRecord, VenueRecord
+from publication.http_client import HttpClient
+from publication.importers import get_format, iter_lines, read_csv, read_jsonl, read_ris
+from publication.jobs import (
+    claim_import_job, claim_next_import_job, requeue_stale_import_jobs, run_import_job,
+)
+from publication.management.commands.benchmark_unixsd import CORPUS
+from publication.models import (
+    Affiliation, Author, FullText, ImportJob, Keyword, MetadataRecord, Publication, Source, Venue,
+)
+from publication.parsers import DOIParser, is_doi, normalize_doi, normalize_doi_list
+from publication.persistence import BulkPublicationWriter
+from publication.rate_limit import (
+    RateLimiter, RateLimitExceeded, is_throttled, parse_interval, parse_retry_after,
+)
+from publication.web_search import cached_search, extend_queries, merge_hits, stored_queries
+from query.models import Query, QueryPlatform
+from reviewer.models import Reviewer
+
+
+class UnixsdExtractorTests(SimpleTestCase):
+
+    def test_recorded_corpus_equals_baseline(self):
+        """
+        The records extracted from the recorded CrossRef responses (conference papers, a journal article and an
+        unresolved DOI) are the same as the parser before `UnixsdExtractor` made of them.
+        """
+        output = StringIO()
+        call_command("benchmark_unixsd", "--check", "--repeat", "1", stdout=output)
+        self.assertIn("4 records are equal to the baseline", output.getvalue())
+
+
+class MergeHitsTests(SimpleTestCase):
+
+    def test_same_doi_is_one_publication(self):
+        hits = merge_hits([
+            ("IEEEXplore", [{"doi": "10.1109/ICSA.2020.00001", "title": "Adaptive Things", "abstract": ""}]),
+            ("Scopus", [{"doi": "10.1109/icsa.2020.00001", "title": "Adaptive things", "abstract": "We study things."}]),
+        ])
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0]["title"], "Adaptive Things")
+        # the fields missing in the first hit are taken from the others
+        self.assertEqual(hits[0]["abstract"], "We study things.")
+        self.assertEqual(hits[0]["source"], "IEEEXplore")
+        self.assertEqual(hits[0]["sources"], ["IEEEXplore", "Scopus"])
+
+    def test_same_title_without_doi_is_one_publication(self):
+        hits = merge_hits([
+            ("IEEEXplore", [{"doi": "10.1109/icsa.2020.00001", "title": "Adaptive Things!"}]),
+            ("Scopus", [{"doi": "", "title": "adaptive things", "year": "2020"}]),
+        ])
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0]["year"], "2020")
+        self.assertEqual(hits[0]["sources"], ["IEEEXplore", "Scopus"])
+
+    def test_different_dois_with_the_same_title_stay_apart(self):
+        hits = merge_hits([
+            ("IEEEXplore", [{"doi": "10.1109/icsa.2020.00001", "title": "Adaptive Things"}]),
+            ("Scopus", [{"doi": "10.48550/arxiv.2001.00001", "title": "Adaptive Things"}]),
+        ])
+        self.assertEqual([hit["doi"] for hit in hits], ["10.1109/icsa.2020.00001", "10.48550/arxiv.2001.00001"])
+        self.assertEqual([hit["id"] for hit in hits], [0, 1])
+
+    def test_hits_keep_their_order(self):
+        hits = merge_hits([
+            ("IEEEXplore", [{"doi": "10.1/a", "title": "A"}, {"doi": "10.1/b", "title": "B"}, {"title": ""}]),
+            ("Scopus", [{"doi": "10.1/c", "title": "C"}, {"doi": "10.1/A", "title": "A"}]),
+        ])
+        # a hit without a DOI and a title is skipped
+        self.assertEqual([hit["title"] for hit in hits], ["A", "B", "C"])
+        self.assertEqual([hit["id"] for hit in hits], [0, 1, 2])
+        self.assertEqual(hits[0]["sources"], ["IEEEXplore", "Scopus"])
+
+
+BIBTEX = """
+@string{ icsa = "International Conference on Software Architecture" }
+@comment{ this entry is skipped }
+@inproceedings{doe2020,
+  author    = {Jane Doe and John Smith},
+  title     = {Adaptive {IoT} Architectures
+               for Things},
+  booktitle = "2020 IEEE " # icsa,
+  year      = 2020,
+  doi       = {10.1109/ICSA.2020.00001},
+}
+@article(lopez2021,
+  author   = "Lopez, Ana",
+  title    = "Mapping (studies) at scale",
+  journal  = {Journal of Systems and Software},
+  keywords = {mapping; scale},
+  year     = {2021}
+)
+"""
+
+
+class BibTeXTokenizerTests(SimpleTestCase):
+
+    def test_entries(self):
+        entries = list(read_bibtex([BIBTEX]))
+        self.assertEqual([(entry.entry_type, entry.key) for entry in entries],
+                         [("inproceedings", "doe2020"), ("article", "lopez2021")])
+        self.assertEqual(entries[0].fields["title"], "Adaptive IoT Architectures for Things")
+        self.assertEqual(entries[0].fields["booktitle"], "2020 IEEE International Conference on Software Architecture")
+        self.assertEqual(entries[0].fields["year"], "2020")
+        self.assertEqual(entries[1].fields["title"], "Mapping (studies) at scale")
+        self.assertEqual(entries[1].keywords, ["mapping", "scale"])
+
+    def test_entries_split_across_chunks(self):
+        expected = list(read_bibtex([BIBTEX]))
+        for size in [1, 2, 7, 64]:
+            with self.subTest(size=size):
+                chunks = [BIBTEX[start:start + size] for start in range(0, len(BIBTEX), size)]
+                self.assertEqual(list(read_bibtex(chunks)), expected)
+        for split in range(len(BIBTEX)):
+            with self.subTest(split=split):
+                self.assertEqual(list(read_bibtex([BIBTEX[:split], BIBTEX[split:]])), expected)
+
+    def test_character_split_across_chunks(self):
+        data = "@article{muller, title = {Müller's Study}, year = 2020}".encode("utf-8")
+        split = data.index("ü".encode("utf-8")) + 1
+        entries = list(read_bibtex(decode_chunks([data[:split], data[split:]])))
+        self.assertEqual(entries[0].fields["title"], "Müller's Study")
+
+
+@override_settings(CROSSREF_OFFLINE=True)
+class DOIParserTests(TestCase):
+    """
+        The responses of CrossRef come from an empty cache in memory, a DOI which is not cached is answered by 504.
+    """
+    conference_doi = "10.1109/icsa.2020.00001"
+
+    def setUp(self):
+        patcher = mock.patch.object(crossref_cache, "cache", LocMemCache("crossref-tests", {}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        crossref_cache.set(self.conference_doi, DOIParser.xml_type, 200,
+                           (CORPUS / "conference_paper.xml").read_text(encoding="utf-8"))
+
+    def test_doi_is_normalized_before_the_cache(self):
+        for doi in ["https://doi.org/10.1109/ICSA.2020.00001", " doi:10.1109/ICSA.2020.00001 "]:
+            with self.subTest(doi=doi):
+                parser = DOIParser(doi)
+                self.assertEqual(parser.doi, self.conference_doi)
+                self.assertEqual(parser.xml_resp.status_code, 200)
+                self.assertEqual(parser.read_record().title, "Adaptive Architectures for Things")
+
+    def test_doi_is_normalized_before_the_store(self):
+        MetadataRecord.objects.create(doi="10.1000/stored", entry_type="article", fields={
+            "title": "Stored Study", "author": "Doe, Jane", "journal": "Journal of Tests", "year": "2020",
+        })
+        parser = DOIParser("https://dx.doi.org/10.1000/STORED")
+        self.assertEqual(parser.read_record().title, "Stored Study")
+        self.assertEqual(parser.field_stages["title"], "store")
+
+    def test_record_with_abstract_needs_no_json(self):
+        parser = DOIParser(self.conference_doi)
+        record = parser.complete_record()
+        self.assertEqual(record.abstract, "We study things.")
+        self.assertEqual(record.keywords, [])
+        self.assertIsNone(parser.json_resp)
+
+    def test_missing_abstract_is_taken_from_json(self):
+        journal_doi = "10.1016/j.jss.2021.111111"
+        crossref_cache.set(journal_doi, DOIParser.xml_type, 200,
+                           (CORPUS / "journal_article.xml").read_text(encoding="utf-8"))
+        crossref_cache.set(journal_doi, DOIParser.json_type, 200,
+                           '{"abstract": "<jats:p>Many studies.</jats:p>", "subject": ["Software"]}')
+        parser = DOIParser(journal_doi)
+        record = parser.complete_record()
+        self.assertEqual(record.abstract, "Many studies.")
+        self.assertEqual(record.field_stages["abstract"], "json")
+        # the keywords are only taken if they are asked for
+        self.assertEqual(record.keywords, [])
+
+    @override_settings(CROSSREF_JSON_FIELDS=["abstract", "keywords"])
+    def test_keywords_are_opt_in(self):
+        crossref_cache.set(self.conference_doi, DOIParser.json_type, 200, '{"subject": ["Software", "Testing"]}')
+        parser = DOIParser(self.conference_doi)
+        record = parser.complete_record()
+        self.assertIsNotNone(parser.json_resp)
+        self.assertEqual(record.keywords, ["software", "testing"])
+        self.assertEqual(record.abstract, "We study things.")
+
+
+def chunked(text: str, size: int) -> list:
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+RIS = """TY  - JOUR
+TI  - Mapping studies
+  at scale
+AU  - Lopez, Ana
+AU  - Smith J.
+JO  - Journal of Systems and Software
+PY  - 2021
+DO  - 10.1016/j.jss.2021.111111
+KW  - mapping
+KW  - scale
+ER  - 
+TY  - CONF
+TI  - Adaptive Things
+AU  - Doe, Jane
+T2  - International Conference on Software Architecture
+PY  - 2020
+ER  - 
+"""
+
+# Scopus, the abstract is quoted and contains a line feed, a form feed, a record separator and a line separator
+CSV = ('\ufeffAuthors,Title,Year,Source title,DOI,Abstract,Author Keywords,Index Keywords,Document Type\r\n'
+       '"Doe J., Smith J.",Adaptive Things,2020,ICSA,10.1109/ICSA.2020.00001,'
+       '"First line\nsecond\x0cthird\x1efourth\u2028fifth",self-adaptive,IoT,Conference Paper\r\n'
+       '"Lopez A.",Mapping studies,2021,Journal of Systems and Software,,"Short, quoted",,,Article\r\n')
+
+# Web of Science, tab-delimited
+TSV = ('AU\tTI\tSO\tPY\tDI\tDT\n'
+       'Doe, J; Smith, J\tAdaptive Things\tICSA\t2020\t10.1109/ICSA.2020.00001\tProceedings Paper\n')
+
+JSONL = '\n'.join([
+    # CSL-JSON of CrossRef, the abstract contains a line separator and a next line character
+    '{"DOI": "10.1109/ICSA.2020.00001", "type": "proceedings-article", "title": ["Adaptive Things"], '
+    '"author": [{"given": "Jane", "family": "Doe"}], "container-title": ["ICSA"], '
+    '"issued": {"date-parts": [[2020, 3]]}, "abstract": "<jats:p>First\u2028second third\x85fourth</jats:p>"}',
+    '',
+    'not json',
+    # OpenAlex
+    '{"doi": "https://doi.org/10.1016/j.jss.2021.111111", "display_name": "Mapping studies", "type": "article", '
+    '"publication_year": 2021, "authorships": [{"author": {"display_name": "Ana Lopez"}}], '
+    '"primary_location": {"source": {"display_name": "Journal of Systems and Software"}}, '
+    '"abstract_inverted_index": {"Many": [0], "studies": [1]}}',
+])
+
+
+class ImporterTests(SimpleTestCase):
+
+    def read(self, reader, text: str) -> list:
+        """
+        :return: the entries of the whole text, checked to be the same when the text is split into chunks
+        """
+        entries = list(reader([text]))
+        for size in [1, 3, 16]:
+            with self.subTest(size=size):
+                self.assertEqual(list(reader(chunked(text, size))), entries)
+        return entries
+
+    def test_iter_lines_splits_at_line_feeds_only(self):
+        text = "a\r\nb\x0cc\x1ed\x85e\u2028f\nlast"
+        self.assertEqual(list(iter_lines([text])), ["a\r\n", "b\x0cc\x1ed\x85e\u2028f\n", "last"])
+        self.assertEqual(list(iter_lines(chunked(text, 1))), list(iter_lines([text])))
+
+    def test_ris(self):
+        entries = self.read(read_ris, RIS)
+        self.assertEqual([(entry.entry_type, entry.key) for entry in entries],
+                         [("article", "10.1016/j.jss.2021.111111"), ("inproceedings", "ris-2")])
+        self.assertEqual(entries[0].fields["title"], "Mapping studies at scale")
+        self.assertEqual(entries[0].fields["author"], "Lopez, Ana and Smith, J.")
+        self.assertEqual(entries[0].keywords, ["mapping", "scale"])
+        self.assertEqual(entries[1].fields["booktitle"], "International Conference on Software Architecture")
+
+    def test_csv(self):
+        entries = self.read(read_csv, CSV)
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0].entry_type, "inproceedings")
+        self.assertEqual(entries[0].fields["booktitle"], "ICSA")
+        self.assertEqual(entries[0].fields["author"], "Doe, J. and Smith, J.")
+        self.assertEqual(entries[0].fields["abstract"], "First line second third fourth fifth")
+        self.assertEqual(entries[0].keywords, ["self-adaptive", "IoT"])
+        self.assertEqual(entries[1].key, "csv-2")
+        self.assertEqual(entries[1].fields["abstract"], "Short, quoted")
+
+    def test_tab_delimited(self):
+        entries = self.read(read_csv, TSV)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].entry_type, "inproceedings")
+        self.assertEqual(entries[0].fields["author"], "Doe, J and Smith, J")
+        self.assertEqual(entries[0].doi, "10.1109/ICSA.2020.00001")
+
+    def test_jsonl(self):
+        entries = self.read(read_jsonl, JSONL)
+        self.assertEqual([entry.entry_type for entry in entries], ["inproceedings", "article"])
+        self.assertEqual(entries[0].fields["abstract"], "First second third fourth")
+        self.assertEqual(entries[0].fields["author"], "Doe, Jane")
+        self.assertEqual(entries[0].fields["year"], "2020")
+        self.assertEqual(entries[1].doi, "https://doi.org/10.1016/j.jss.2021.111111")
+        self.assertEqual(entries[1].fields["journal"], "Journal of Systems and Software")
+        self.assertEqual(entries[1].fields["abstract"], "Many studies")
+
+    def test_get_format(self):
+        self.assertEqual(get_format("scopus.CSV"), "csv")
+        self.assertEqual(get_format("savedrecs.txt"), "txt")
+        self.assertEqual(get_format("works.jsonl"), "jsonl")
+        self.assertEqual(get_format("export", "RIS"), "ris")
+        self.assertIsNone(get_format("library.xlsx"))
+        self.assertIsNone(get_format("library"))
+
+
+class FakePlatformSearch:
+    """
+        Answers the searches instead of the platforms, each platform has `total` results.
+    """
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.calls = []
+
+    def __call__(self, query_platform, query: str, max_results: int, start: int = 0):
+        self.calls.append((query_platform.source, query, start, max_results))
+        return [
+            {"doi": f"10.1000/{query_platform.source.lower()}.{i}", "title": f"{query_platform.source} result {i}"}
+            for i in range(start, min(start + max_results, self.total))
+        ], None
+
+
+@override_settings(WEB_SEARCH_PREFETCH=False)
+class CachedSearchTests(TestCase):
+
+    def setUp(self):
+        self.reviewer = Reviewer.objects.create_user(email="reviewer@example.org", password="password")
+        self.paged = QueryPlatform.objects.create(
+            key="key", source="IEEEXplore", url="https://ieeexplore.example.org/api", user=self.reviewer,
+            params='{"params": {"apikey": %key%, "querytext": %query%, "max_records": %max_results%, '
+                   '"start_record": %start%}}',
+            page_size=10, first_index=1)
+        self.not_paged = QueryPlatform.objects.create(
+            key="key", source="Scopus", url="https://scopus.example.org/api", user=self.reviewer,
+            params='{"params": {"apiKey": %key%, "query": %query%, "count": %max_results%}}')
+
+    def search(self, fake: FakePlatformSearch, query: str, needed: int, max_results: int = 25, **kwargs):
+        with mock.patch("publication.web_search.search_platform", fake):
+            return cached_search([self.paged], query, max_results, self.reviewer, needed=needed, **kwargs)
+
+    def test_results_are_fetched_page_by_page(self):
+        fake = FakePlatformSearch(total=100)
+        results = self.search(fake, "self adaptive", needed=10)
+        self.assertEqual(len(results.hits), 10)
+        self.assertTrue(results.more)
+        self.assertEqual(fake.calls, [("IEEEXplore", "self adaptive", 0, 10)])
+
+        results = self.search(fake, "self adaptive", needed=30)
+        self.assertEqual(len(results.hits), 25)
+        self.assertFalse(results.more)
+        # the results stored before are not asked again, the last page is cut at max_results
+        self.assertEqual(fake.calls[1:], [("IEEEXplore", "self adaptive", 10, 10), ("IEEEXplore", "self adaptive", 20, 5)])
+
+        stored = Query.objects.get()
+        self.assertEqual((stored.fetched, stored.exhausted, len(stored.results)), (25, True, 25))
+
+    def test_same_normalized_query_is_reused(self):
+        fake = FakePlatformSearch(total=100)
+        self.search(fake, "self adaptive", needed=10)
+        results = self.search(fake, "  self   adaptive ", needed=10)
+        self.assertEqual(Query.objects.count(), 1)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertIsNotNone(results.cached_at)
+
+        # another case, or another max_results, is another search
+        self.search(fake, "Self Adaptive", needed=10)
+        self.search(fake, "self adaptive", needed=10, max_results=50)
+        self.assertEqual(Query.objects.count(), 3)
+
+    def test_platform_without_more_results_is_exhausted(self):
+        fake = FakePlatformSearch(total=12)
+        results = self.search(fake, "self adaptive", needed=25)
+        self.assertEqual(len(results.hits), 12)
+        self.assertFalse(results.more)
+        self.assertEqual([call[2:] for call in fake.calls], [(0, 10), (10, 10)])
+
+        self.search(fake, "self adaptive", needed=50)
+        self.assertEqual(len(fake.calls), 2)
+
+    def test_refresh_fetches_again(self):
+        fake = FakePlatformSearch(total=100)
+        self.search(fake, "self adaptive", needed=10)
+        results = self.search(fake, "self adaptive", needed=10, refresh=True)
+        self.assertEqual(len(fake.calls), 2)
+        self.assertEqual(len(results.hits), 10)
+        self.assertIsNone(results.cached_at)
+
+    @override_settings(WEB_SEARCH_CACHE_TIMEOUT=0)
+    def test_old_results_are_fetched_again(self):
+        fake = FakePlatformSearch(total=100)
+        self.search(fake, "self adaptive", needed=10)
+        self.search(fake, "self adaptive", needed=10)
+        self.assertEqual(len(fake.calls), 2)
+        self.assertEqual(Query.objects.count(), 1)
+
+    def test_platform_without_pages_is_asked_once(self):
+        fake = FakePlatformSearch(total=100)
+        with mock.patch("publication.web_search.search_platform", fake):
+            queries = stored_queries([self.not_paged], "self adaptive", 25, self.reviewer)
+            self.assertEqual(extend_queries(queries, 10), [])
+            self.assertEqual(extend_queries(queries, 50), [])
+        self.assertEqual(fake.calls, [("Scopus", "self adaptive", 0, 25)])
+        self.assertEqual((queries[0].fetched, queries[0].exhausted), (25, True))
+
+    def test_page_fetched_meanwhile_is_not_stored_twice(self):
+        fake = FakePlatformSearch(total=100)
+        with mock.patch("publication.web_search.search_platform", fake):
+            queries = stored_queries([self.paged], "self adaptive", 25, self.reviewer)
+            # another request has stored the first page since these queries were read
+            Query.objects.filter(id=queries[0].id).update(fetched=10, results=[{"doi": "10.1000/other"}] * 10)
+            extend_queries(queries, 10)
+        stored = Query.objects.get()
+        self.assertEqual(stored.fetched, 10)
+        self.assertEqual(stored.results, [{"doi": "10.1000/other"}] * 10)
+
+    def test_invalid_max_results_falls_back_to_default(self):
+        self.client.force_login(self.reviewer)
+        fake = FakePlatformSearch(total=100)
+        for max_results in ["abc", "-5", "0", ""]:
+            with self.subTest(max_results=max_results), \
+                    mock.patch("publication.web_search.search_platform", fake):
+                response = self.client.get(
+                    reverse("add_publication_by_web", kwargs={"list_id": 1}),
+                    {"query": "self adaptive", "source": self.paged.id, "max_results": max_results})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["max_results"], 25)
+
+
+def fake_response(status_code: int = 200, headers: None | dict = None) -> Response:
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b""
+    return response
+
+
+class FakeClock:
+    """
+        Replaces the `time` module of the rate limiter, sleeping moves the clock on at once.
+    """
+
+    def __init__(self) -> None:
+        self.now = 1_000.0
+        self.slept = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@override_settings(HTTP_RATE_LIMIT=10, HTTP_RATE_LIMITS={}, HTTP_RATE_LIMIT_MAX_WAIT=60, HTTP_BACKOFF_FACTOR=0.5)
+class RateLimiterTests(SimpleTestCase):
+    host = "api.example.org"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.clock = FakeClock()
+        patcher = mock.patch("publication.rate_limit.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(directory.name)
+
+    def test_headers(self):
+        self.assertEqual(parse_interval("1s"), 1)
+        self.assertEqual(parse_interval("2m"), 120)
+        self.assertEqual(parse_interval("500ms"), 0.5)
+        self.assertIsNone(parse_interval("soon"))
+        self.assertIsNone(parse_interval("0s"))
+        self.assertEqual(parse_retry_after("120", self.clock.now), 120)
+        self.assertEqual(parse_retry_after("Tue, 14 Nov 2023 22:13:20 GMT", 1_699_999_990.0), 10)
+        self.assertIsNone(parse_retry_after("", self.clock.now))
+        self.assertTrue(is_throttled(fake_response(429)))
+        self.assertTrue(is_throttled(fake_response(403, {"X-Mashery-Error-Code": "ERR_403_DEVELOPER_OVER_QPS"})))
+        self.assertFalse(is_throttled(fake_response(403)))
+
+    def test_announced_rate_is_followed(self):
+        self.limiter.observe(self.host, fake_response(200, {"X-Rate-Limit-Limit": "50", "X-Rate-Limit-Interval": "1s"}))
+        self.assertEqual(self.limiter.state(self.host)["announced"], 50)
+        # the configured rate is not exceeded
+        self.limiter.observe(self.host, fake_response(200), rate=2)
+        self.assertEqual(self.limiter.state(self.host)["rate"], 2)
+
+        # a quota without an interval is not a rate
+        self.limiter.observe("quota.example.org", fake_response(200, {"X-RateLimit-Limit": "20000"}))
+        self.assertNotIn("announced", self.limiter.state("quota.example.org"))
+
+    def test_tokens(self):
+        # a bucket holds a second of requests, the next one waits for its token
+        for _ in range(10):
+            self.assertEqual(self.limiter.acquire(self.host), 0)
+        self.assertAlmostEqual(self.limiter.acquire(self.host), 0.1)
+
+    def test_refused_request_halves_the_rate_and_blocks_the_host(self):
+        self.limiter.observe(self.host, fake_response(429, {"Retry-After": "3"}))
+        state = self.limiter.state(self.host)
+        self.assertEqual(state["rate"], 5)
+        self.assertEqual(state["throttled"], 1)
+        self.assertEqual(state["blocked_until"], self.clock.now + 3)
+        self.assertEqual(self.limiter.acquire(self.host), 3)
+
+    def test_refused_requests_back_off(self):
+        blocked = []
+        for _ in range(4):
+            self.limiter.observe(self.host, fake_response(429))
+            blocked.append(self.limiter.state(self.host)["blocked_until"] - self.clock.now)
+        self.assertEqual(blocked, [0.5, 1, 2, 4])
+        self.assertEqual(self.limiter.state(self.host)["rate"], 0.625)
+
+        # the backoff starts again after a successful request
+        self.clock.sleep(4)
+        self.limiter.observe(self.host, fake_response(200))
+        self.assertEqual(self.limiter.state(self.host)["refused"], 0)
+        self.limiter.observe(self.host, fake_response(429))
+        self.assertEqual(self.limiter.state(self.host)["refused"], 1)
+        # the lowered rate still spaces the requests out
+        self.assertAlmostEqual(self.limiter.state(self.host)["blocked_until"] - self.clock.now, 1 / 0.5625)
+
+    @override_settings(HTTP_RATE_LIMIT_MAX_WAIT=5)
+    def test_backoff_is_bounded(self):
+        self.limiter = RateLimiter(self.limiter.directory)
+        for _ in range(10):
+            self.limiter.observe(self.host, fake_response(429))
+        self.assertEqual(self.limiter.state(self.host)["blocked_until"] - self.clock.now, 5)
+
+    def test_rate_is_regained(self):
+        self.limiter.observe(self.host, fake_response(429))
+        rates = []
+        for _ in range(12):
+            self.limiter.observe(self.host, fake_response(200))
+            rates.append(self.limiter.state(self.host)["rate"])
+        self.assertAlmostEqual(rates[0], 5.5)
+        self.assertEqual(rates[-1], 10)
+        self.assertEqual(rates, sorted(rates))
+
+    @override_settings(HTTP_RATE_LIMIT_MAX_WAIT=10)
+    def test_spent_quota_fails_at_once(self):
+        self.limiter = RateLimiter(self.limiter.directory)
+        self.limiter.observe(self.host, fake_response(200, {"X-Rate-Limit-Remaining": "0", "X-Rate-Limit-Reset": "3600"}))
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.acquire(self.host)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_client_retries_refused_requests_through_the_limiter(self):
+        answers = [fake_response(429), fake_response(429, {"Retry-After": "2"}), fake_response(200)]
+        with override_settings(HTTP_RATE_LIMIT_DIR=self.limiter.directory):
+            client = HttpClient()
+        with mock.patch.object(client.session, "request", side_effect=answers) as request:
+            response = client.get(f"https://{self.host}/works")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(self.clock.slept, [0.5, 2])
+        self.assertEqual(client.stats()[self.host]["throttled"], 2)
+
+
+class NormalizeDOITests(SimpleTestCase):
+
+    def test_normalize_doi(self):
+        cases = [
+            ("10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("  10.1109/icsa.2020.00001\n", "10.1109/icsa.2020.00001"),
+            ("https://doi.org/10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("http://dx.doi.org/10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("HTTPS://DOI.ORG/10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("doi.org/10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("https://doi.org/10.1002/%28SICI%291097-4571", "10.1002/(sici)1097-4571"),
+            ("doi:10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("DOI: 10.1109/ICSA.2020.00001", "10.1109/icsa.2020.00001"),
+            ("{10.1109/ICSA.2020.00001}", "10.1109/icsa.2020.00001"),
+            ('"10.1109/ICSA.2020.00001"', "10.1109/icsa.2020.00001"),
+            # only a link is unquoted, a DOI may contain a "%"
+            ("10.1000/100%25", "10.1000/100%25"),
+            ("   ", ""),
+        ]
+        for doi, normalized in cases:
+            with self.subTest(doi=doi):
+                self.assertEqual(normalize_doi(doi), normalized)
+
+    def test_is_doi(self):
+        self.assertTrue(is_doi("10.1109/icsa.2020.00001"))
+        self.assertTrue(is_doi("10.1000.10/abc"))
+        self.assertFalse(is_doi(""))
+        self.assertFalse(is_doi("11.1109/icsa"))
+        self.assertFalse(is_doi("10.1109/"))
+        self.assertFalse(is_doi("10.1109/icsa 2020"))
+        self.assertFalse(is_doi("https://doi.org/10.1109/icsa.2020.00001"))
+
+    def test_normalize_doi_list(self):
+        self.assertEqual(normalize_doi_list([
+            "10.1109/ICSA.2020.00002", "https://doi.org/10.1109/icsa.2020.00001", "", "doi:10.1109/ICSA.2020.00002",
+            " ", "10.1109/icsa.2020.00001",
+        ]), ["10.1109/icsa.2020.00002", "10.1109/icsa.2020.00001"])
+
+
+class MergePublicationTests(TestCase):
+    """
+        Migration 0014 merges the publications which differ only by the case of their DOI.
+    """
+    migration = importlib.import_module("publication.migrations.0014_lowercase_publication_doi")
+
+    def test_case_variants_are_merged(self):
+        reviewer = Reviewer.objects.create_user(email="reviewer@example.org", password="password")
+        other_reviewer = Reviewer.objects.create_user(email="other@example.org", password="password")
+        mapping = Mapping.objects.create(name="mapping", leader=reviewer, secret_key="secret")
+        venue = Venue.objects.create(name="venue", type="J")
+        kept = Publication.objects.create(title="title", clean_title="title", year=2020, venue=venue,
+                                          doi="10.1109/ICSA.2020.00001")
+        duplicate = Publication.objects.create(title="title", clean_title="title", year=2020, venue=venue,
+                                               doi="10.1109/icsa.2020.00001")
+        other = Publication.objects.create(title="other", clean_title="other", year=2020, venue=venue,
+                                           doi="10.1109/ICSA.2020.00002")
+        shared_author, author = Author.objects.create(first_name="A", last_name="B"), \
+            Author.objects.create(first_name="C", last_name="D")
+        kept.authors.add(shared_author)
+        duplicate.authors.add(shared_author, author)
+
+        shared_list = PublicationList.objects.create(name="shared", reviewer=reviewer, mapping=mapping)
+        shared_list.publications.add(kept, duplicate, other)
+        duplicate_list = PublicationList.objects.create(name="duplicate", reviewer=reviewer, mapping=mapping)
+        duplicate_list.publications.add(duplicate)
+
+        relevant = ReviewField.objects.create(name="relevant", type="B", mapping=mapping)
+        ReviewFieldValueBoolean.objects.create(review_field=relevant, publication=kept, reviewer=reviewer, value=True)
+        ReviewFieldValueBoolean.objects.create(
+            review_field=relevant, publication=duplicate, reviewer=reviewer, value=False)
+        ReviewFieldValueBoolean.objects.create(
+            review_field=relevant, publication=duplicate, reviewer=other_reviewer, value=False)
+        code = ReviewField.objects.create(name="code", type="C", mapping=mapping)
+        for publication, value in [(kept, "x"), (duplicate, "x"), (duplicate, "y")]:
+            ReviewFieldValueCoding.objects.create(
+                review_field=code, publication=publication, reviewer=reviewer, value=value)
+
+        self.migration.lowercase_doi(apps, None)
+
+        self.assertFalse(Publication.objects.filter(id=duplicate.id).exists())
+        kept.refresh_from_db()
+        self.assertEqual(kept.doi, "10.1109/icsa.2020.00001")
+        self.assertEqual(Publication.objects.get(id=other.id).doi, "10.1109/icsa.2020.00002")
+        self.assertEqual(sorted(kept.authors.values_list("id", flat=True)), [shared_author.id, author.id])
+        self.assertEqual(sorted(shared_list.publications.values_list("id", flat=True)), [kept.id, other.id])
+        self.assertEqual(list(duplicate_list.publications.values_list("id", flat=True)), [kept.id])
+        self.assertEqual(
+            sorted(ReviewFieldValueBoolean.objects.filter(publication=kept).values_list("reviewer__email", "value")),
+            [("other@example.org", False), ("reviewer@example.org", True)])
+        self.assertEqual(
+            sorted(ReviewFieldValueCoding.objects.filter(publication=kept).values_list("value", flat=True)),
+            ["x", "y"])
+
+
+class ImportJobTests(TestCase):
+
+    def setUp(self):
+        self.reviewer = Reviewer.objects.create_user(email="reviewer@example.org", password="password")
+        mapping = Mapping.objects.create(name="mapping", leader=self.reviewer, secret_key="secret")
+        self.publication_list = PublicationList.objects.create(name="list", reviewer=self.reviewer, mapping=mapping)
+
+    def create_job(self, doi_list: None | list[str] = None, **fields) -> ImportJob:
+        doi_list = doi_list or []
+        return ImportJob.objects.create(publication_list=self.publication_list, reviewer=self.reviewer,
+                                        payload={"doi_list": doi_list}, total=len(doi_list), **fields)
+
+    def test_job_is_claimed_once(self):
+        job = self.create_job()
+        self.assertTrue(claim_import_job(job.id, "first"))
+        self.assertFalse(claim_import_job(job.id, "second"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ("R", "first"))
+        self.assertIsNotNone(job.started_at)
+
+    def test_oldest_job_is_claimed_next(self):
+        first, second = self.create_job(), self.create_job()
+        self.create_job(status="D")
+        self.assertEqual(claim_next_import_job("worker"), first)
+        self.assertEqual(claim_next_import_job("worker"), second)
+        self.assertIsNone(claim_next_import_job("worker"))
+
+    def test_stale_jobs_are_requeued(self):
+        stale, running = self.create_job(status="R", worker="stopped"), self.create_job(status="R", worker="alive")
+        finished = self.create_job(status="D", worker="stopped")
+        ImportJob.objects.filter(id__in=[stale.id, finished.id]).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_import_jobs(60), 1)
+        jobs = ImportJob.objects.in_bulk([stale.id, running.id, finished.id])
+        self.assertEqual((jobs[stale.id].status, jobs[stale.id].worker), ("P", ""))
+        self.assertEqual((jobs[running.id].status, jobs[running.id].worker), ("R", "alive"))
+        self.assertEqual(jobs[finished.id].status, "D")
+        self.assertEqual(claim_next_import_job("worker"), stale)
+
+    @mock.patch("builtins.print")
+    def test_failed_job_keeps_the_error(self, _):
+        job = self.create_job(["10.1109/icsa.2020.00001"])
+        self.assertTrue(claim_import_job(job.id, "worker"))
+        job.refresh_from_db()
+        with mock.patch("publication.views.get_publications_by_list_of_doi_list",
+                        side_effect=RuntimeError("CrossRef cannot be reached")):
+            run_import_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "F")
+        self.assertIn("CrossRef cannot be reached", job.errors)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.pending, 1)
+
+    def test_requeued_job_continues_after_the_last_chunk(self):
+        doi_list = [f"10.1000/{i}" for i in range(5)]
+        job = self.create_job(doi_list, resolved=1, failed=1)
+        self.assertTrue(claim_import_job(job.id, "worker"))
+        job.refresh_from_db()
+        with mock.patch("publication.views.get_publications_by_list_of_doi_list", return_value=[]) as resolve:
+            run_import_job(job, chunk_size=2)
+
+        self.assertEqual([call.args[0] for call in resolve.call_args_list], [doi_list[2:4], doi_list[4:]])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.resolved, job.failed), ("D", 1, 4))
+        self.assertEqual(job.errors, "".join(f"cannot import {doi}\n" for doi in doi_list[2:]))
+
+
+class BulkPublicationWriterTests(TestCase):
+
+    def setUp(self):
+        self.venue = Venue.objects.create(name="ICSA", type="P")
+        self.doe = Author.objects.create(last_name="Doe", first_name="Jane")
+        self.architecture = Keyword.objects.create(name="architecture")
+        self.existing = Publication.objects.create(
+            doi="10.1109/icsa.2020.00001", title="Existing", clean_title="existing", year=2020, venue=self.venue)
+        self.existing.authors.add(self.doe)
+        self.existing.keywords.add(self.architecture)
+        FullText.objects.create(publication=self.existing, type="T", url="https://example.org/existing")
+
+    def record(self, doi: str, title: str, keywords: list[str], affiliation: None | str = None) -> CrossRefRecord:
+        return CrossRefRecord(
+            doi=doi, title=title, year="2020", venue=VenueRecord("ICSA", "P", publisher="IEEE"),
+            authors=[AuthorRecord("Jane", "Doe"), AuthorRecord("Rick", "Roe", affiliation)],
+            keywords=keywords, full_texts=[FullTextRecord("https://example.org/full-text", "T")],
+        )
+
+    def test_existing_entities_are_reused(self):
+        records = [
+            self.record("10.1109/icsa.2020.00001", "Existing (changed)", ["architecture", "microservices"]),
+            self.record("10.1109/icsa.2020.00002", "New", ["microservices"], "University, Stuttgart, Germany"),
+            # the same publication twice in one batch
+            self.record("10.1109/icsa.2020.00002", "New", ["microservices"], "University, Stuttgart, Germany"),
+            self.record("", "Without a DOI", []),
+        ]
+        publications = BulkPublicationWriter().write(records)
+        self.assertEqual(sorted(publications), ["10.1109/icsa.2020.00001", "10.1109/icsa.2020.00002", "withoutadoi"])
+
+        self.assertEqual(Venue.objects.count(), 1)
+        self.assertEqual(Venue.objects.get().publisher, "IEEE")
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Keyword.objects.count(), 2)
+        self.assertEqual(Publication.objects.count(), 3)
+        self.assertEqual(Source.objects.count(), 1)
+        self.assertEqual(Affiliation.objects.get().institute, "University, Stuttgart")
+        self.assertEqual(Author.objects.get(last_name="Roe").affiliation.country.name, "Germany")
+
+        # an existing publication is kept as it is, only its authors and keywords are added
+        existing = publications["10.1109/icsa.2020.00001"]
+        self.assertEqual(existing.id, self.existing.id)
+        self.assertEqual(Publication.objects.get(id=existing.id).title, "Existing")
+        new = publications["10.1109/icsa.2020.00002"]
+        for publication, keywords in [(existing, ["architecture", "microservices"]), (new, ["microservices"])]:
+            with self.subTest(publication=publication.title):
+                self.assertEqual(sorted(publication.authors.values_list("last_name", flat=True)), ["Doe", "Roe"])
+                self.assertEqual(sorted(publication.keywords.values_list("name", flat=True)), keywords)
+                self.assertEqual(publication.full_text.count(), 1)
+        self.assertEqual(publications["withoutadoi"].doi, None)
+
+        # a second import of the same batch changes nothing
+        rows = [model.objects.count() for model in [Publication, Author, Keyword, FullText, Venue, Affiliation]]
+        links = [Publication.authors.through.objects.count(), Publication.keywords.through.objects.count()]
+        again = BulkPublicationWriter().write(records)
+        self.assertEqual({key: publication.id for key, publication in again.items()},
+                         {key: publication.id for key, publication in publications.items()})
+        self.assertEqual([model.objects.count() for model in [Publication, Author, Keyword, FullText, Venue,
+                                                              Affiliation]], rows)
+        self.assertEqual([Publication.authors.through.objects.count(),
+                          Publication.keywords.through.objects.count()], links)
+
+    def test_ensure_creates_the_missing_entities_only(self):
+        writer = BulkPublicationWriter()
+        keywords = writer.ensure(Keyword, [("architecture",), ("testing",), ("testing",)],
+                                 lambda key: Keyword(name=key[0]))
+        self.assertEqual(list(keywords), [("architecture",), ("testing",)])
+        self.assertEqual(keywords[("architecture",)], self.architecture)
+        self.assertIsNotNone(keywords[("testing",)].pk)
+        self.assertEqual(Keyword.objects.count(), 2)
+
+        # the instances are remembered, a second call makes no query
+        with self.assertNumQueries(0):
+            self.assertIs(writer.ensure(Keyword, [("testing",)], lambda key: Keyword(name=key[0]))[("testing",)],
+                          keywords[("testing",)])
+
+    def test_link_keeps_the_existing_rows(self):
+        roe = Author.objects.create(last_name="Roe", first_name="Rick")
+        BulkPublicationWriter().link(Publication.authors, [
+            (self.existing.id, self.doe.id), (self.existing.id, roe.id), (self.existing.id, roe.id),
+        ])
+        self.assertEqual(sorted(Publication.authors.through.objects.values_list("author_id", flat=True)),
+                         [self.doe.id, roe.id])
@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import AddPublicationByDOI, AddPublicationByBIB, AddPublicationsByWeb
+from .views import AddPublicationByDOI, AddPublicationByBIB, AddPublicationByFile, AddPublicationsByWeb, \
+	ImportJobProgressView
 
 urlpatterns = [
 	path('publications/add/web/<int:list_id>/', AddPublicationsByWeb.as_view(), name="add_publication_by_web"),
 	path('publications/add/doi/', AddPublicationByDOI.as_view(), name="add_publication_by_doi"),
 	path('publications/add/bib/', AddPublicationByBIB.as_view(), name="add_publication_by_bib_text"),
+	path('publications/add/file/', AddPublicationByFile.as_view(), name="add_publication_by_file"),
+	path('publications/jobs/<int:job_id>/', ImportJobProgressView.as_view(), name="import_job_progress"),
 ]
\ No newline at end of file
@@ -1,16 +1,18 @@
-import json
 import re
+from dataclasses import asdict
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
-from typing import Any, List
+from typing import Any, Dict, Iterable, List
 
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist, BadRequest
+from django.core.exceptions import BadRequest
+from django.db import transaction
 from django.views import View
 # from django
 from django.views.generic import TemplateView, CreateView
 from django.core.paginator import Paginator
-from django.http import HttpResponseBadRequest
+from django.http import HttpResponseBadRequest, JsonResponse, Http404
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404, redirect
 
@@ -19,65 +21,223 @@ from mapping.models import PublicationList, UserPreferences, Mapping
 from query.models import QueryPlatform, Query
 
 # from local app
-from .models import Publication, Keyword, FullTextAccess, FullText
-from .parsers import DOIParser, GenericModelFactory, \
-    IEEEXploreParser, ScopusParser  # , IEEEXploreParser, ScopusParser, get_publication_by_doi
-
-
-def get_publications_by_list_of_doi_list(doi_list: [], extra_infos=None) -> List[Publication]:
-    publications = []
-    for doi in doi_list:
-        # first, check if the DOI already exist in the database
-        try:
-            publication = Publication.objects.get(doi=doi)
-        except ObjectDoesNotExist:
-            doi_parser = DOIParser(doi)
-            publication = doi_parser.parse()
-
-        if publication is not None and isinstance(publication, Publication):
-            publication.save()
-
-            if extra_infos is not None and doi in extra_infos:
-                # such as provided abstract
-                for key, value in extra_infos[doi].items():
-                    if key in publication.__dict__ and len(publication.__dict__[key]) < len(value):
-                        publication.__dict__[key] = value
-                        publication.save()
-                    elif key == "keywords_list":
-                        for keyword in value:
-                            keyword_parser = GenericModelFactory(Keyword)
-                            keyword_object = keyword_parser.create_or_get(data={'keyword': keyword.strip().lower()})
-                            keyword_object.save()
-                            if len(publication.keywords.filter(id=keyword_object.id)) == 0:
-                                publication.keywords.add(keyword_object)
-                                publication.save()
-
-            publications.append(publication)
-    return publications
-
-
-def store_publications(publications: List[Publication], publication_list: PublicationList) ->None:
-    for publication in publications:
-        if publication not in publication_list.publications.all():
-            publication_list.publications.add(publication)
-            publication_list.save()
-
-            # check if the publication has any FullTextAccess within this mapping
-            full_text_access_list = FullTextAccess.objects.filter(mapping=publication_list.mapping) \
-                .filter(full_text__publication=publication)
-
-            if len(full_text_access_list) == 0:
-                full_text_access_object = FullTextAccess()
-                full_text_access_object.mapping = publication_list.mapping
-                full_texts = FullText.objects.filter(publication=publication)
-                if len(full_texts) == 0:
-                    full_text_object = FullText(publication=publication, type="P")
-                    full_text_object.save()
-                else:
-                    full_text_object = full_texts[0]
-
-                full_text_access_object.full_text = full_text_object
-                full_text_access_object.save()
+from .bibtex import BibTeXEntry, build_record, complete_record, decode_chunks, missing_fields, read_bibtex
+from .extractors import CrossRefRecord
+from .importers import FORMAT_KINDS, READERS, get_format
+from .jobs import enqueue_import_job
+from .models import Publication, FullTextAccess, FullText, ImportJob
+from .persistence import BulkPublicationWriter
+from .parsers import DOIParser, EntityCache, is_doi, normalize_doi_list, normalize_extra_infos
+from .web_search import cached_search, hit_entry, selected_hits
+
+
+def fetch_doi_parser(doi: str, stored_record: None | CrossRefRecord = None) -> DOIParser:
+    """
+    Downloads and reads the CrossRef record of a DOI, unless it was found in the local metadata store. It does not
+    touch the database, so it is safe to be run in a worker thread.
+    """
+    doi_parser = DOIParser(doi, stored_record, check_store=False)
+    doi_parser.prefetch()
+    return doi_parser
+
+
+def fetch_doi_parsers(doi_list: List[str], max_workers: int = 1) -> List[DOIParser]:
+    """
+    Fetches the CrossRef records of the given DOIs using a bounded pool of workers. The DOIs of the local metadata
+    store are not fetched.
+    :param doi_list: DOIs to be fetched
+    :param max_workers: the maximum number of concurrent requests, 1 (or less) fetches them one by one
+    :return: the parsers in the same order as the given DOIs
+    """
+    stored_records = DOIParser.find_stored_records(doi_list)
+    stored_list = [stored_records.get(doi) for doi in doi_list]
+    fetched = len(doi_list) - len(stored_records)
+    if max_workers <= 1 or fetched <= 1:
+        return [fetch_doi_parser(doi, stored_record) for doi, stored_record in zip(doi_list, stored_list)]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, fetched)) as executor:
+        return list(executor.map(fetch_doi_parser, doi_list, stored_list))
+
+
+def find_publications_by_doi(doi_list: List[str]) -> Dict[str, Publication]:
+    """
+    Finds the stored publications of the given (normalized) DOIs, in one query per chunk of DOIs.
+    :return: the publication of each found DOI
+    """
+    found = {}
+    for i in range(0, len(doi_list), EntityCache.chunk_size):
+        for publication in Publication.objects.filter(doi__in=doi_list[i:i + EntityCache.chunk_size]):
+            found[publication.doi] = publication
+    return found
+
+
+def get_publications_by_list_of_doi_list(doi_list: [], extra_infos=None, max_workers: int = None) -> List[Publication]:
+    """
+    :param doi_list: DOIs in any form (e.g. links), duplicates and empty strings are skipped
+    :param extra_infos: e.g. {doi: {"abstract": "...", "keywords_list": ["...", ...]}}
+    :param max_workers: the number of concurrent requests to CrossRef, `DOI_RESOLUTION_WORKERS` by default
+    :return: the publication of each found DOI, in the given order
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, "DOI_RESOLUTION_WORKERS", 1)
+
+    doi_list = normalize_doi_list(doi_list)
+
+    # first, check which DOIs already exist in the database
+    resolved = find_publications_by_doi(doi_list)
+    unknown_doi_list = [doi for doi in doi_list if doi not in resolved and is_doi(doi)]
+
+    # first phase: the network work and the parsing are done in parallel, nothing is written to the database
+    doi_parsers = dict(zip(unknown_doi_list, fetch_doi_parsers(unknown_doi_list, max_workers)))
+    records = []
+    for doi in unknown_doi_list:
+        record = doi_parsers[doi].check_record()
+        if record is not None:
+            records.append(record)
+
+    # second phase: all publications of the batch are stored with a few bulk queries in one transaction
+    entity_cache = EntityCache()
+    writer = BulkPublicationWriter(entity_cache)
+    with transaction.atomic():
+        resolved.update(writer.write(records))
+        if extra_infos is not None:
+            # such as provided abstract or keywords
+            writer.write_extra_infos(resolved, normalize_extra_infos(extra_infos))
+
+    return [resolved[doi] for doi in doi_list if doi in resolved]
+
+
+def get_publications_by_bibtex_entries(entries: List[BibTeXEntry], max_workers: int = None,
+                                       crossref_fields: None | List[str] = None,
+                                       source_name: str = "BibTeX") -> Dict[str, Publication]:
+    """
+    Builds the publications from the BibTeX entries themselves, also those without a DOI. CrossRef is asked only for
+    the entries which lack one of the `crossref_fields`, or which cannot be stored as they are.
+    :param entries: the entries of a BibTeX file
+    :param max_workers: the number of concurrent requests to CrossRef, `DOI_RESOLUTION_WORKERS` by default
+    :param crossref_fields: e.g. ["abstract"], `BIBTEX_CROSSREF_FIELDS` (none) by default, when empty CrossRef is not
+        asked at all
+    :param source_name: the source of the new publications
+    :return: the publication of each stored entry, keyed by the BibTeX key
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, "DOI_RESOLUTION_WORKERS", 1)
+    if crossref_fields is None:
+        crossref_fields = getattr(settings, "BIBTEX_CROSSREF_FIELDS", [])
+
+    records = {}
+    entry_keys = {}
+    for entry in entries:
+        record = build_record(entry)
+        if record.key:
+            records.setdefault(record.key, record)
+            entry_keys[entry.key] = record.key
+
+    # the publications of known DOIs are kept, only the information of the entries is added
+    known = find_publications_by_doi([key for key, record in records.items() if record.doi])
+    extra_infos = {}
+    for doi in known:
+        extra_infos[doi] = {"abstract": records[doi].abstract, "keywords_list": records[doi].keywords}
+        del records[doi]
+
+    if crossref_fields:
+        incomplete = [record for record in records.values() if record.doi and missing_fields(record, crossref_fields)]
+        doi_parsers = fetch_doi_parsers([record.doi for record in incomplete], max_workers)
+        for record, doi_parser in zip(incomplete, doi_parsers):
+            crossref_record = doi_parser.check_record()
+            if crossref_record is not None:
+                records[record.key] = complete_record(record, crossref_record, crossref_fields)
+
+    for record in records.values():
+        if record.error:
+            print(f"{record.key or record.title}: {record.error}")
+
+    writer = BulkPublicationWriter(EntityCache())
+    with transaction.atomic():
+        publications = writer.write(list(records.values()), source_name=source_name)
+        writer.write_extra_infos(known, extra_infos)
+    publications.update(known)
+
+    return {key: publications[record_key] for key, record_key in entry_keys.items() if record_key in publications}
+
+
+def store_publications(publications: List[Publication], publication_list: PublicationList) -> None:
+    """
+    Adds the publications to the list, with a few queries for all of them. Each publication gets a full text
+    access within the mapping of the list, if it has none.
+    """
+    publications = list({publication.id: publication for publication in publications}.values())
+    listed = set(publication_list.publications.filter(id__in=[publication.id for publication in publications])
+                 .values_list("id", flat=True))
+    new_publications = [publication for publication in publications if publication.id not in listed]
+    if not new_publications:
+        return
+
+    publication_list.publications.add(*new_publications)
+    publication_list.save()
+
+    # check which publications have no FullTextAccess within this mapping
+    accessible = set(FullTextAccess.objects.filter(mapping=publication_list.mapping)
+                     .filter(full_text__publication__in=new_publications)
+                     .values_list("full_text__publication_id", flat=True))
+    inaccessible = [publication for publication in new_publications if publication.id not in accessible]
+
+    full_texts = {}
+    for full_text in FullText.objects.filter(publication__in=inaccessible).order_by("id"):
+        full_texts.setdefault(full_text.publication_id, full_text)
+    new_full_texts = [
+        FullText(publication=publication, type="P")
+        for publication in inaccessible if publication.id not in full_texts
+    ]
+    FullText.objects.bulk_create(new_full_texts)
+    if any(full_text.pk is None for full_text in new_full_texts):
+        # the backend did not return the primary keys
+        new_full_texts = FullText.objects.filter(publication__in=inaccessible, type="P").order_by("id")
+    for full_text in new_full_texts:
+        full_texts.setdefault(full_text.publication_id, full_text)
+
+    FullTextAccess.objects.bulk_create([
+        FullTextAccess(mapping=publication_list.mapping, full_text=full_texts[publication.id])
+        for publication in inaccessible
+    ])
+
+
+def enqueue_entries(entries: Iterable[BibTeXEntry], publication_list: PublicationList, reviewer: Any, kind: str,
+                    mode: str = "entries") -> int:
+    """
+    Queues the import of the entries of a library file, one job per `BIBTEX_IMPORT_BATCH_SIZE` entries, so the
+    entries are not collected for the whole file.
+    :param entries: e.g. `read_bibtex(chunks)`
+    :param kind: see IMPORT_JOB_KINDS
+    :param mode: "entries": the publications are built from the entries, "doi": the DOIs are resolved at CrossRef
+    :return: the number of queued jobs
+    """
+    batch_size = getattr(settings, "BIBTEX_IMPORT_BATCH_SIZE", 1000)
+    jobs = 0
+    batch = []
+    extra_infos = {}
+    doi_list = []
+    for entry in entries:
+        if mode == "entries":
+            batch.append(asdict(entry))
+        elif entry.doi is not None:
+            doi_list.append(entry.doi)
+            # for other extra information add here, see BibTeXEntry.extra_info
+            extra_info = entry.extra_info()
+            if extra_info:
+                extra_infos[entry.doi] = extra_info
+
+        if len(doi_list) + len(batch) >= batch_size:
+            enqueue_import_job(publication_list, reviewer, kind, doi_list, extra_infos, batch)
+            jobs += 1
+            batch = []
+            extra_infos = {}
+            doi_list = []
+
+    if doi_list or batch:
+        enqueue_import_job(publication_list, reviewer, kind, doi_list, extra_infos, batch)
+        jobs += 1
+    return jobs
 
 
 class AddPublicationByDOI(LoginRequiredMixin, View):
@@ -96,28 +256,59 @@ class AddPublicationByDOI(LoginRequiredMixin, View):
             publication_list = get_object_or_404(PublicationList, id=list_id)
 
             if request.user in publication_list.mapping.reviewers.all():
-                # add by bulk
-                doi_list = re.split(' |\n|,|;', request.POST.get("doi"))
-                publications = get_publications_by_list_of_doi_list(doi_list)
-                store_publications(publications, publication_list)
+                # add by bulk, the publications are added by the import worker
+                doi_list = [doi for doi in re.split(' |\n|\r|,|;', request.POST.get("doi")) if doi]
+                enqueue_import_job(publication_list, request.user, "D", doi_list)
 
         return redirect(next_url)
 
 
 class AddPublicationByBIB(LoginRequiredMixin, View):
     def post(self, request: Any, *args: Any, **kwargs: Any) -> Any:
-        print (request.POST)
+        # the file is read chunk by chunk, large uploads are kept on disk by django
         if 'bib_text_file' in request.FILES:
-            try:
-                bib_text = request.FILES.get('bib_text_file').file.read().decode('utf-8')
-            except:
-                bib_text = None
+            bib_chunks = decode_chunks(request.FILES.get('bib_text_file').chunks())
+        elif 'bib_text' in request.POST:
+            bib_chunks = [request.POST.get('bib_text')]
         else:
-            bib_text = None if 'bib_text' not in request.POST else request.POST.get('bib_text')
-
-        if bib_text is None:
             raise BadRequest("Missing bib_text or bib_file in POST data.")
 
+        # "entries": the publications are built from the entries, "doi": the DOIs are resolved at CrossRef
+        bib_mode = request.POST.get("bib_mode", getattr(settings, "BIBTEX_IMPORT_MODE", "entries"))
+        if bib_mode not in ["entries", "doi"]:
+            raise BadRequest("Unknown bib_mode in POST data.")
+
+        if request.POST.__contains__("next"):
+            next_url = request.POST.get("next")
+        else:
+            next_url = "/dashboard"
+        if request.POST.__contains__("list_id"):
+            list_id = int(request.POST.get("list_id"))
+            publication_list = get_object_or_404(PublicationList, id=list_id)
+
+            if request.user in publication_list.mapping.reviewers.all():
+                enqueue_entries(read_bibtex(bib_chunks), publication_list, request.user, "B", bib_mode)
+        return redirect(next_url)
+
+
+class AddPublicationByFile(LoginRequiredMixin, View):
+    """
+        Imports an exported library (BibTeX, RIS, CSV or JSONL), the format is given by the extension of the file.
+    """
+
+    def post(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        if 'library_file' not in request.FILES:
+            raise BadRequest("Missing library_file in POST data.")
+
+        library_file = request.FILES.get('library_file')
+        file_format = get_format(library_file.name, request.POST.get("file_format"))
+        if file_format is None:
+            raise BadRequest("Unknown format of the library_file.")
+
+        import_mode = request.POST.get("import_mode", getattr(settings, "BIBTEX_IMPORT_MODE", "entries"))
+        if import_mode not in ["entries", "doi"]:
+            raise BadRequest("Unknown import_mode in POST data.")
+
         if request.POST.__contains__("next"):
             next_url = request.POST.get("next")
         else:
@@ -127,26 +318,8 @@ class AddPublicationByBIB(LoginRequiredMixin, View):
             publication_list = get_object_or_404(PublicationList, id=list_id)
 
             if request.user in publication_list.mapping.reviewers.all():
-                articles = bib_text.split('@')
-                compiler = re.compile(r'(?P<key>\w+) = \{(?P<value>.+)\},')
-
-                extra_infos = {}
-                doi_list = []
-                for article in articles:
-                    compiled_article = dict(compiler.findall(article))
-                    if "doi" in compiled_article:
-                        doi = compiled_article["doi"]
-                        doi_list.append(doi)
-
-                        # for other extra information add here
-                        if "abstract" in compiled_article:
-                            extra_infos[doi] = {"abstract": compiled_article['abstract']}
-
-                        if "keywords" in compiled_article:
-                            extra_infos[doi] = {"keywords_list": compiled_article['keywords'].split(',')}
-
-                publications = get_publications_by_list_of_doi_list(doi_list)
-                store_publications(publications, publication_list)
+                entries = READERS[file_format](decode_chunks(library_file.chunks()))
+                enqueue_entries(entries, publication_list, request.user, FORMAT_KINDS[file_format], import_mode)
         return redirect(next_url)
 
 
@@ -162,7 +335,9 @@ class AddPublicationsByWeb(LoginRequiredMixin, TemplateView):
         return mappings
 
     def get(self, request: Any, *args: Any, **kwargs: Any) -> Any:
-        context = super().get_context_data(**kwargs)
+        if request.GET.__contains__("query"):
+            # a page of the results, served from the stored ones
+            return self.search_on_web(request, *args, **kwargs)
 
         context = {
             **super().get_context_data(**kwargs),
@@ -174,37 +349,35 @@ class AddPublicationsByWeb(LoginRequiredMixin, TemplateView):
         return self.render_to_response(context)
 
     def search_on_web(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        data = request.POST if request.method == "POST" else request.GET
 
-        if not request.POST.__contains__("query") and not request.POST.__contains__("source"):
+        if not data.__contains__("query") or not data.getlist("source"):
             raise BadRequest("The query and/or sources are not specified")
 
-        query = request.POST.get("query").replace("\"", "\\\"")
-        source = int(request.POST.get("source"))
-        max_results = request.POST.get("max_results")
+        query = data.get("query")
+        sources = [int(source) for source in data.getlist("source")]
+        max_results = data.get("max_results", "")
+        max_results = int(max_results) if max_results.isdigit() and int(max_results) > 0 else 25
 
-        query_platform = get_object_or_404(QueryPlatform.objects.all(), id=source)
-        cleaned_params = query_platform.params.replace("%key%", f"\"{query_platform.key}\"")
-        cleaned_params = cleaned_params.replace("%query%", f"\"{query}\"")
-        cleaned_params = cleaned_params.replace("%max_results%", str(max_results))
+        query_platforms = list(QueryPlatform.objects.filter(id__in=sources))
+        if len(query_platforms) != len(set(sources)):
+            raise Http404("Query platform not found")
 
-        params = dict(json.loads(cleaned_params))
-        respond = requests.get(query_platform.url, **params)
+        page_size = getattr(settings, "WEB_SEARCH_PAGE_SIZE", 25)
+        page_number = request.GET.get("page", "1")
+        page_number = int(page_number) if page_number.isdigit() and int(page_number) > 0 else 1
 
-        if query_platform.source == "IEEEXplore":
-            parser = IEEEXploreParser()
-        elif query_platform.source == "Scopus":
-
-            parser = ScopusParser()
-
-        else:
-            # for other parsers, please add the Parser class in parser.py
-            raise NotImplemented
-        publications = parser.parse_text(respond.json())
+        # the platforms are asked concurrently, only for the results up to this page which are not stored yet,
+        # and the next page is fetched in the background
+        search_results = cached_search(
+            query_platforms, query, max_results, request.user, needed=page_number * page_size,
+            refresh=data.__contains__("refresh_search"),
+            page_size=page_size if getattr(settings, "WEB_SEARCH_PREFETCH", True) else 0,
+        )
+        publications = search_results.hits
 
         if len(publications) > 0:
-            # at this moment Scopus manages its own paginator, but we have limited it
-            paginator = Paginator(publications, len(publications))
-            page_number = request.GET.get("page")
+            paginator = Paginator(publications, page_size)
             page_obj = paginator.get_page(page_number)
         else:
             page_obj = None
@@ -213,13 +386,17 @@ class AddPublicationsByWeb(LoginRequiredMixin, TemplateView):
             **super().get_context_data(**kwargs),
             "user": request.user,
             "platforms": QueryPlatform.objects.all(),
-            "source": int(source),
+            "sources": sources,
             "page_obj": page_obj,
             "publications": publications,  # to pick from
+            "search_errors": search_results.errors,
+            "cached_at": search_results.cached_at,
+            "more_results": search_results.more,
+            "search_text": "&" + urlencode({"query": query, "source": sources, "max_results": max_results}, doseq=True),
             "desired_list": kwargs['list_id'],
             "max_results": max_results,
             "mappings": self.get_mappings(request),
-            "query": query.replace("\\\"", "\""),
+            "query": query,
             "no_review": True,
         }
 
@@ -233,24 +410,25 @@ class AddPublicationsByWeb(LoginRequiredMixin, TemplateView):
 
         doi_list = request.POST.getlist("selected_publications")
         selected_lists = request.POST.getlist("selected_lists")
-        print (selected_lists)
+
+        # the selected results are imported from what the platforms have given, as stored with the search,
+        # the DOIs which are not found there are resolved at CrossRef
+        query_text = request.POST.get("queried_text", "")
+        sources = [int(source) for source in request.POST.getlist("source_used") if source.isdigit()]
+        max_results = request.POST.get("max_results_used", "")
+        hits = []
+        if query_text and sources and max_results.isdigit():
+            hits = selected_hits(list(QueryPlatform.objects.filter(id__in=sources)), query_text, int(max_results),
+                                 doi_list)
+        entries = [asdict(hit_entry(hit)) for hit in hits]
+        found = {entry["key"] for entry in entries}
+        doi_list = [doi for doi in normalize_doi_list(doi_list) if doi not in found]
 
         for list_id in selected_lists:
             publication_list = get_object_or_404(PublicationList, id=int(list_id))
 
             if request.user in publication_list.mapping.reviewers.all():
-
-                extra_infos = {}
-                #
-                # # for other extra information add here
-                # if "abstract" in compiled_article:
-                #     extra_infos[doi] = {"abstract": compiled_article['abstract']}
-                #
-                # if "keywords" in compiled_article:
-                #     extra_infos[doi] = {"keywords_list": compiled_article['keywords'].split(',')}
-
-                publications = get_publications_by_list_of_doi_list(doi_list)
-                store_publications(publications, publication_list)
+                enqueue_import_job(publication_list, request.user, "W", doi_list, entries=entries)
         # selected_publication_ids = [int(x) for x in request.POST.getlist("selected_publications")]
         # selected_publication_lists = [int(x) for x in request.POST.getlist("selected_lists")]
         #
@@ -327,7 +505,7 @@ class AddPublicationsByWeb(LoginRequiredMixin, TemplateView):
 
     def post(self, request: Any, *args: Any, **kwargs: Any) -> Any:
         print (request.POST)
-        if request.POST.__contains__("search_on_web"):
+        if request.POST.__contains__("search_on_web") or request.POST.__contains__("refresh_search"):
             return self.search_on_web(request, *args, **kwargs)
 
         elif request.POST.__contains__("add_from_web"):
@@ -336,3 +514,16 @@ class AddPublicationsByWeb(LoginRequiredMixin, TemplateView):
         else:
             return self.get(request, *args, **kwargs)
 
+
+
+class ImportJobProgressView(LoginRequiredMixin, View):
+
+    def get(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        """
+        Reports the progress of an import, e.g. {"status": "Running", "resolved": 20, "failed": 1, "pending": 29, ...}
+        """
+        job = get_object_or_404(ImportJob, id=kwargs["job_id"])
+        if request.user not in job.publication_list.mapping.reviewers.all():
+            raise Http404("No import job found.")
+
+        return JsonResponse(job.progress())
@@ -0,0 +1,411 @@
+"""
+	Searches the query platforms (IEEE Xplore, Scopus, ...) for publications. A query can be sent to several platforms
+	at once; they are asked concurrently and their hits are merged into a single list. The results of each platform
+	are fetched page by page as they are shown, stored in `Query` and reused by the same search.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+# from external apps
+from query.models import Query
+
+# from local app
+from .bibtex import BibTeXEntry
+from .extractors import clean_title
+from .http_client import get_http_client
+from .parsers import IEEEXploreParser, Parser, ScopusParser, normalize_doi
+
+
+# the parser of the answers of each platform, by `QueryPlatform.source`
+PLATFORM_PARSERS = {
+	"IEEEXplore": IEEEXploreParser,
+	"Scopus": ScopusParser,
+}
+
+
+# the BibTeX type of the article types of the hits (see `find_article_type`)
+ENTRY_TYPES = {
+	"Journal Article": "article",
+	"Article": "article",
+	"(Whole) Book": "book",
+	"(Whole) Booklet": "booklet",
+	"Book Section": "inbook",
+	"Collection Paper": "incollection",
+	"Conference Paper": "inproceedings",
+	"(Whole) Conference Proceeding": "proceedings",
+	"Technical Manual": "manual",
+	"Master Thesis": "mastersthesis",
+	"Ph.D Thesis": "phdthesis",
+	"Technical Report": "techreport",
+	"Unpublished": "unpublished",
+	"Magazines": "Magazines",
+}
+
+
+def get_platform_parser(source: str) -> None | Parser:
+	"""
+	:param source: e.g. "Scopus", for other platforms, please add the Parser class in parsers.py and here
+	"""
+	parser_class = PLATFORM_PARSERS.get(source)
+	return parser_class() if parser_class else None
+
+
+def platform_params(query_platform: Any, query: str, max_results: int, start: int = 0) -> dict:
+	"""
+	:param query_platform: a `QueryPlatform`, its params are a JSON template with %key%, %query%, %max_results% and
+		optionally %start%
+	:param query: the query as typed by the user
+	:param start: the offset of the first asked result, 0 for the first one (see `QueryPlatform.first_index`)
+	:return: the parameters of the request, e.g. {"params": {"querytext": "...", ...}}
+	"""
+	escaped_query = query.replace("\"", "\\\"")
+	cleaned_params = query_platform.params.replace("%key%", f"\"{query_platform.key}\"")
+	cleaned_params = cleaned_params.replace("%query%", f"\"{escaped_query}\"")
+	cleaned_params = cleaned_params.replace("%max_results%", str(max_results))
+	cleaned_params = cleaned_params.replace("%start%", str(start + query_platform.first_index))
+	return dict(json.loads(cleaned_params))
+
+
+def is_paged(query_platform: Any) -> bool:
+	"""
+	:return: True if the results of the platform can be asked page by page
+	"""
+	return "%start%" in query_platform.params
+
+
+def search_platform(query_platform: Any, query: str, max_results: int, start: int = 0) \
+		-> Tuple[List[dict], None | str]:
+	"""
+	Sends the query to a single platform. It does not touch the database, so it is safe to be run in a worker thread.
+	:return: the parsed hits and the error, if the platform could not be searched
+	"""
+	parser = get_platform_parser(query_platform.source)
+	if parser is None:
+		return [], f"{query_platform.source} is not supported"
+
+	try:
+		response = get_http_client().get(
+			query_platform.url, rate_limit=query_platform.rate_limit,
+			**platform_params(query_platform, query, max_results, start))
+		return parser.parse_text(response.json()), None
+	except Exception as e:
+		print(f"cannot search {query_platform.source}: {e}")
+		return [], f"cannot search {query_platform.source}"
+
+
+def merge_hits(hits_by_platform: List[Tuple[str, List[dict]]]) -> List[dict]:
+	"""
+	Merges the hits of several platforms. Hits with the same DOI, or with the same clean title if one of them has no DOI,
+	are the same publication; the fields missing in the first hit are taken from the others.
+	:param hits_by_platform: e.g. [("IEEEXplore", [{"doi": "...", "title": "...", ...}, ...]), ("Scopus", [...])]
+	:return: the hits in the order they were found, each with its "sources" (e.g. ["IEEEXplore", "Scopus"]) and a new
+		"id" (its index)
+	"""
+	merged: Dict[str, dict] = {}
+	for source, hits in hits_by_platform:
+		for hit in hits:
+			doi = normalize_doi(hit.get("doi") or "")
+			title = hit.get("clean_title") or clean_title(hit.get("title") or "")
+			keys = [key for key in [f"doi:{doi}" if doi else "", f"title:{title}" if title else ""] if key]
+			if not keys:
+				continue
+
+			known = merged.get(f"doi:{doi}")
+			same_title = merged.get(f"title:{title}")
+			if known is None and same_title is not None and (not doi or not same_title.get("doi")):
+				# different DOIs are different publications, even with the same title (e.g. a preprint)
+				known = same_title
+
+			if known is None:
+				known = {**hit, "source": source, "sources": []}
+			else:
+				for name, value in hit.items():
+					if value and not known.get(name):
+						known[name] = value
+			if source not in known["sources"]:
+				known["sources"].append(source)
+
+			for key in keys:
+				merged.setdefault(key, known)
+
+	hits = list({id(hit): hit for hit in merged.values()}.values())
+	for i, hit in enumerate(hits):
+		hit["id"] = i
+	return hits
+
+
+def fetch_results(query_platform: Any, query: str, max_results: int, start: int, target: int) \
+		-> Tuple[List[dict], int, bool, None | str]:
+	"""
+	Asks a platform for its results page by page (`QueryPlatform.page_size` at once), from `start` until `target`.
+	The platforms which cannot be paged are asked once for all `max_results`. It does not touch the database.
+	:param start: the results fetched before
+	:param target: the results which should be fetched, at most `max_results`
+	:return: the new hits, the results fetched after this call, whether the platform has no more results, and the error
+		which stopped the fetching
+	"""
+	if not is_paged(query_platform):
+		hits, error = search_platform(query_platform, query, max_results)
+		return hits, max_results if error is None else start, error is None, error
+
+	hits = []
+	page_size = max(query_platform.page_size, 1)
+	target = min(target, max_results)
+	while start < target:
+		count = min(page_size, max_results - start)
+		page_hits, error = search_platform(query_platform, query, count, start)
+		if error:
+			return hits, start, False, error
+		hits += page_hits
+		start += count
+		if len(page_hits) < count or start >= max_results:
+			return hits, start, True, None
+	return hits, start, False, None
+
+
+def normalize_query(query: str) -> str:
+	"""
+	:return: the query without repeated and surrounding spaces, the case is kept as some platforms read "AND" and "and"
+		differently
+	"""
+	return " ".join(query.split())
+
+
+@dataclass
+class SearchResults:
+	hits: List[dict]  # see `merge_hits`
+	errors: List[str]  # of the platforms which could not be searched
+	cached_at: None | datetime  # the time of the oldest stored results which were reused
+	more: bool  # True if some platform has more results which are not fetched yet
+
+
+def stored_queries(query_platforms: List[Any], query: str, max_results: int, user: Any, refresh: bool = False) \
+		-> List[Query]:
+	"""
+	Finds (or creates) the stored search of each platform. The searches older than `WEB_SEARCH_CACHE_TIMEOUT`, and all
+	of them if `refresh` is True, are emptied to be fetched again.
+	:param user: the reviewer who searches, the owner of the newly stored searches
+	:return: the stored search of each platform, in the given order
+	"""
+	normalized_query = normalize_query(query)
+	timeout = getattr(settings, "WEB_SEARCH_CACHE_TIMEOUT", 60 * 60 * 24)
+
+	queries = {}
+	for stored_query in Query.objects.filter(
+			platform__in=query_platforms, normalized_query=normalized_query, max_results=max_results) \
+			.order_by("updated_at"):
+		# the newest one of each platform is kept
+		queries[stored_query.platform_id] = stored_query
+
+	fresh_after = timezone.now() - timedelta(seconds=timeout)
+	for query_platform in query_platforms:
+		stored_query = queries.get(query_platform.id)
+		if stored_query is None:
+			queries[query_platform.id] = Query.objects.create(
+				query=query, platform=query_platform, normalized_query=normalized_query, max_results=max_results,
+				user=user, results=[])
+		elif refresh or stored_query.updated_at < fresh_after or not stored_query.fetched:
+			stored_query.query = query
+			stored_query.results = []
+			stored_query.fetched = 0
+			stored_query.exhausted = False
+			stored_query.save()
+		stored_query = queries[query_platform.id]
+		stored_query.platform = query_platform
+	return [queries[query_platform.id] for query_platform in query_platforms]
+
+
+def extend_queries(queries: List[Query], needed: int) -> List[str]:
+	"""
+	Fetches the results of the stored searches until each of them has `needed` results (or no more). The platforms
+	are asked concurrently. A page fetched meanwhile by another request (e.g. a prefetch) is not stored twice.
+	:return: the errors of the platforms which could not be searched
+	"""
+	short_queries = [
+		stored_query for stored_query in queries
+		if not stored_query.exhausted and stored_query.fetched < min(needed, stored_query.max_results)
+	]
+	if not short_queries:
+		return []
+
+	with ThreadPoolExecutor(max_workers=len(short_queries)) as executor:
+		results = list(executor.map(
+			lambda stored_query: fetch_results(stored_query.platform, stored_query.normalized_query,
+											   stored_query.max_results, stored_query.fetched, needed),
+			short_queries))
+
+	errors = []
+	for stored_query, (hits, fetched, exhausted, error) in zip(short_queries, results):
+		if error:
+			errors.append(error)
+		if fetched == stored_query.fetched and not exhausted:
+			continue
+
+		# the results are saved only if nobody has saved others meanwhile
+		updated = Query.objects.filter(id=stored_query.id, fetched=stored_query.fetched).update(
+			results=(stored_query.results or []) + hits, fetched=fetched, exhausted=exhausted,
+			updated_at=timezone.now())
+		stored_query.refresh_from_db(fields=["results", "fetched", "exhausted", "updated_at"])
+		if not updated:
+			print(f"the results of query {stored_query.id} were fetched by another request")
+	return errors
+
+
+def prefetch_queries(queries: List[Query], needed: int) -> None:
+	"""
+	Fetches the results of the stored searches until `needed` in a background thread, e.g. the next page.
+	"""
+	query_ids = [stored_query.id for stored_query in queries]
+
+	def prefetch() -> None:
+		try:
+			# the thread reads its own copies, those of the request are not changed under it
+			extend_queries(list(Query.objects.filter(id__in=query_ids).select_related("platform")), needed)
+		except Exception as e:
+			print(f"cannot prefetch the search results: {e}")
+		finally:
+			connection.close()
+
+	threading.Thread(target=prefetch, daemon=True).start()
+
+
+def cached_search(query_platforms: List[Any], query: str, max_results: int, user: Any, needed: int,
+				  refresh: bool = False, page_size: int = 0) -> SearchResults:
+	"""
+	Searches the given platforms. The results are stored in `Query` and reused until they are older than
+	`WEB_SEARCH_CACHE_TIMEOUT`; the platforms are asked only for the results which are not stored yet, page by page.
+	:param needed: the results of each platform which should be fetched before returning, e.g. up to the shown page
+	:param refresh: when True, all stored results are dropped and the platforms are asked again
+	:param page_size: if positive, this many results after `needed` are fetched in the background (the next page)
+	:return: the merged hits of all results fetched so far
+	"""
+	max_results = int(max_results)
+	queries = stored_queries(query_platforms, query, max_results, user, refresh)
+	reused = [stored_query.updated_at for stored_query in queries if stored_query.fetched]
+
+	errors = extend_queries(queries, needed)
+	more = any(not stored_query.exhausted for stored_query in queries)
+	if more and page_size > 0 and not errors:
+		prefetch_queries(queries, needed + page_size)
+
+	hits = merge_hits([(stored_query.platform.source, stored_query.results or []) for stored_query in queries])
+	return SearchResults(hits=hits, errors=errors, cached_at=min(reused, default=None), more=more)
+
+
+def affiliation_text(affiliation: None | dict) -> str:
+	"""
+	:param affiliation: e.g. {"institute": "Charles University", "country": {"name": "Czechia"}}
+	:return: e.g. "Charles University, Czechia" (see `split_affiliation`)
+	"""
+	if not affiliation or not affiliation.get("institute"):
+		return ""
+	country = (affiliation.get("country") or {}).get("name") or ""
+	text = ", ".join(part for part in [affiliation["institute"], country] if part).replace(';', ',')
+	return " ".join(text.split())
+
+
+def hit_entry(hit: dict) -> BibTeXEntry:
+	"""
+	Converts a parsed hit of a platform to a BibTeX entry, so it is imported like the entries of a library file,
+	without asking CrossRef for what the platform has already given.
+	:param hit: see `IEEEXploreParser.parse_text`
+	"""
+	event = hit.get("event") or {}
+	entry_type = ENTRY_TYPES.get(event.get("article_type") or hit.get("article_type"), "misc")
+	authors = (hit.get("authors") or {}).get("all") or []
+	keywords = ((hit.get("author_keywords") or {}).get("all") or []) + \
+		((hit.get("index_keywords") or {}).get("all") or [])
+
+	fields = {
+		"title": hit.get("title"),
+		"author": " and ".join(
+			", ".join(name for name in [author.get("last_name"), author.get("first_name")] if name)
+			for author in authors
+		),
+		"affiliation": "; ".join(affiliation_text(author.get("affiliation")) for author in authors),
+		"booktitle" if entry_type == "inproceedings" else "journal": event.get("name"),
+		"year": hit.get("year"),
+		"doi": hit.get("doi"),
+		"abstract": hit.get("abstract"),
+		"keywords": "; ".join(keyword["name"] for keyword in keywords if keyword.get("name")),
+		"volume": event.get("volume"),
+		"number": event.get("number"),
+		"publisher": event.get("publisher"),
+	}
+	fields = {name: str(value).strip() for name, value in fields.items() if value and str(value).strip()}
+	return BibTeXEntry(entry_type=entry_type, key=normalize_doi(hit.get("doi") or ""), fields=fields)
+
+
+def retrieve_scopus_details(query_platform: Any, hits: List[dict], batch_size: int = 25) -> None:
+	"""
+	Adds the authors, the abstract and the keywords to the Scopus hits which lack an abstract. The hits are searched
+	again by their DOIs in the COMPLETE view, `batch_size` of them by one request, the requests are sent concurrently.
+	The hits which cannot be completed (e.g. the API key is not entitled to the COMPLETE view) are kept as they are.
+	"""
+	incomplete = {normalize_doi(hit["doi"]): hit for hit in hits if hit.get("doi") and not hit.get("abstract")}
+	dois = list(incomplete)
+	batches = [dois[start:start + batch_size] for start in range(0, len(dois), batch_size)]
+	if not batches:
+		return
+
+	def retrieve(batch: List[str]) -> List[dict]:
+		query = " OR ".join(f"DOI({doi})" for doi in batch)
+		try:
+			params = platform_params(query_platform, query, len(batch))
+			params.setdefault("params", {})["view"] = "COMPLETE"
+			params["params"]["start"] = 0
+			response = get_http_client().get(query_platform.url, rate_limit=query_platform.rate_limit, **params)
+			return ScopusParser().parse_text(response.json())
+		except Exception as e:
+			print(f"cannot retrieve the details of {len(batch)} Scopus results: {e}")
+			return []
+
+	with ThreadPoolExecutor(max_workers=min(len(batches), getattr(settings, "HTTP_POOL_SIZE", 10))) as executor:
+		for details in executor.map(retrieve, batches):
+			for detail in details:
+				hit = incomplete.get(normalize_doi(detail.get("doi") or ""))
+				if hit is None:
+					continue
+				for name in ["authors", "abstract", "author_keywords", "event"]:
+					if detail.get(name):
+						hit[name] = detail[name]
+
+
+# the stage which completes the hits of a platform before they are imported, by `QueryPlatform.source`
+DETAIL_RETRIEVERS = {
+	"Scopus": retrieve_scopus_details,
+}
+
+
+def selected_hits(query_platforms: List[Any], query: str, max_results: int, doi_list: List[str]) -> List[dict]:
+	"""
+	Finds the selected hits in the stored results of a search, and completes them by the `DETAIL_RETRIEVERS`.
+	:param doi_list: the DOIs of the selected hits
+	:return: the merged hits (see `merge_hits`) with one of the DOIs, those which are not stored are not returned
+	"""
+	queries = {}
+	for stored_query in Query.objects.filter(
+			platform__in=query_platforms, normalized_query=normalize_query(query), max_results=max_results) \
+			.order_by("updated_at"):
+		queries[stored_query.platform_id] = stored_query
+
+	hits = merge_hits([
+		(query_platform.source, queries[query_platform.id].results or [])
+		for query_platform in query_platforms if query_platform.id in queries
+	])
+	selected = set(normalize_doi(doi) for doi in doi_list)
+	hits = [hit for hit in hits if normalize_doi(hit.get("doi") or "") in selected]
+
+	for query_platform in query_platforms:
+		retriever = DETAIL_RETRIEVERS.get(query_platform.source)
+		if retriever is not None:
+			retriever(query_platform, [hit for hit in hits if query_platform.source in hit["sources"]])
+	return hits
@@ -4,11 +4,11 @@ from .models import QueryPlatform, Query
 
 @admin.register(Query)
 class QueryAdmin(admin.ModelAdmin):
-    list_display = ("query", "platform", "created_at")
+    list_display = ("query", "platform", "max_results", "fetched", "exhausted", "created_at", "updated_at")
     search_fields = ("query", )
 
 
 @admin.register(QueryPlatform)
 class QueryPlatformAdmin(admin.ModelAdmin):
-    list_display = ("source", "user")
+    list_display = ("source", "page_size", "rate_limit", "user")
     search_fields = ("source",)
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('query', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='query',
+            name='max_results',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='query',
+            name='normalized_query',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='query',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='query',
+            index=models.Index(fields=['platform', 'normalized_query', 'max_results'], name='query_query_platfor_fa29c4_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('query', '0002_query_max_results_query_normalized_query_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='query',
+            name='exhausted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='query',
+            name='fetched',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='queryplatform',
+            name='first_index',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='queryplatform',
+            name='page_size',
+            field=models.PositiveIntegerField(default=25),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('query', '0003_query_exhausted_query_fetched_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queryplatform',
+            name='rate_limit',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -11,12 +11,29 @@ class QueryPlatform (models.Model):
 	url = models.URLField(null=True)
 	help_link = models.URLField(null=True)
 	user = models.ForeignKey(Reviewer, on_delete=models.CASCADE)
+	# the results asked by one request, if the params have a %start% (the offset of the first result of a request)
+	page_size = models.PositiveIntegerField(default=25)
+	first_index = models.PositiveSmallIntegerField(default=0)  # the %start% of the first result, e.g. 1 for IEEE Xplore
+	# the requests per second to the platform, see `HTTP_RATE_LIMIT`; lowered automatically when the platform refuses
+	rate_limit = models.FloatField(null=True, blank=True)
 
 
 class Query(models.Model):
+	"""
+		A search sent to a query platform. Its results (the parsed hits) are kept, so the same search is answered
+		from the database until it is older than `WEB_SEARCH_CACHE_TIMEOUT` or refreshed.
+	"""
 	query = models.TextField()
+	normalized_query = models.TextField(default="")  # see `normalize_query`, the key of the stored results
+	max_results = models.PositiveIntegerField(null=True)
 	results = models.JSONField(null=True)
+	fetched = models.PositiveIntegerField(default=0)  # the results asked so far, the offset of the next request
+	exhausted = models.BooleanField(default=False)  # True if the platform has no more results (or max_results are fetched)
 	found_publications = models.ManyToManyField(Publication)
 	user = models.ForeignKey(Reviewer, on_delete=models.CASCADE)
 	platform = models.ForeignKey(QueryPlatform, on_delete=models.SET_NULL, null=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [models.Index(fields=["platform", "normalized_query", "max_results"])]